@@ -0,0 +1,50 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+"""Helpers shared by the benchmarks."""
+
+import time
+import uuid
+
+from polman.common.model import Policy, PolicyActionWebhook, PolicySpecTemplate, PolicySubjectApplication
+
+
+def make_policy(i: int, apps: int = 100) -> Policy:
+    """Build a realistic ICOS app policy. Policies are spread over `apps` app instances."""
+    app = i % apps
+    return Policy(
+        id=str(uuid.uuid4()),
+        name=f"app-{app}-policy-{i}",
+        subject=PolicySubjectApplication(appName=f"app-{app}", appInstance=f"app-{app}-instance", appComponent="*"),
+        spec=PolicySpecTemplate(templateName="app-host-cpu-usage"),
+        action=PolicyActionWebhook(url="http://job-manager/callback", httpMethod="POST"),
+        variables={"maxCpu": 0.8},
+    )
+
+
+class Timer:
+    """Context manager measuring the elapsed wall-clock time in seconds."""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.elapsed = time.perf_counter() - self.start
@@ -0,0 +1,94 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+"""End-to-end latency of PolmanRegistry.process_policy_create_request on mongodb.
+
+The rules API of Prometheus is not called: only the storage round trips are measured.
+Runs on mongomock unless --mongo-url is given. With --no-batch the storage
+unit of work is disabled, and every mutation is written as soon as it happens.
+
+Usage: PYTHONPATH=src python -m benchmarks.create_latency [--policies N] [--mongo-url URL] [--no-batch]
+"""
+
+import argparse
+import contextlib
+import json
+import statistics
+from unittest import mock
+
+import mongomock
+import pymongo
+
+from benchmarks.common import Timer
+from polman.common.config import PolmanConfig, PrometheusConfig
+from polman.common.model import PolicyActionWebhook, PolicyCreate, PolicySpecTelemetry, PolicySubjectHost
+from polman.enforcer.main import PolmanEnforcer
+from polman.meter.main import PolmanMeter
+from polman.registry.main import PolmanRegistry
+from polman.storage.backend.mongo import MongodbPolicyStore
+from polman.storage.main import PolmanStorage
+from polman.watcher.main import PolmanWatcher
+from polman.watcher.prometheus_rule_engine import PrometheusRuleEngine
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--policies", type=int, default=500)
+    parser.add_argument("--mongo-url", default="")
+    parser.add_argument("--no-batch", action="store_true")
+    args = parser.parse_args()
+
+    config = PolmanConfig(prometheus=PrometheusConfig(rules_api_url="http://prometheus"))
+    client = pymongo.MongoClient(args.mongo_url) if args.mongo_url else mongomock.MongoClient()
+    client.drop_database("polman-benchmark")
+    backend = MongodbPolicyStore(config, mongo_db_client=client, mongo_db_database_name="polman-benchmark")
+    ps = PolmanStorage(config, PolmanMeter(), backend=backend)
+    if args.no_batch:
+        ps.batch = contextlib.nullcontext  # type: ignore
+    pr = PolmanRegistry(config, ps, PolmanWatcher(config, ps, PolmanEnforcer(config)))
+
+    policy = PolicyCreate(
+        name="cpu-usage",
+        subject=PolicySubjectHost(hostId="*", agentId="agent-1"),
+        spec=PolicySpecTelemetry(expr="avg(node_cpu_seconds_total{ {{subject_label_selector}} })", violatedIf="> {{maxCpu}}"),
+        action=PolicyActionWebhook(url="http://job-manager/callback", httpMethod="POST"),
+        variables={"maxCpu": 0.8},
+    )
+
+    latencies = []
+    with mock.patch.object(PrometheusRuleEngine, "add_rule", return_value="rule.yml"):
+        for _ in range(args.policies):
+            with Timer() as t:
+                pr.process_policy_create_request(policy)
+            latencies.append(t.elapsed * 1000)
+
+    latencies.sort()
+    print(json.dumps({
+        "policies": args.policies,
+        "mongo": args.mongo_url or "mongomock",
+        "unit_of_work": not args.no_batch,
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+"""Mutation throughput of the file backend, with and without the journal.
+
+Usage: PYTHONPATH=src python -m benchmarks.file_journal [--policies N] [--mutations M]
+"""
+
+import argparse
+import json
+import tempfile
+from pathlib import Path
+
+from benchmarks.common import Timer, make_policy
+from polman.common.config import DBConfig, DBType, PolmanConfig
+from polman.common.events import PolicyEventsFactory
+from polman.common.model import PolicyPhase
+from polman.storage.backend.file import FilePolmanStorage
+
+
+def run(policies: int, mutations: int, journal: bool) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = Path(tmp) / "polman.json"
+        db_file.write_text("[]")
+        config = PolmanConfig(db=DBConfig(type=DBType.FILE, url=str(db_file), file_journal=journal))
+
+        backend = FilePolmanStorage(config)
+        ids = [backend.insert(make_policy(i)).id for i in range(policies)]
+
+        with Timer() as t:
+            for i in range(mutations):
+                pid = ids[i % len(ids)]
+                backend.add_policy_event(pid, PolicyEventsFactory.policy_resolved())
+                backend.set_policy_phase(pid, PolicyPhase.Enforced)
+
+        with Timer() as startup:
+            FilePolmanStorage(config)
+
+    return {
+        "backend": "file+journal" if journal else "file",
+        "policies": policies,
+        "mutations": mutations * 2,
+        "seconds": round(t.elapsed, 4),
+        "mutations_per_second": round(mutations * 2 / t.elapsed, 1),
+        "startup_seconds": round(startup.elapsed, 4),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--policies", type=int, default=1000)
+    parser.add_argument("--mutations", type=int, default=200)
+    args = parser.parse_args()
+
+    results = [run(args.policies, args.mutations, journal) for journal in (False, True)]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
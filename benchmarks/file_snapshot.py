@@ -0,0 +1,122 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+"""Startup and flush times of the file backend with each snapshot encoding.
+
+Every policy carries `--events` events. `decode_seconds` is the time to read and
+validate the policies, `startup_seconds` is the time to build the in-memory store,
+which validates the policies lazily (see `benchmarks.lazy_startup`).
+Encodings whose optional packages are not installed are reported as unavailable.
+
+`json (per object)` is the json snapshot read with a Policy.model_validate() and
+written with a model_dump() for each policy, as it was before the snapshot module.
+
+Usage: PYTHONPATH=src python -m benchmarks.file_snapshot [--policies N] [--events E]
+"""
+
+import argparse
+import json
+import tempfile
+from pathlib import Path
+
+from benchmarks.common import Timer, make_policy
+from polman.common.config import DBConfig, DBType, PolmanConfig, SnapshotFormat
+from polman.common.errors import PolmanError
+from polman.common.events import PolicyEventsFactory
+from polman.common.model import Policy
+from polman.storage.backend.file import FilePolmanStorage
+from polman.storage.backend.snapshot import decode
+
+ENCODINGS = [(fmt, zstd) for zstd in (False, True) for fmt in SnapshotFormat]
+
+
+def populate(config: PolmanConfig, policies: int, events: int) -> None:
+    backend = FilePolmanStorage(config)
+    with backend.batch():
+        for i in range(policies):
+            p = make_policy(i)
+            p.status.events = [PolicyEventsFactory.policy_created()] + [
+                PolicyEventsFactory.policy_rendered(p.spec) for _ in range(events - 1)
+            ]
+            backend.insert(p)
+
+
+def run(fmt: SnapshotFormat, zstd: bool, source: Path, repeat: int) -> dict:
+    name = fmt.value + ("+zstd" if zstd else "")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = Path(tmp) / "polman.db"
+        db_file.write_bytes(source.read_bytes())
+        config = PolmanConfig(db=DBConfig(type=DBType.FILE, url=str(db_file), file_format=fmt, file_zstd=zstd))
+        try:
+            # the first start migrates the json snapshot
+            backend = FilePolmanStorage(config)
+        except PolmanError as ex:
+            return {"encoding": name, "unavailable": str(ex)}
+
+        with Timer() as decoding:
+            for _ in range(repeat):
+                decode(db_file.read_bytes())
+        with Timer() as startup:
+            for _ in range(repeat):
+                backend = FilePolmanStorage(config)
+        with Timer() as flush:
+            for _ in range(repeat):
+                backend._write_to_file()
+
+        return {
+            "encoding": name,
+            "decode_seconds": round(decoding.elapsed / repeat, 4),
+            "startup_seconds": round(startup.elapsed / repeat, 4),
+            "flush_seconds": round(flush.elapsed / repeat, 4),
+            "size_kb": round(db_file.stat().st_size / 1024),
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--policies", type=int, default=10000)
+    parser.add_argument("--events", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / "source.json"
+        source.write_text("[]")
+        populate(PolmanConfig(db=DBConfig(type=DBType.FILE, url=str(source))), args.policies, args.events)
+
+        with Timer() as per_object:
+            for _ in range(args.repeat):
+                [Policy.model_validate(o) for o in json.loads(source.read_bytes())]
+        backend = FilePolmanStorage(PolmanConfig(db=DBConfig(type=DBType.FILE, url=str(source))))
+        with Timer() as per_object_flush:
+            for _ in range(args.repeat):
+                json.dumps([backend._dump(p) for p in backend.list()]).encode()
+        results = [{
+            "encoding": "json (per object)",
+            "decode_seconds": round(per_object.elapsed / args.repeat, 4),
+            "flush_seconds": round(per_object_flush.elapsed / args.repeat, 4),
+        }]
+        results += [run(fmt, zstd, source, args.repeat) for fmt, zstd in ENCODINGS]
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+"""Cold start of the file backend with lazily validated policies.
+
+`startup_seconds` is the time from reading the snapshot to the meter being seeded
+from the summaries of the policies, as in `PolmanApp.startup_reconciliation`.
+`first_get_seconds` is the time to load one policy afterwards, `list_seconds` the
+time to load all of them. `eager` validates every policy at startup, as the file
+backend did before the policies were loaded lazily.
+
+The meter logs warnings about its instruments being created again: they can be ignored.
+
+Usage: PYTHONPATH=src python -m benchmarks.lazy_startup [--policies N] [--events E]
+"""
+
+import argparse
+import json
+import tempfile
+from pathlib import Path
+
+from benchmarks.common import Timer, make_policy
+from polman.common.config import DBConfig, DBType, PolmanConfig, SnapshotFormat
+from polman.common.events import PolicyEventsFactory
+from polman.meter.main import PolmanMeter
+from polman.storage.backend.file import FilePolmanStorage
+from polman.storage.main import PolmanStorage
+
+
+def populate(config: PolmanConfig, policies: int, events: int) -> list[str]:
+    backend = FilePolmanStorage(config)
+    with backend.batch():
+        for i in range(policies):
+            p = make_policy(i)
+            p.status.events = [PolicyEventsFactory.policy_created()] + [
+                PolicyEventsFactory.policy_rendered(p.spec) for _ in range(events - 1)
+            ]
+            backend.insert(p)
+    return [p.id for p in backend.list()]
+
+
+def run(config: PolmanConfig, policy_id: str, eager: bool) -> dict:
+    meter = PolmanMeter()
+    with Timer() as startup:
+        backend = FilePolmanStorage(config)
+        if eager:
+            backend.list()
+        for s in PolmanStorage(config, meter, backend=backend).list_summaries():
+            meter.set_summary_enforced(s)
+    with Timer() as first_get:
+        backend.get(policy_id)
+    with Timer() as listing:
+        backend.list()
+
+    return {
+        "mode": "eager" if eager else "lazy",
+        "startup_seconds": round(startup.elapsed, 4),
+        "first_get_seconds": round(first_get.elapsed, 6),
+        "list_seconds": round(listing.elapsed, 4),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--policies", type=int, default=100000)
+    parser.add_argument("--events", type=int, default=3)
+    parser.add_argument("--format", type=SnapshotFormat, default=SnapshotFormat.JSON, choices=list(SnapshotFormat))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = Path(tmp) / "polman.db"
+        db_file.write_text("[]")
+        config = PolmanConfig(db=DBConfig(type=DBType.FILE, url=str(db_file), file_format=args.format))
+        ids = populate(config, args.policies, args.events)
+        results = [run(config, ids[len(ids) // 2], eager) for eager in (True, False)]
+
+    print(json.dumps({"policies": args.policies, "format": args.format.value, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
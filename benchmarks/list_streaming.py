@@ -0,0 +1,88 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+"""Listing all the policies at once vs streaming them page by page (sqlite backend).
+
+Reports the time and the peak memory allocated (tracemalloc) to read every policy
+as a `PolicyRead`, as `GET /policies/?detail=true` does, with `list()` and with
+`iter_policies()`.
+
+Usage: PYTHONPATH=src python -m benchmarks.list_streaming [--policies N] [--page-size P]
+"""
+
+import argparse
+import datetime
+import json
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+from benchmarks.common import Timer, make_policy
+from polman.common.config import DBConfig, DBType, PolmanConfig
+from polman.common.model import PolicyRead
+from polman.meter.main import PolmanMeter
+from polman.storage.backend.main import Page
+from polman.storage.main import PolmanStorage
+
+
+def measure(fn) -> dict:
+    tracemalloc.start()
+    try:
+        with Timer() as t:
+            count = fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"policies": count, "seconds": round(t.elapsed, 4), "peak_mb": round(peak / 2**20, 2)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--policies", type=int, default=20000)
+    parser.add_argument("--page-size", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = PolmanConfig(db=DBConfig(type=DBType.SQLITE, url=str(Path(tmp) / "polman.db")))
+        ps = PolmanStorage(config, PolmanMeter())
+        start = datetime.datetime(2024, 1, 1)
+        with ps._backend.batch():
+            for i in range(args.policies):
+                p = make_policy(i)
+                p.status.createdAt = start + datetime.timedelta(seconds=i)
+                ps._backend.insert(p)
+
+        def _list() -> int:
+            return len([PolicyRead(**p.model_dump()) for p in ps.list()])
+
+        def _stream() -> int:
+            count = 0
+            for p in ps.iter_policies(page=Page(limit=args.page_size)):
+                PolicyRead(**p.model_dump())
+                count += 1
+            return count
+
+        results = {"list": measure(_list), "stream": measure(_stream)}
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
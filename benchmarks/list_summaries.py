@@ -0,0 +1,69 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+"""Full vs summary list reads on the mongodb backend (mongomock).
+
+Every policy carries `--events` events, as long-lived policies that are re-rendered
+or violated and resolved many times do.
+
+Usage: PYTHONPATH=src python -m benchmarks.list_summaries [--policies N] [--events E]
+"""
+
+import argparse
+import json
+
+import mongomock
+
+from benchmarks.common import Timer, make_policy
+from polman.common.events import PolicyEventsFactory
+from polman.storage.backend.mongo import MongodbPolicyStore
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--policies", type=int, default=2000)
+    parser.add_argument("--events", type=int, default=50)
+    args = parser.parse_args()
+
+    backend = MongodbPolicyStore(None, mongo_db_client=mongomock.MongoClient(), mongo_db_database_name="bench")
+    for i in range(args.policies):
+        p = make_policy(i)
+        p.status.events = [PolicyEventsFactory.policy_created()] + [
+            PolicyEventsFactory.policy_rendered(p.spec) for _ in range(args.events - 1)
+        ]
+        backend.insert(p)
+
+    results = {"policies": args.policies, "events": args.events}
+
+    with Timer() as t:
+        full = backend.list()
+    results["full_seconds"] = round(t.elapsed, 4)
+    results["full_bytes"] = sum(len(p.model_dump_json()) for p in full)
+
+    with Timer() as t:
+        summaries = backend.list_summaries()
+    results["summary_seconds"] = round(t.elapsed, 4)
+    results["summary_bytes"] = sum(len(s.model_dump_json()) for s in summaries)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
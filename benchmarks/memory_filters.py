@@ -0,0 +1,67 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+"""App lifecycle lookups on the in-memory backend.
+
+Compares the lookup done by the ICOS app lifecycle handlers (indexed fields)
+with the same lookup on a field without index (full scan).
+
+Usage: PYTHONPATH=src python -m benchmarks.memory_filters [--policies N] [--lookups M]
+"""
+
+import argparse
+import json
+
+from benchmarks.common import Timer, make_policy
+from polman.storage.backend.memory import InMemoryPolmanStorage
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--policies", type=int, default=100_000)
+    parser.add_argument("--apps", type=int, default=1000)
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args()
+
+    backend = InMemoryPolmanStorage(None)
+    with Timer() as insert:
+        for i in range(args.policies):
+            backend.insert(make_policy(i, apps=args.apps))
+
+    results = {"policies": args.policies, "apps": args.apps, "insert_seconds": round(insert.elapsed, 4)}
+
+    queries = {
+        # the query shape of registry/icos/app_lifecycle.py
+        "indexed": lambda app: {"subject.type": "app", "subject.appInstance": f"app-{app}-instance"},
+        # same result set, but subject.appName has no index
+        "scan": lambda app: {"subject.appName": f"app-{app}"},
+    }
+    for name, query in queries.items():
+        with Timer() as t:
+            for i in range(args.lookups):
+                found = backend.list(filters=query(i % args.apps))
+        assert len(found) == args.policies // args.apps
+        results[f"{name}_lookup_ms"] = round(t.elapsed / args.lookups * 1000, 4)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+"""Validation of policy payloads with discriminated and plain unions.
+
+`plain` validates the subjects, specs and app descriptor policies with the plain
+unions used before, which try each model in turn, `discriminated` with the unions
+discriminated by `type` now used by the models. The payloads are policy create
+requests with app, host and custom subjects (the custom ones, last in the plain
+union, are the slowest), and an ICOS app descriptor.
+
+Usage: PYTHONPATH=src python -m benchmarks.model_validation [--repeat N]
+"""
+
+import argparse
+import json
+from typing import List, Optional, Union
+
+from pydantic import TypeAdapter, create_model
+
+from benchmarks.common import Timer
+from polman.common.model import (
+    PolicyCreate, PolicySpecConstraints, PolicySpecTelemetry, PolicySpecTemplate, PolicySubjectApplication,
+    PolicySubjectCustom, PolicySubjectHost,
+)
+from polman.registry.icos.models import (
+    ICOSAppDescriptor, ICOSAppDescriptorComponent, ICOSAppDescriptorPolicy, NoPolmanPolicy,
+)
+
+PlainSubject = Union[PolicySubjectApplication, PolicySubjectHost, PolicySubjectCustom]
+PlainSpec = Union[PolicySpecTemplate, PolicySpecTelemetry, PolicySpecConstraints]
+PlainPolicyCreate = create_model("PlainPolicyCreate", __base__=PolicyCreate, subject=(PlainSubject, ...), spec=(PlainSpec, ...))
+PlainComponent = create_model(
+    "PlainComponent", __base__=ICOSAppDescriptorComponent,
+    policies=(Optional[List[Union[ICOSAppDescriptorPolicy, NoPolmanPolicy]]], []),
+)
+PlainAppDescriptor = create_model(
+    "PlainAppDescriptor", __base__=ICOSAppDescriptor,
+    components=(List[PlainComponent], []), policies=(List[Union[ICOSAppDescriptorPolicy, NoPolmanPolicy]], []),
+)
+
+ACTION = {"type": "webhook", "url": "http://job-manager/callback", "httpMethod": "POST"}
+SPEC_TEMPLATE = {"templateName": "app-host-cpu-usage"}
+SPEC_TELEMETRY = {"expr": "avg(node_cpu_usage{icos_host_id=\"h\"})", "violatedIf": "> 0.8", "thresholds": {"warning": 0.7}}
+
+PAYLOADS = {
+    "app": {"name": "app", "subject": {"appName": "a", "appInstance": "a-1", "appComponent": "c"},
+            "spec": SPEC_TEMPLATE, "action": ACTION, "variables": {"maxCpu": 0.8}},
+    "host": {"name": "host", "subject": {"type": "host", "hostId": "h", "agentId": "ag"},
+             "spec": SPEC_TELEMETRY, "action": ACTION},
+    "custom": {"name": "custom", "subject": {"type": "custom", "cluster": "c1", "namespace": "ns"},
+               "spec": {"type": "constraints", "constraints": {"cpu": "4"}}, "action": ACTION},
+}
+
+APP_DESCRIPTOR = {
+    "name": "app",
+    "description": "an app with a policy of each kind",
+    "components": [{"name": f"c{i}", "type": "kubernetes", "policies": [{"security": "high"}]} for i in range(5)],
+    "policies": [
+        {"name": "user-preference", "type": "user-preference", "performance": 0.5, "security": 0.2},
+        {"name": "security", "type": "security", "threshold": 50, "apply-to": "c0"},
+        {"name": "cpu", "fromTemplate": "app-host-cpu-usage", "variables": {"maxCpu": 0.8}},
+        {"name": "custom", "spec": SPEC_TELEMETRY},
+    ],
+}
+
+
+def per_call_us(adapter: TypeAdapter, payload: dict, repeat: int) -> float:
+    with Timer() as t:
+        for _ in range(repeat):
+            adapter.validate_python(payload)
+    return round(t.elapsed / repeat * 1e6, 2)
+
+
+def compare(plain: type, discriminated: type, payload: dict, repeat: int) -> dict:
+    plain_us = per_call_us(TypeAdapter(plain), payload, repeat)
+    discriminated_us = per_call_us(TypeAdapter(discriminated), payload, repeat)
+    return {"plain_us": plain_us, "discriminated_us": discriminated_us, "speedup": round(plain_us / discriminated_us, 2)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+
+    results = {f"policy_create_{name}": compare(PlainPolicyCreate, PolicyCreate, payload, args.repeat)
+               for name, payload in PAYLOADS.items()}
+    results["app_descriptor"] = compare(PlainAppDescriptor, ICOSAppDescriptor, APP_DESCRIPTOR, args.repeat // 10)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
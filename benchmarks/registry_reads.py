@@ -0,0 +1,124 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+"""The registry reads with and without the trusted conversions of stored policies.
+
+`before` converts every policy read from the storage with a model_dump() and a
+validation, as the registry did (`PolicyRead(**policy.model_dump())`), `after`
+with `PolicyRead.from_policy()`. Both are measured per request on the in-memory
+and mongodb (mongomock) backends: reading a policy by id, and listing all of them.
+
+The other conversions are measured per policy: the working copy of a policy in a
+unit of work (a deep copy before, `copy_policy()` after), and the validation of a
+mongodb document (through `PolicyDB` before, `policy_from_document()` after).
+
+Usage: PYTHONPATH=src python -m benchmarks.registry_reads [--policies N] [--events E]
+"""
+
+import argparse
+import json
+from unittest import mock
+
+import mongomock
+
+from benchmarks.common import Timer, make_policy
+from polman.common.config import PolmanConfig
+from polman.common.events import PolicyEventsFactory
+from polman.common.model import Policy, PolicyRead
+from polman.meter.main import PolmanMeter
+from polman.registry.main import PolmanRegistry
+from polman.storage.backend.main import copy_policy
+from polman.storage.backend.memory import InMemoryPolmanStorage
+from polman.storage.backend.mongo import MongodbPolicyStore, PolicyDB, policy_from_document
+from polman.storage.main import PolmanStorage
+
+
+def _dump_and_validate(cls, policy: Policy) -> PolicyRead:
+    return cls(**policy.model_dump())
+
+
+def per_call_us(fn, repeat: int) -> float:
+    with Timer() as t:
+        for _ in range(repeat):
+            fn()
+    return round(t.elapsed / repeat * 1e6, 2)
+
+
+def compare(before, after, repeat: int) -> dict:
+    return _result(per_call_us(before, repeat), per_call_us(after, repeat))
+
+
+def _result(before_us: float, after_us: float) -> dict:
+    return {"before_us": before_us, "after_us": after_us, "speedup": round(before_us / after_us, 1)}
+
+
+def registry_requests(registry: PolmanRegistry, policy_id: str, repeat: int) -> dict:
+    def _get():
+        registry.get_policy_by_id(policy_id)
+
+    def _list():
+        registry.find_policies()
+
+    results = {}
+    for name, fn, n in (("get_policy_by_id", _get, repeat), ("find_policies", _list, max(1, repeat // 100))):
+        with mock.patch.object(PolicyRead, "from_policy", classmethod(_dump_and_validate)):
+            before_us = per_call_us(fn, n)
+        results[name] = _result(before_us, per_call_us(fn, n))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--policies", type=int, default=500)
+    parser.add_argument("--events", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    policies = []
+    for i in range(args.policies):
+        p = make_policy(i)
+        p.status.events = [PolicyEventsFactory.policy_created()] + [
+            PolicyEventsFactory.policy_rendered(p.spec) for _ in range(args.events - 1)
+        ]
+        policies.append(p)
+
+    config = PolmanConfig()
+    memory = InMemoryPolmanStorage(config)
+    mongo = MongodbPolicyStore(None, mongo_db_client=mongomock.MongoClient(), mongo_db_database_name="bench")
+    results: dict = {"policies": args.policies, "events": args.events}
+    for name, backend in (("inmemory", memory), ("mongodb", mongo)):
+        ids = [backend.insert(p.model_copy(deep=True)).id for p in policies]
+        registry = PolmanRegistry(config, PolmanStorage(config, PolmanMeter(), backend=backend), None)
+        results[name] = registry_requests(registry, ids[0], args.repeat)
+
+    policy = memory.list()[0]
+    doc = policy.model_dump(exclude={"id"}) | {"_id": mongomock.ObjectId()}
+    results["working_copy"] = compare(lambda: policy.model_copy(deep=True), lambda: copy_policy(policy), args.repeat)
+    results["mongodb_document"] = compare(
+        lambda: Policy(**PolicyDB(**(doc | {"id": doc["_id"]})).model_dump()),
+        lambda: policy_from_document(dict(doc)),
+        args.repeat,
+    )
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+"""Rendering of the policies of an ICOS app descriptor.
+
+The app descriptor has `--policies` policies spread over its components: most from
+the catalog templates, the others with a telemetry spec of their own. `uncached`
+compiles the template of each policy with a new jinja2 environment, as done before,
+`cached` uses the compiled templates cache, and `test_rendering` measures the check
+done before setting a variable.
+
+Usage: PYTHONPATH=src python -m benchmarks.spec_rendering [--policies N] [--repeat N]
+"""
+
+import argparse
+import json
+from unittest import mock
+
+from jinja2 import BaseLoader, Environment, StrictUndefined
+
+from benchmarks.common import Timer
+from polman.common.model import PolicyActionWebhook
+from polman.common.templating import template_cache_info
+from polman.registry.icos.models import ICOSAppDescriptor
+from polman.registry.icos.process_app_descriptor import process_app_descriptor
+from polman.registry.render import render_policy_spec, test_spec_rendering
+
+COMPONENT_POLICIES = [
+    {"fromTemplate": "app-host-cpu-usage", "variables": {"maxCpu": 0.8}},
+    {"security": "high"},
+    {"spec": {"expr": "avg(container_memory_usage_bytes{ {{subject_label_selector}} })", "violatedIf": "> {{maxMemory}}"},
+     "variables": {"maxMemory": 1e9}},
+    {"fromTemplate": "compss-under-allocation", "variables": {"compssTask": "task", "thresholdTimeSeconds": 120}},
+]
+
+
+def app_descriptor(policies: int) -> ICOSAppDescriptor:
+    per_component = len(COMPONENT_POLICIES)
+    return ICOSAppDescriptor.model_validate({
+        "name": "app",
+        "description": "an app with many policies",
+        "components": [
+            {"name": f"c{c}", "type": "kubernetes", "policies": COMPONENT_POLICIES}
+            for c in range(policies // per_component)
+        ],
+    })
+
+
+def _uncached(source: str, strict: bool = True):
+    environment = Environment(loader=BaseLoader(), undefined=StrictUndefined) if strict else Environment(loader=BaseLoader())
+    return environment.from_string(source)
+
+
+def per_descriptor_ms(policies: list, render, repeat: int) -> float:
+    with Timer() as t:
+        for _ in range(repeat):
+            for p in policies:
+                render(p)
+    return round(t.elapsed / repeat * 1e3, 3)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--policies", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    action = PolicyActionWebhook(url="http://job-manager/callback", httpMethod="POST")
+    policies = process_app_descriptor(app_descriptor(args.policies), "app-1", action)
+
+    with mock.patch("polman.registry.render.compile_template", _uncached):
+        uncached_ms = per_descriptor_ms(policies, render_policy_spec, args.repeat)
+        uncached_test_ms = per_descriptor_ms(policies, test_spec_rendering, args.repeat)
+    cached_ms = per_descriptor_ms(policies, render_policy_spec, args.repeat)
+    cached_test_ms = per_descriptor_ms(policies, test_spec_rendering, args.repeat)
+
+    print(json.dumps({
+        "policies": len(policies),
+        "render": {"uncached_ms": uncached_ms, "cached_ms": cached_ms, "speedup": round(uncached_ms / cached_ms, 1)},
+        "test_rendering": {
+            "uncached_ms": uncached_test_ms, "cached_ms": cached_test_ms,
+            "speedup": round(uncached_test_ms / cached_test_ms, 1),
+        },
+        "cache": template_cache_info(),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
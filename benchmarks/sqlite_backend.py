@@ -0,0 +1,105 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+
+"""The sqlite backend compared with the file and in-memory backends.
+
+Measures inserts, mutations (an event and a phase change, as for an alert), reads
+by id, the app lifecycle lookup and the startup time on an existing store.
+
+Usage: PYTHONPATH=src python -m benchmarks.sqlite_backend [--policies N] [--mutations M]
+"""
+
+import argparse
+import json
+import tempfile
+from pathlib import Path
+
+from benchmarks.common import Timer, make_policy
+from polman.common.config import DBConfig, DBType, PolmanConfig
+from polman.common.events import PolicyEventsFactory
+from polman.common.model import PolicyPhase
+from polman.storage.backend.file import FilePolmanStorage
+from polman.storage.backend.memory import InMemoryPolmanStorage
+from polman.storage.backend.sqlite import SqlitePolmanStorage
+
+BACKENDS = {
+    "inmemory": (DBType.IN_MEMORY, InMemoryPolmanStorage),
+    "file": (DBType.FILE, FilePolmanStorage),
+    "file+journal": (DBType.FILE, FilePolmanStorage),
+    "sqlite": (DBType.SQLITE, SqlitePolmanStorage),
+}
+
+
+def run(name: str, policies: int, mutations: int, apps: int) -> dict:
+    db_type, backend_class = BACKENDS[name]
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = Path(tmp) / "polman.db"
+        db_file.write_text("" if db_type is DBType.SQLITE else "[]")
+        config = PolmanConfig(db=DBConfig(type=db_type, url=str(db_file), file_journal=name == "file+journal"))
+
+        backend = backend_class(config)
+        with Timer() as insert:
+            ids = [backend.insert(make_policy(i, apps=apps)).id for i in range(policies)]
+
+        with Timer() as mutate:
+            for i in range(mutations):
+                pid = ids[i % len(ids)]
+                backend.add_policy_event(pid, PolicyEventsFactory.policy_resolved())
+                backend.set_policy_phase(pid, PolicyPhase.Enforced)
+
+        with Timer() as get:
+            for i in range(mutations):
+                backend.get(ids[i % len(ids)])
+
+        with Timer() as lookup:
+            for i in range(mutations):
+                found = backend.list({"subject.type": "app", "subject.appInstance": f"app-{i % apps}-instance"})
+        assert len(found) == policies // apps
+
+        backend.flush()
+        with Timer() as startup:
+            if db_type is not DBType.IN_MEMORY:
+                backend_class(config)
+
+    return {
+        "backend": name,
+        "policies": policies,
+        "insert_ms": round(insert.elapsed / policies * 1000, 4),
+        "mutation_ms": round(mutate.elapsed / (mutations * 2) * 1000, 4),
+        "get_ms": round(get.elapsed / mutations * 1000, 4),
+        "app_lookup_ms": round(lookup.elapsed / mutations * 1000, 4),
+        "startup_seconds": round(startup.elapsed, 4),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--policies", type=int, default=1000)
+    parser.add_argument("--apps", type=int, default=100)
+    parser.add_argument("--mutations", type=int, default=200)
+    args = parser.parse_args()
+
+    results = [run(name, args.policies, args.mutations, args.apps) for name in BACKENDS]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+"""Benchmark suite of the storage backends, through the `PolmanStorage` API.
+
+For each backend, in a separate process:
+
+- `insert`: inserts `--policies` policies, spread over `--apps` app instances;
+- `event`: appends `--events` events to the policies, at most `--event-rate`
+  events per second (0: as fast as possible);
+- `list`: lists the policies of an app instance, `--lists` times;
+- `lifecycle`: activates and then deactivates the policies of each app instance,
+  as the app lifecycle events do: a phase change and an event for all of them,
+  in a single batch.
+
+Each operation is reported with its throughput (operations per second, including
+the throttling of the events) and its p50/p99 latency in milliseconds, each backend
+with the peak RSS of its process. mongodb runs on mongomock unless `--mongo-url`
+points to a mongod, so that the suite runs offline.
+
+Usage: PYTHONPATH=src python -m benchmarks.storage_suite [--policies N] [--backends inmemory,sqlite]
+"""
+
+import argparse
+import json
+import multiprocessing
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from benchmarks.common import Timer, make_policy
+from polman.common.config import DBConfig, DBType, PolmanConfig
+from polman.common.events import PolicyEventsFactory
+from polman.common.model import PolicyPhase
+
+BACKENDS = ["inmemory", "file", "file+journal", "sqlite", "mongodb"]
+
+
+class Recorder(Timer):
+    """Collects the latencies of an operation, timing all of them as a `Timer`."""
+
+    def __init__(self) -> None:
+        self.latencies: list[float] = []
+
+    def time(self, fn, *args, **kwargs):
+        start = time.perf_counter()
+        res = fn(*args, **kwargs)
+        self.latencies.append(time.perf_counter() - start)
+        return res
+
+    def report(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(q: float) -> float:
+            return round(latencies[int(q * (len(latencies) - 1))] * 1000, 4)
+
+        return {
+            "count": len(latencies),
+            "throughput_ops": round(len(latencies) / self.elapsed, 1),
+            "p50_ms": percentile(0.5),
+            "p99_ms": percentile(0.99),
+        }
+
+
+def make_storage(name: str, tmp: str, mongo_url: str | None):
+    from polman.meter.main import PolmanMeter
+    from polman.storage.main import PolmanStorage
+
+    db_file = Path(tmp) / "polman.db"
+    if name == "mongodb":
+        import mongomock
+        import pymongo
+
+        from polman.storage.backend.mongo import MongodbPolicyStore
+
+        client = pymongo.MongoClient(mongo_url) if mongo_url else mongomock.MongoClient()
+        # a database of its own, dropped at the end
+        client.drop_database("polman-benchmark")
+        backend = MongodbPolicyStore(None, mongo_db_client=client, mongo_db_database_name="polman-benchmark")
+        return PolmanStorage(PolmanConfig(), PolmanMeter(), backend=backend), client
+
+    db_type = {"inmemory": DBType.IN_MEMORY, "sqlite": DBType.SQLITE}.get(name, DBType.FILE)
+    db_file.write_text("" if db_type is DBType.SQLITE else "[]")
+    config = PolmanConfig(db=DBConfig(type=db_type, url=str(db_file), file_journal=name == "file+journal"))
+    return PolmanStorage(config, PolmanMeter()), None
+
+
+def run(name: str, args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        ps, client = make_storage(name, tmp, args.mongo_url)
+
+        with Recorder() as insert:
+            policies = [insert.time(ps.insert, make_policy(i, apps=args.apps)) for i in range(args.policies)]
+
+        with Recorder() as event:
+            for i in range(args.events):
+                if args.event_rate:
+                    # the events are scheduled at a fixed rate: a slow write delays the next ones only
+                    time.sleep(max(0.0, event.start + i / args.event_rate - time.perf_counter()))
+                event.time(ps.add_policy_event, policies[i % len(policies)], PolicyEventsFactory.policy_resolved())
+
+        with Recorder() as listing:
+            for i in range(args.lists):
+                app = i % args.apps
+                listing.time(ps.list, {"subject.type": "app", "subject.appInstance": f"app-{app}-instance"})
+
+        def _transition(app: int, phase: PolicyPhase, event_factory) -> None:
+            with ps.batch():
+                found = ps.list({"subject.type": "app", "subject.appInstance": f"app-{app}-instance"})
+                ps.set_phase_many(found, phase)
+                ps.add_event_many(found, event_factory())
+
+        with Recorder() as lifecycle:
+            for app in range(args.apps):
+                lifecycle.time(_transition, app, PolicyPhase.Enforced, PolicyEventsFactory.policy_activated)
+                lifecycle.time(_transition, app, PolicyPhase.Inactive, PolicyEventsFactory.policy_deactivated)
+
+        ps.flush()
+        if client is not None:
+            client.drop_database("polman-benchmark")
+
+    return {
+        "backend": name,
+        # kilobytes on linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "insert": insert.report(),
+        "event": event.report(),
+        "list": listing.report(),
+        "lifecycle": lifecycle.report(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="comma separated, among: " + ", ".join(BACKENDS))
+    parser.add_argument("--policies", type=int, default=1000)
+    parser.add_argument("--apps", type=int, default=50)
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--event-rate", type=float, default=0, help="events per second, 0 for no limit")
+    parser.add_argument("--lists", type=int, default=200)
+    parser.add_argument("--mongo-url", help="a mongod to use instead of mongomock, e.g. mongodb://localhost:27017")
+    args = parser.parse_args()
+
+    names = args.backends.split(",")
+    for name in names:
+        if name not in BACKENDS:
+            parser.error(f"unknown backend {name}")
+
+    results = []
+    # a fresh process for each backend: the peak RSS is not shared with the others
+    spawn = multiprocessing.get_context("spawn")
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+            results.append(executor.submit(run, name, args).result())
+
+    options = {k: v for k, v in vars(args).items() if k not in ("backends", "mongo_url")}
+    print(json.dumps({"options": options, "mongodb": "mongod" if args.mongo_url else "mongomock", "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -28,9 +28,10 @@ import rich
 from fastapi.openapi.utils import get_openapi
 
 from polman.cli.utils import click_params_to_config, model_to_click_options
-from polman.common.config import PolmanConfig
+from polman.common.config import DBType, PolmanConfig
 from polman.common.logging import init_logging, log_object
 from polman.main import PolmanApp, get_polman_version
+from polman.storage.backend.mongo import POLICY_QUERY_SHAPES, MongodbPolicyStore, winning_plan_stages
 
 logger = logging.getLogger(__name__)
 
@@ -83,7 +84,30 @@ def dump_openapi(ctx, output, **kwargs):
         rich.print(schema)
 
 
+@click.command()
+@click.option("--output", "-o", default="text", type=click.Choice(["text", "json"]))
+@click.pass_context
+def explain_queries(ctx, output, **kwargs):
+    """Print the mongodb query plan of the queries issued by Polman."""
+    config = ctx.obj["parsed_config"]
+    if config.db.type is not DBType.MONGODB:
+        raise click.UsageError("explain-queries requires --db-type mongodb")
+
+    plans = MongodbPolicyStore(config).explain_queries()
+
+    if output == "json":
+        print(json.dumps(plans, default=str, indent=2))
+        return
+
+    for name, explain in plans.items():
+        stages = winning_plan_stages(explain)
+        scan = "COLLSCAN" in stages
+        rich.print(f"[bold]{name}[/bold]: {POLICY_QUERY_SHAPES[name]}")
+        rich.print(f"  {'[red]' if scan else '[green]'}{' <- '.join(stages)}")
+
+
 cli.add_command(app)
 cli.add_command(print_config)
 cli.add_command(version)
 cli.add_command(dump_openapi)
+cli.add_command(explain_queries)
@@ -23,6 +23,7 @@ from typing import Annotated
 
 import jose
 from fastapi import Depends, Header, HTTPException, Request, status
+from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 from fastapi.security import SecurityScopes
@@ -161,7 +162,8 @@ async def get_authorized_user(
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     exc_str = f"{exc}".replace("\n", " ").replace("   ", " ")
     logger.error(f"{request}: {exc_str}")
-    content = {"status_code": 422, "detail": exc.args[0]}
+    # the errors of the model validators hold the exceptions raised
+    content = {"status_code": 422, "detail": jsonable_encoder(exc.errors())}
     return JSONResponse(content=content, status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
 async def policy_variable_not_found_error_handler(request: Request, exc: PolicyNotFoundError):
@@ -36,6 +36,13 @@ class DBType(str, Enum):
     IN_MEMORY = "inmemory"
     FILE = "file"
     MONGODB = "mongodb"
+    SQLITE = "sqlite"
+
+
+class SnapshotFormat(str, Enum):
+    JSON = "json"
+    ORJSON = "orjson"
+    MSGPACK = "msgpack"
 
 
 class DBConfig(BaseModel):
@@ -46,6 +53,17 @@ class DBConfig(BaseModel):
   password: SecretStr = SecretStr("")
   name: str = ""
   url: str = ""
+  file_flush_interval: float = 0
+  file_journal: bool = False
+  file_journal_max_size: int = 4 * 1024 * 1024
+  file_format: SnapshotFormat = SnapshotFormat.JSON
+  file_zstd: bool = False
+  # the history of a policy keeps at least its last event
+  events_max_count: int = Field(default=1000, ge=1)
+  events_max_age: int = Field(default=0, ge=0)
+  events_inline: int = Field(default=10, ge=0)
+  cache_size: int = 0
+  conflict_retries: int = 5
 
   @model_validator(mode='after')
   def custom_default(self) -> Self:
@@ -28,6 +28,9 @@ class PolmanError(Exception):
 class PolicyNotFoundError(PolmanError):
     """Error raised when a policy is not found in the application."""
 
+class PolicyConflictError(PolmanError):
+    """Error raised when a policy has been changed by someone else since it was read."""
+
 class PolicyVariableNotExist(PolmanError):
     ...
 
@@ -23,9 +23,9 @@
 import datetime
 from enum import Enum
 from http import HTTPMethod
-from typing import Literal, LiteralString, NotRequired, Optional, Union
+from typing import Annotated, Any, Literal, LiteralString, NotRequired, Optional, Union
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Discriminator, Tag, model_validator
 from typing_extensions import TypedDict
 
 
@@ -94,10 +94,54 @@ class PolicyProperties(TypedDict):
     pendingInterval: NotRequired[str]
 
 
-PolicySubject = Union[
-    PolicySubjectApplication, PolicySubjectHost, PolicySubjectCustom,
-]  # keep Custom at the end!
-PolicySpec = Union[PolicySpecTemplate, PolicySpecTelemetry, PolicySpecConstraints]
+# the fields that tell the type of a subject or a spec without a `type`
+_SUBJECT_TYPE_FIELDS = [
+    (cls.model_fields["type"].default, [n for n, f in cls.model_fields.items() if f.is_required()])
+    for cls in (PolicySubjectApplication, PolicySubjectHost)
+]
+_SPEC_TYPE_FIELDS = [("template", "templateName"), ("telemetryQuery", "expr")]
+
+
+def _subject_type(value: Any) -> str | None:
+    """Return the type of a subject: without a `type`, app or host if it has all their fields, custom otherwise."""
+    if not isinstance(value, dict):
+        return getattr(value, "type", None)
+    if "type" in value:
+        return value["type"]
+    for subject_type, fields in _SUBJECT_TYPE_FIELDS:
+        if all(isinstance(value.get(f), str) for f in fields):
+            return subject_type
+    return "custom"
+
+
+def _spec_type(value: Any) -> str | None:
+    """Return the type of a spec, telling templates and telemetry queries without a `type` by their fields."""
+    if not isinstance(value, dict):
+        return getattr(value, "type", None)
+    if "type" in value:
+        return value["type"]
+    return next((spec_type for spec_type, field in _SPEC_TYPE_FIELDS if field in value), None)
+
+
+# discriminated by `type`: only the model of the type is validated, instead of trying
+# each one in turn
+PolicySubject = Annotated[
+    Union[
+        Annotated[PolicySubjectApplication, Tag("app")],
+        Annotated[PolicySubjectHost, Tag("host")],
+        Annotated[PolicySubjectCustom, Tag("custom")],
+    ],
+    Discriminator(_subject_type),
+]
+PolicySpec = Annotated[
+    Union[
+        Annotated[PolicySpecTemplate, Tag("template")],
+        Annotated[PolicySpecTelemetry, Tag("telemetryQuery")],
+        Annotated[PolicySpecConstraints, Tag("constraints")],
+    ],
+    Discriminator(_spec_type),
+]
+# a single type: nothing to discriminate yet
 PolicyAction = Union[PolicyActionWebhook]  # type: ignore
 
 PolicyVariableType = int | float | str
@@ -150,18 +194,86 @@ class PolicyEvent(BaseModel):
 class PolicyStatus(BaseModel):
     renderedSpec: PolicySpec|None = None
     measurementBackends: dict[str, dict[str, Union[str, int]]] = {}
+    # only the most recent events: the full history is stored apart by the storage backend
     events: list[PolicyEvent] = []
     phase: PolicyPhase = PolicyPhase.Unknown
+    createdAt: Optional[datetime.datetime] = None
 
 
 class Policy(PolicyCreate):
     id: str  # type: ignore
     status: PolicyStatus = PolicyStatus()
+    # incremented by the storage backends at every change
+    version: int = 0
+
+
+def copy_policy(policy: Policy) -> Policy:
+    """Copy a policy, so that the storage writes on the copy do not change the original.
+
+    Only the fields changed in place by the writes of `InMemoryPolmanStorage` are
+    copied: the version, the variables and the status. The other nested models
+    (subject, spec, events, ...) are shared, which is much cheaper than a deep copy.
+    """
+    status = policy.status
+    return policy.model_copy(update={
+        "variables": dict(policy.variables),
+        "status": status.model_copy(update={
+            "measurementBackends": dict(status.measurementBackends),
+            "events": list(status.events),
+        }),
+    })
 
 
 class PolicyRead(Policy):
     id: str  # type: ignore
 
+    @classmethod
+    def from_policy(cls, policy: Policy) -> "PolicyRead":
+        """Build the PolicyRead of a policy read from the storage, without validating it again.
+
+        It is built from a copy (see `copy_policy()`), so later writes of the storage
+        to `policy` do not change it.
+        """
+        return cls.model_construct(policy.model_fields_set, **copy_policy(policy).__dict__)
+
+
+class PolicySummary(BaseModel):
+    """The fields of a policy needed to list it, without spec, variables and events."""
+    id: str
+    name: str
+    subject: PolicySubject
+    phase: PolicyPhase = PolicyPhase.Unknown
+    creationTime: Optional[datetime.datetime] = None
+
+
+class PolicyBatchItemResult(BaseModel):
+    """The result of a policy of a batch request, at the same `index` as in the request.
+
+    `policy` is the policy created or changed, if any, and `error` why the request
+    failed for it, or why the policy could not be activated. A policy that an update
+    failed for is returned as it is, so that it can be identified.
+    """
+    index: int
+    policy: Optional[PolicyRead] = None
+    error: Optional[str] = None
+
+
+class PolicyVariablesUpdate(BaseModel):
+    """The variables to set on the policies selected by ids, app instance or template name.
+
+    Exactly one of the selectors must be given. A variable set to null is deleted.
+    """
+    ids: Optional[list[str]] = None
+    appInstance: Optional[str] = None
+    templateName: Optional[str] = None
+    variables: dict[str, Optional[PolicyVariableType]]
+
+    @model_validator(mode="after")
+    def _check_selector(self) -> "PolicyVariablesUpdate":
+        if [self.ids, self.appInstance, self.templateName].count(None) != 2:
+            raise ValueError("Exactly one of ids, appInstance and templateName must be given")
+        return self
+
 
 class User(BaseModel):
     name: str
@@ -0,0 +1,60 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+"""Compiled jinja2 templates of the policy expressions.
+
+Parsing a template costs much more than rendering it, and the same expressions (the
+ones of the catalog above all) are rendered over and over: the templates are
+compiled once by shared environments and kept in an LRU cache keyed by their source.
+"""
+
+import functools
+from typing import Any
+
+from jinja2 import BaseLoader, Environment, StrictUndefined, Template, meta
+
+# the number of distinct template sources kept compiled
+TEMPLATE_CACHE_SIZE = 1024
+
+_strict_environment = Environment(loader=BaseLoader(), undefined=StrictUndefined)
+_lenient_environment = Environment(loader=BaseLoader())
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(source: str, strict: bool = True) -> Template:
+    """Return the compiled template of `source`.
+
+    Strict templates raise `UndefinedError` on undefined variables, the others render
+    them as empty strings.
+    """
+    environment = _strict_environment if strict else _lenient_environment
+    return environment.from_string(source)
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def template_variables(source: str) -> frozenset[str]:
+    """Return the names of the variables referenced by the template `source`."""
+    return frozenset(meta.find_undeclared_variables(_strict_environment.parse(source)))
+
+
+def template_cache_info() -> dict[str, Any]:
+    """Return the statistics of the compiled templates cache."""
+    info = compile_template.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize}
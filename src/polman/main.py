@@ -86,13 +86,15 @@ class PolmanApp(PolmanService):
 
     def startup_reconciliation(self):
         # TODO(gabriele): reconciliation with the measurment backend
-        policies = self.storage.list()
+        # the summaries are enough for the meter: the backends do not need to load
+        # (and the file backend to validate) every policy at startup
+        policies = self.storage.list_summaries()
         logger.info("Running Startup Reconciliation for %s found in the db", len(policies))
 
         # TODO: this should be done after the policy reconciliation
         # with the backend has been performed
         for p in policies:
-            self.meter.set_policy_enforced(p)
+            self.meter.set_summary_enforced(p)
         logger.info("Starting Metric Server at 0.0.0.0:9464")
 
     async def start(self, dry_run=False):
@@ -101,7 +103,11 @@ class PolmanApp(PolmanService):
         if not dry_run:
             self.startup_reconciliation()
 
-        await tasks
+        try:
+            await tasks
+        finally:
+            # write the changes that the storage might still be holding in memory
+            self.storage.flush()
 
     def run(self, dry_run=False) -> None:
         asyncio.run(self.start(dry_run=dry_run))
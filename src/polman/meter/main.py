@@ -26,7 +26,7 @@ from opentelemetry.exporter.prometheus import PrometheusMetricReader
 from opentelemetry.sdk.metrics import MeterProvider
 from opentelemetry.sdk.resources import SERVICE_NAME, Resource
 
-from polman.common.model import Policy, PolicyPhase
+from polman.common.model import Policy, PolicyPhase, PolicySubject, PolicySummary
 from polman.common.service import PolmanService
 from polman.watcher.prometheus_rule_engine import subject_to_labels_dict
 from opentelemetry.metrics import CallbackOptions, Observation
@@ -59,6 +59,10 @@ class PolmanMeter(PolmanService):
 
     
     meter.create_observable_gauge("plm.policy.enforced", callbacks=[self._observe_enforced])
+
+    self._cache_hits = meter.create_counter("plm.storage.cache.hits", description="Policies read from the storage cache")
+    self._cache_misses = meter.create_counter("plm.storage.cache.misses", description="Policies read from the storage backend")
+    self._cache_evictions = meter.create_counter("plm.storage.cache.evictions", description="Policies evicted from the storage cache")
   
   async def start(self, dry_run=False):
     if not dry_run:
@@ -69,12 +73,27 @@ class PolmanMeter(PolmanService):
       yield Observation(v[0], v[1])
   
   def set_policy_enforced(self, policy: Policy):
+    self._set_enforced(policy.id, policy.name, policy.subject, policy.status.phase)
+
+  def set_summary_enforced(self, summary: PolicySummary):
+    """Like set_policy_enforced(), from the summary of a policy: used at startup, without loading the policies."""
+    self._set_enforced(summary.id, summary.name, summary.subject, summary.phase)
+
+  def _set_enforced(self, policy_id: str, name: str, subject: PolicySubject, phase: PolicyPhase):
     
-    if policy.id in self._policy_enforced_status_cache and policy.status.phase == PolicyPhase.Inactive:
-      del self._policy_enforced_status_cache[policy.id]
+    if policy_id in self._policy_enforced_status_cache and phase == PolicyPhase.Inactive:
+      del self._policy_enforced_status_cache[policy_id]
       return
     
-    attributes = {"id": policy.id, "name": policy.name} | subject_to_labels_dict(policy.subject)
-    
-    self._policy_enforced_status_cache[policy.id] = (1 if policy.status.phase == PolicyPhase.Enforced else 0, attributes)
+    attributes = {"id": policy_id, "name": name} | subject_to_labels_dict(subject)
     
+    self._policy_enforced_status_cache[policy_id] = (1 if phase == PolicyPhase.Enforced else 0, attributes)
+
+  def add_cache_hit(self):
+    self._cache_hits.add(1)
+
+  def add_cache_miss(self):
+    self._cache_misses.add(1)
+
+  def add_cache_eviction(self, count: int = 1):
+    self._cache_evictions.add(count)
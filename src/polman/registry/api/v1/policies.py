@@ -17,13 +17,19 @@
 # and innovation programme under grant agreement No. 101070177.
 
 import logging
+from typing import Any, Literal, Union
 
-from fastapi import APIRouter, HTTPException, Security
+from fastapi import APIRouter, HTTPException, Query, Response, Security
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import TypeAdapter
 
 from polman.common.api import PolmanRegistryInstance, get_authorized_user
 from polman.common.errors import PolmanError
-from polman.common.model import PolicyCreate, PolicyRead, PolicyVariableType, User
+from polman.common.model import (
+    PolicyBatchItemResult, PolicyCreate, PolicyEvent, PolicyPhase, PolicyRead, PolicySummary, PolicyVariablesUpdate,
+    PolicyVariableType, User,
+)
+from polman.registry.main import policy_filters
 
 logger = logging.getLogger(__name__)
 
@@ -36,19 +42,39 @@ router = APIRouter(
 
 
 @router.get("/{pid}", response_model=PolicyRead)
-def get_policy(
+async def get_policy(
     pid: str,
     pr: PolmanRegistryInstance,
     user: User = Security(get_authorized_user, scopes=["policies:read"]),
 ):
     try:
-        p = pr.get_policy_by_id(pid)
+        p = await pr.get_policy_by_id_async(pid)
     except PolmanError:
         raise HTTPException(status_code=404, detail="Item not found")
 
     return p
 
 
+@router.get("/{pid}/events", response_model=list[PolicyEvent], summary="List policy events")
+async def get_policy_events(
+    pid: str,
+    pr: PolmanRegistryInstance,
+    skip: int = Query(default=0, ge=0),
+    limit: int = Query(default=100, ge=1, le=1000),
+    user: User = Security(get_authorized_user, scopes=["policies:read"]),
+):
+    """
+    Returns a page of the event history of the policy, from the oldest event.
+
+    The history is bounded: old events are discarded according to the
+    `--db-events-max-count` and `--db-events-max-age` settings.
+    """
+    try:
+        return await pr.get_policy_events_async(pid, skip=skip, limit=limit)
+    except PolmanError:
+        raise HTTPException(status_code=404, detail="Item not found")
+
+
 @router.delete("/{pid}", status_code=204)
 def delete_policy(
     pid: str,
@@ -74,12 +100,94 @@ def deactivate_policy(
     pr.deactivate_policy(pr.get_policy_by_id(pid))
 
 
-@router.get("/", response_model=list[PolicyRead])
-def list_policies(
+def _projection(fields: str | None, detail: bool) -> tuple[set[str] | None, bool]:
+    """Return the fields selected by the `fields` query parameter, and whether full policies must be read."""
+    if fields is None:
+        return None, detail
+    include = {f.strip() for f in fields.split(",") if f.strip()}
+    # only the summaries are read if they have all the fields
+    detail = not include <= PolicySummary.model_fields.keys()
+    unknown = include - (PolicyRead.model_fields.keys() if detail else PolicySummary.model_fields.keys())
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return include, detail
+
+
+@router.get("/", response_model=Union[list[PolicySummary], list[PolicyRead]])
+async def list_policies(
     pr: PolmanRegistryInstance,
+    response: Response,
+    detail: bool = False,
+    limit: int | None = Query(default=None, ge=1, le=1000),
+    cursor: str | None = None,
+    stream: bool = False,
+    phase: PolicyPhase | None = None,
+    subject_type: str | None = None,
+    app_name: str | None = None,
+    app_instance: str | None = None,
+    app_component: str | None = None,
+    host_id: str | None = None,
+    agent_id: str | None = None,
+    name_prefix: str | None = None,
+    sort_by: Literal["creation_time", "name"] = "creation_time",
+    order: Literal["asc", "desc"] = "asc",
+    fields: str | None = None,
     user: User = Security(get_authorized_user, scopes=["policies:read"]),
 ):
-    return pr.list_all_policies()
+    """
+    Returns the policies, sorted by creation time or by name (`sort_by`, `order`).
+
+    By default only id, name, subject, phase and creation time of each policy
+    are returned. Use `detail=true` to get the full policies, or `fields` to get
+    only some of their fields (e.g. `fields=id,name,status`): when all of them
+    are among the default ones, the full policies are not read at all, else the
+    full policies are read and the fields are selected by the service.
+
+    The policies can be filtered by `phase`, by subject fields (`subject_type`,
+    `app_name`, `app_instance`, `app_component`, `host_id`, `agent_id`) and by
+    `name_prefix`. The filters and the sort are applied by the database.
+
+    With `limit` only a page of the policies is returned: if there are more, the
+    `X-Next-Cursor` header holds the `cursor` to pass to get the next page. The
+    cursor keeps the sort of the first page.
+
+    With `stream=true` the policies are streamed as newline delimited json
+    (`application/x-ndjson`), while they are read from the database.
+    """
+    include, detail = _projection(fields, detail)
+    filters = policy_filters(
+        phase=phase,
+        subject={
+            "type": subject_type, "appName": app_name, "appInstance": app_instance,
+            "appComponent": app_component, "hostId": host_id, "agentId": agent_id,
+        },
+        name_prefix=name_prefix,
+    )
+
+    if stream:
+        async def _lines():
+            async for p in pr.stream_policies_async(detail=detail, filters=filters, sort_by=sort_by, order=order):
+                yield p.model_dump_json(include=include) + "\n"
+        return StreamingResponse(_lines(), media_type="application/x-ndjson")
+
+    headers = {}
+    if limit is not None or cursor is not None:
+        try:
+            items, next_cursor = await pr.find_policies_page_async(
+                limit or 100, cursor=cursor, detail=detail, filters=filters, sort_by=sort_by, order=order)
+        except ValueError as ex:
+            raise HTTPException(status_code=400, detail=str(ex))
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+    elif detail:
+        items = await pr.find_policies_async(sort_by=sort_by, order=order, filters=filters)
+    else:
+        items = await pr.find_policy_summaries_async(sort_by=sort_by, order=order, filters=filters)
+
+    if include is not None:
+        return JSONResponse([p.model_dump(mode="json", include=include) for p in items], headers=headers)
+    response.headers.update(headers)
+    return items
 
 
 @router.post("/", response_model=PolicyRead)
@@ -94,11 +202,51 @@ def create_policy(
     )
 
 
+@router.post("/batch", response_model=list[PolicyBatchItemResult], summary="Create several policies")
+def create_policies(
+    policies: list[dict[str, Any]],
+    pr: PolmanRegistryInstance,
+    do_not_activate: bool = False,
+    user: User = Security(get_authorized_user, scopes=["policies:write"]),
+):
+    """
+    Creates several policies, each one with the same body of `POST /policies/`.
+
+    All the policies are validated and rendered first, then the valid ones are
+    stored together and, unless `do_not_activate=true`, their alerting rules are
+    added to Prometheus with a single request.
+
+    Returns a result for each policy, in the same order: the policy created, or
+    the error that prevented its creation. A policy created but that could not be
+    activated is returned inactive, together with the error.
+    """
+    return pr.process_policies_create_request(policies, activate_created_policies=not do_not_activate)
+
+
+@router.post("/batch/variables", response_model=list[PolicyBatchItemResult], summary="Set the variables of several policies")
+def set_policies_variables(
+    update: PolicyVariablesUpdate,
+    pr: PolmanRegistryInstance,
+    user: User = Security(get_authorized_user, scopes=["policies:write"]),
+):
+    """
+    Sets the `variables` of the policies selected by `ids`, `appInstance` or
+    `templateName`. A variable set to null is deleted.
+
+    The specs of all the policies are rendered with the new variables first, and
+    the policies that cannot be rendered are left unchanged. The others are
+    updated together: the active ones stay active, and their alerting rules are
+    replaced in place with a request per rule file.
+
+    Returns a result for each policy, in the order of `ids` or of creation: the
+    policy updated, or the error that prevented its update.
+    """
+    return pr.process_set_policies_variables(update)
 
 
 @router.get("/{pid}/variables/", response_model= dict[str, PolicyVariableType],
 summary="List policy variables")
-def get_policy_variables(
+async def get_policy_variables(
     pid: str, 
     pr: PolmanRegistryInstance,
     user: User = Security(get_authorized_user, scopes=["policies:read"])
@@ -106,7 +254,7 @@ def get_policy_variables(
     """
     Returns all variables currently set for the given policy.
     """
-    return pr.get_policy_by_id(pid).variables
+    return (await pr.get_policy_by_id_async(pid)).variables
 
 
 @router.post("/{pid}/variables/{name}/{value}", status_code=204, summary="Set a variable")
@@ -132,6 +280,10 @@ def set_policy_variables(
     2. Set the variable
     3. Re-render the policy
     4. Activate the policy if it was active
+
+    If the spec does not reference the variable, or the rendered spec does not
+    change, only the variable is set. An active policy is not deactivated: its
+    alerting rule is replaced in place, in the same rule file.
     """
 
     casted_value = value
@@ -46,14 +46,14 @@ class PolicyStatsResponseModel(BaseModel):
 
 @router.get("/", response_model=PolicyStatsResponseModel,
     summary="Stats on the policies currently managed by Polman Registry")
-def get_stats(pr: PolmanRegistryInstance):  # THIS IS A PUBLIC ENDPOINT, we do not add the Security dependency 
+async def get_stats(pr: PolmanRegistryInstance):  # THIS IS A PUBLIC ENDPOINT, we do not add the Security dependency 
     """
     Returns the number of policies managed by the Polman Registry grouped by
     their status.
 
     This is a public endpoint: no authentication and authorization are required.
     """
-    all_phases = [p.status.phase for p in pr.list_all_policies()]
+    all_phases = [p.phase for p in await pr.find_policy_summaries_async(sort_by=None)]
 
     enforced = len([p for p in all_phases if p == PolicyPhase.Enforced])
     violated = len([p for p in all_phases if p == PolicyPhase.Violated])
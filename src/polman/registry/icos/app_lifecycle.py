@@ -45,11 +45,7 @@ def process_app_started(
 
     logger.debug("Found %s policies matching the request", len(app_policies))
 
-    res = []
-    for p in app_policies:
-        res.append(pr.activate_policy(p))
-    
-    return res
+    return pr.activate_policies(app_policies)
 
 def process_app_stopped(
     event: ICOSAppStoppedEvent,
@@ -60,11 +56,7 @@ def process_app_stopped(
 
     logger.debug("Found %s policies matching the request", len(app_policies))
 
-    res = []
-    for p in app_policies:
-        res.append(pr.deactivate_policy(p))
-    
-    return res
+    return pr.deactivate_policies(app_policies)
 
 def process_app_deleted(
     event: ICOSAppDeletedEvent,
@@ -75,11 +67,7 @@ def process_app_deleted(
 
     logger.debug("Found %s policies matching the request", len(app_policies))
 
-    res = []
-    for p in app_policies:
-        res.append(pr.process_policy_delete_request(p.id))
-    
-    return res
+    return pr.delete_policies(app_policies)
 
 def process_app_created(
     event: ICOSAppCreatedEvent,
@@ -19,8 +19,8 @@
 #
 
 from http import HTTPMethod
-from typing import Annotated, List, Literal, Optional, Self, Union, get_args
-from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+from typing import Annotated, Any, List, Literal, Optional, Self, Union, get_args
+from pydantic import BaseModel, ConfigDict, Discriminator, Field, Tag, field_validator, model_validator
 import yaml
 
 from polman.common.model import PolicyActionBase, PolicyProperties, PolicySpec
@@ -93,6 +93,43 @@ class NoPolmanPolicy(BaseModel):
     return v
 
 
+def _app_descriptor_policy_kind(v: Any) -> str | None:
+  # the same choice as trying the models in turn: short security policies first,
+  # then by type, then by the fields of the custom (polman) policies
+  if not isinstance(v, dict):
+    return _APP_DESCRIPTOR_POLICY_KINDS.get(type(v))
+  if isinstance(v.get("security"), str):
+    return "security-short"
+  policy_type = v.get("type", "custom")
+  if policy_type == "security":
+    return "security"
+  if policy_type == "custom":
+    return "spec" if "spec" in v and "fromTemplate" not in v else "template"
+  return "other"
+
+
+_APP_DESCRIPTOR_POLICY_KINDS = {
+  ICOSSecurityPolicyShort: "security-short",
+  ICOSSecurityPolicy: "security",
+  ICOSPolmanTemplatePolicy: "template",
+  ICOSPolmanSpecPolicy: "spec",
+  NoPolmanPolicy: "other",
+}
+
+# a policy of an app descriptor, for polman or not, discriminated without trying
+# to validate each model in turn
+ICOSAppDescriptorAnyPolicy = Annotated[
+  Union[
+    Annotated[ICOSSecurityPolicyShort, Tag("security-short")],
+    Annotated[ICOSSecurityPolicy, Tag("security")],
+    Annotated[ICOSPolmanTemplatePolicy, Tag("template")],
+    Annotated[ICOSPolmanSpecPolicy, Tag("spec")],
+    Annotated[NoPolmanPolicy, Tag("other")],
+  ],
+  Discriminator(_app_descriptor_policy_kind),
+]
+
+
 #
 #  APP DESCRIPTOR MODEL
 #
@@ -100,13 +137,13 @@ class NoPolmanPolicy(BaseModel):
 class ICOSAppDescriptorComponent(BaseModel):
   name: str
   type: str
-  policies: Optional[list[Union[ICOSAppDescriptorPolicy, NoPolmanPolicy]]] = []
+  policies: Optional[list[ICOSAppDescriptorAnyPolicy]] = []
 
 class ICOSAppDescriptor(BaseModel):
   name: str
   description: str
   components: list[ICOSAppDescriptorComponent] = []
-  policies: list[Union[ICOSAppDescriptorPolicy, NoPolmanPolicy]] = []
+  policies: list[ICOSAppDescriptorAnyPolicy] = []
 
 
 class PolicyActionICOSService(PolicyActionBase):
@@ -18,22 +18,50 @@
 # and innovation programme under grant agreement No. 101070177.
 #
 
+import itertools
 import logging
 import uuid
 
-from typing import List
+from typing import Any, AsyncIterator, List
 from polman.common.config import PolmanConfig
-from polman.common.errors import PolicyRenderingError, PolicyVariableNotExist, PolmanError
+from polman.common.errors import (
+    PolicyNotFoundError, PolicyRenderingError, PolicyRenderingTestError, PolicyVariableNotExist, PolmanError,
+)
 from polman.common.events import PolicyEventsFactory
-from polman.common.model import Policy, PolicyCreate, PolicyPhase, PolicyRead, PolicyVariableType
+from polman.common.model import (
+    Policy, PolicyBatchItemResult, PolicyCreate, PolicyEvent, PolicyPhase, PolicyRead, PolicySpec, PolicySpecTelemetry,
+    PolicySummary, PolicyVariablesUpdate, PolicyVariableType,
+)
 from polman.common.service import PolmanService
-from polman.registry.render import render_policy_spec, test_spec_rendering
+from polman.registry.render import referenced_variables, render_policy_spec, render_with_variables
+from polman.storage.backend.main import SORT_KEYS, Page, Prefix, page_cursor, page_from_cursor
 from polman.storage.main import PolmanStorage
 from polman.watcher.main import PolmanWatcher
 
 logger = logging.getLogger(__name__)
 
 
+def _all(sort_by: str | None, order: str) -> Page | None:
+    """Return the page of all the policies sorted by one of the `SORT_KEYS`, or None if they are not sorted."""
+    if sort_by not in SORT_KEYS:
+        return None
+    return Page(limit=None, sort_by=sort_by, descending=order == "desc")
+
+
+def policy_filters(
+    phase: PolicyPhase | None = None,
+    subject: dict[str, str] | None = None,
+    name_prefix: str | None = None,
+) -> dict:
+    """Return the storage filters selecting the policies by phase, subject fields and name prefix."""
+    filters: dict = {f"subject.{k}": v for k, v in (subject or {}).items() if v is not None}
+    if phase is not None:
+        filters["status.phase"] = phase
+    if name_prefix:
+        filters["name"] = Prefix(name_prefix)
+    return filters
+
+
 class PolmanRegistry(PolmanService):
     def __init__(self, config: PolmanConfig, ps: PolmanStorage, pw: PolmanWatcher):
         logger.info("Initializing PolmanRegistry")
@@ -47,72 +75,213 @@ class PolmanRegistry(PolmanService):
         p = self._ps.get(id)
         if not p:
             raise PolmanError("Policy Not Found")
-        return PolicyRead(**p.model_dump())
+        return PolicyRead.from_policy(p)
+
+
+    async def get_policy_by_id_async(self, id: str) -> PolicyRead:
+        p = await self._ps.aio.get(id)
+        return PolicyRead.from_policy(p)
 
+    # The listings are sorted by the backends, as the pages are
 
     def find_policies(
         self, sort_by="creation_time", order="asc", filters={}
     ) -> List[PolicyRead]:
-        policies = [
-            PolicyRead(**db_policy.model_dump()) for db_policy in self._ps.list(filters=filters)
-        ]
+        page = _all(sort_by, order)
+        policies = self._ps.list(filters=filters) if page is None else self._ps.list_page(filters=filters, page=page)
+        return [PolicyRead.from_policy(db_policy) for db_policy in policies]
 
-        if sort_by == "creation_time":
-            policies.sort(
-                key=lambda p: p.status.events[0].timestamp,
-                reverse=True if order == "desc" else False,
-            )
-
-        return policies
+    async def find_policies_async(
+        self, sort_by="creation_time", order="asc", filters={}
+    ) -> List[PolicyRead]:
+        page = _all(sort_by, order)
+        if page is None:
+            policies = await self._ps.aio.list(filters=filters)
+        else:
+            policies = await self._ps.aio.list_page(filters=filters, page=page)
+        return [PolicyRead.from_policy(db_policy) for db_policy in policies]
 
     def list_all_policies(
         self, sort_by="creation_time", order="asc"
     ) -> list[PolicyRead]:
         return self.find_policies(sort_by=sort_by, order=order)
 
+    def find_policy_summaries(
+        self, sort_by="creation_time", order="asc", filters={}
+    ) -> List[PolicySummary]:
+        """Like `find_policies`, but only id, name, subject, phase and creation time are read."""
+        page = _all(sort_by, order)
+        if page is None:
+            return self._ps.list_summaries(filters=filters)
+        return self._ps.list_summaries_page(filters=filters, page=page)
+
+    async def find_policy_summaries_async(
+        self, sort_by="creation_time", order="asc", filters={}
+    ) -> List[PolicySummary]:
+        page = _all(sort_by, order)
+        if page is None:
+            return await self._ps.aio.list_summaries(filters=filters)
+        return await self._ps.aio.list_summaries_page(filters=filters, page=page)
+
+    async def find_policies_page_async(
+        self, limit: int, cursor: str | None = None, detail: bool = False, filters={},
+        sort_by="creation_time", order="asc",
+    ) -> tuple[List[PolicyRead] | List[PolicySummary], str | None]:
+        """Return a page of the policies, sorted by the backend, and the cursor of the next page.
+
+        The cursor is None after the last page, and holds the sort of the first page.
+        Raises ValueError if `cursor` is not valid.
+        """
+        if cursor:
+            page = page_from_cursor(cursor, limit)
+        else:
+            page = Page(limit=limit, sort_by=sort_by, descending=order == "desc")
+        items: List[PolicyRead] | List[PolicySummary]
+        if detail:
+            items = [PolicyRead.from_policy(p) for p in await self._ps.aio.list_page(filters=filters, page=page)]
+        else:
+            items = await self._ps.aio.list_summaries_page(filters=filters, page=page)
+        return items, page_cursor(page, items[-1]) if len(items) == limit else None
+
+    async def stream_policies_async(
+        self, detail: bool = False, filters={}, page_size: int = 500, sort_by="creation_time", order="asc",
+    ) -> AsyncIterator[PolicyRead | PolicySummary]:
+        """Yield the sorted policies, reading `page_size` of them at a time."""
+        page = Page(limit=page_size, sort_by=sort_by, descending=order == "desc")
+        async for p in self._ps.aio.iter_policies(filters=filters, page=page, summaries=not detail):
+            yield PolicyRead.from_policy(p) if detail else p
+
+    def get_policy_events(self, policy_id: str, skip: int = 0, limit: int = 100) -> List[PolicyEvent]:
+        return self._ps.list_events(policy_id, skip=skip, limit=limit)
+
+    async def get_policy_events_async(self, policy_id: str, skip: int = 0, limit: int = 100) -> List[PolicyEvent]:
+        return await self._ps.aio.list_events(policy_id, skip=skip, limit=limit)
+
     def process_policy_delete_request(self, policy_id: str) -> Policy:
         """Delete a policy."""
+        return self._ps.run_with_retries(self._delete_policy, policy_id)
+
+    def _delete_policy(self, policy_id: str) -> Policy:
         policy = self._ps.get(policy_id)
         self.deactivate_policy(policy)
         self._ps.delete(policy_id)
         return policy
 
+    # The single policy operations read the policy again in their unit of work, and
+    # are run again if it is changed concurrently (see PolmanStorage.run_with_retries)
 
     def activate_policy(self, policy: Policy) -> Policy:
+        return self._ps.run_with_retries(self._activate_policy, policy.id)
+
+    def _activate_policy(self, policy_id: str) -> Policy:
+        policy = self._ps.get(policy_id)
         self._pw.set_measurement_backends(policy)
         # the status is considered enforced because we alway activate a policy when
         # we create it
         self._ps.set_policy_phase(policy, PolicyPhase.Enforced)
-        return PolicyRead(**self._ps.get(policy.id).model_dump())
+        return PolicyRead.from_policy(self._ps.get(policy_id))
 
     def deactivate_policy(self, policy: Policy) -> Policy:
+        return self._ps.run_with_retries(self._deactivate_policy, policy.id)
+
+    def _deactivate_policy(self, policy_id: str) -> Policy:
+        policy = self._ps.get(policy_id)
         self._pw.unset_measurement_backends(policy)
         self._ps.set_policy_phase(policy, PolicyPhase.Inactive)
-        return PolicyRead(**self._ps.get(policy.id).model_dump())
+        return PolicyRead.from_policy(self._ps.get(policy_id))
+
+    # The bulk operations use the policies given as they were read, and are run again
+    # on the policies read again if any of them is changed concurrently
+
+    def _run_with_retries_many(self, fn, policies: List[Policy]):
+        attempts = itertools.count()
+
+        def _attempt():
+            current = policies
+            if next(attempts) > 0:
+                current = []
+                for p in policies:
+                    try:
+                        current.append(self._ps.get(p.id))
+                    except PolicyNotFoundError:
+                        # deleted in the meantime
+                        continue
+            return fn(current)
+
+        return self._ps.run_with_retries(_attempt)
+
+    def activate_policies(self, policies: List[Policy]) -> List[PolicyRead]:
+        """Activate several policies, writing the changes of all of them together."""
+        return self._run_with_retries_many(self._activate_policies, policies)
+
+    def _activate_policies(self, policies: List[Policy]) -> List[PolicyRead]:
+        self._pw.set_measurement_backends_many(policies)
+        self._ps.set_phase_many(policies, PolicyPhase.Enforced)
+        return [PolicyRead.from_policy(self._ps.get(p.id)) for p in policies]
+
+    def deactivate_policies(self, policies: List[Policy]) -> List[PolicyRead]:
+        """Deactivate several policies, writing the changes of all of them together."""
+        return self._run_with_retries_many(self._deactivate_policies, policies)
+
+    def _deactivate_policies(self, policies: List[Policy]) -> List[PolicyRead]:
+        self._pw.unset_measurement_backends_many(policies)
+        self._ps.set_phase_many(policies, PolicyPhase.Inactive)
+        return [PolicyRead.from_policy(self._ps.get(p.id)) for p in policies]
+
+    def delete_policies(self, policies: List[Policy]) -> List[Policy]:
+        """Deactivate and delete several policies, writing the changes of all of them together."""
+        return self._run_with_retries_many(self._delete_policies, policies)
+
+    def _delete_policies(self, policies: List[Policy]) -> List[Policy]:
+        self._deactivate_policies(policies)
+        return self._ps.delete_many(policies)
 
     def render_policy_spec(self, policy: Policy) -> Policy:
-        rendered = render_policy_spec(policy)
+        return self._set_rendered_spec(policy, render_policy_spec(policy))
+
+    def _set_rendered_spec(self, policy: Policy, rendered: PolicySpec) -> Policy:
         logger.debug("Rendered policy: %s", rendered)
         self._ps.set_rendered_spec(policy, rendered)            
         self._ps.add_policy_event(policy, PolicyEventsFactory.policy_rendered(rendered))
 
-        return PolicyRead(**self._ps.get(policy.id).model_dump())
+        return PolicyRead.from_policy(self._ps.get(policy.id))
 
     def set_policy_variable(self, policy: Policy, name: str, value: PolicyVariableType|None) -> Policy:
         prev_value = policy.variables.get(name, None)
         self._ps.update_variable(policy, name, value)
         self._ps.add_policy_event(policy, PolicyEventsFactory.variable_set(name, prev_value, value))
-        return PolicyRead(**self._ps.get(policy.id).model_dump())
+        return PolicyRead.from_policy(self._ps.get(policy.id))
 
 
     def process_set_policy_variable(self, policy: Policy, name: str, value: PolicyVariableType|None) -> Policy:
-        
+        return self._ps.run_with_retries(self._process_set_policy_variable, policy.id, name, value)
+
+    def _process_set_policy_variable(self, policy_id: str, name: str, value: PolicyVariableType|None) -> Policy:
+        policy = self._ps.get(policy_id)
+
         # if we want to delete a variable that does not exist, raise an exception
         if not value and name not in policy.variables:
             raise PolicyVariableNotExist(f"Variable {name} not found")
 
-        test_spec_rendering(policy, {name: value})
-        
+        try:
+            referenced = name in referenced_variables(policy.spec)
+            rendered = render_with_variables(policy, {name: value}) if referenced else None
+        except Exception as ex:
+            raise PolicyRenderingTestError(str(ex)) from ex
+
+        # the rendered spec, and so the rules, do not change: just set the variable
+        if policy.status.renderedSpec is not None and (not referenced or rendered == policy.status.renderedSpec):
+            logger.debug("Variable %s does not change the rendered spec of policy %s", name, policy_id)
+            return self.set_policy_variable(policy, name, value)
+
+        # an active policy stays watched: its rule is rewritten in place, in the same rule file
+        if (policy.status.phase in (PolicyPhase.Enforced, PolicyPhase.Violated)
+                and "prom-1" in policy.status.measurementBackends
+                and isinstance(rendered, PolicySpecTelemetry)):
+            self._pw.update_measurement_backends(policy, rendered)
+            policy = self.set_policy_variable(policy, name, value)
+            return self._set_rendered_spec(policy, rendered)
+
         _reactivate = False
 
         # 1. deactivate if active
@@ -123,15 +292,14 @@ class PolmanRegistry(PolmanService):
         # 2. set variable
         policy = self.set_policy_variable(policy, name, value)
 
-
         # 3. re-render the policy
-        policy = self.render_policy_spec(policy)
+        policy = self._set_rendered_spec(policy, rendered) if rendered else self.render_policy_spec(policy)
 
         # 4. reactivate if it was active
         if _reactivate:
             self.activate_policy(policy)
 
-        return PolicyRead(**self._ps.get(policy.id).model_dump())
+        return PolicyRead.from_policy(self._ps.get(policy.id))
 
     def process_policy_create_request(
         self, policy: PolicyCreate, activate_created_policy=True
@@ -139,18 +307,133 @@ class PolmanRegistry(PolmanService):
         logger.debug("Received request: %s", policy)
 
 
-        db_policy = Policy(**policy.model_dump(), id=str(uuid.uuid4()))
-        db_policy = self._ps.insert(db_policy)
+        with self._ps.batch():
+            db_policy = Policy(**policy.model_dump(), id=str(uuid.uuid4()))
+            db_policy = self._ps.insert(db_policy)
 
-        self._ps.add_policy_event(db_policy, PolicyEventsFactory.policy_created())
-        self._ps.set_policy_phase(db_policy, PolicyPhase.Inactive)
+            self._ps.add_policy_event(db_policy, PolicyEventsFactory.policy_created())
+            self._ps.set_policy_phase(db_policy, PolicyPhase.Inactive)
 
-        db_policy = self.render_policy_spec(db_policy)
+            db_policy = self.render_policy_spec(db_policy)
 
-        if activate_created_policy:
-            logger.debug("Activating policy because activate_created_policy=True")
+            if activate_created_policy:
+                logger.debug("Activating policy because activate_created_policy=True")
 
-            self.activate_policy(db_policy)
+                self.activate_policy(db_policy)
 
         # return updated object
-        return PolicyRead(**self._ps.get(db_policy.id).model_dump())
+        return PolicyRead.from_policy(self._ps.get(db_policy.id))
+
+    def process_policies_create_request(
+        self, policies: List[PolicyCreate | dict[str, Any]], activate_created_policies=True
+    ) -> List[PolicyBatchItemResult]:
+        """Create several policies, returning the result of each of them in the same order.
+
+        The policies are validated and rendered first: the ones that fail are reported
+        and not created. The others are stored with a single write and, when activated,
+        their alerting rules are added with a single request. If the rules cannot be
+        added the policies are left inactive, and the error is reported for each of them.
+        """
+        results = [PolicyBatchItemResult(index=i) for i in range(len(policies))]
+        prepared: dict[int, tuple[Policy, PolicySpec]] = {}
+        for i, item in enumerate(policies):
+            try:
+                policy = item if isinstance(item, PolicyCreate) else PolicyCreate.model_validate(item)
+                db_policy = Policy(**policy.model_dump(), id=str(uuid.uuid4()))
+                rendered = render_policy_spec(db_policy)
+                if rendered is None:
+                    raise PolicyRenderingError(f"Cannot render a policy spec of type '{db_policy.spec.type}'")
+            except Exception as ex:
+                logger.debug("Policy %s of the batch not valid: %s", i, ex)
+                results[i].error = str(ex)
+                continue
+            prepared[i] = (db_policy, rendered)
+
+        with self._ps.batch():
+            # buffered: the policies are inserted with all their changes when the batch exits
+            created = self._ps.insert_many([db_policy for db_policy, _ in prepared.values()])
+            self._ps.add_event_many(created, PolicyEventsFactory.policy_created())
+            self._ps.set_phase_many(created, PolicyPhase.Inactive)
+            for db_policy, (_, rendered) in zip(created, prepared.values()):
+                self._ps.set_rendered_spec(db_policy, rendered)
+                self._ps.add_policy_event(db_policy, PolicyEventsFactory.policy_rendered(rendered))
+
+            if activate_created_policies and created:
+                try:
+                    self._pw.set_measurement_backends_many(created, shared_rule_file=True)
+                    self._ps.set_phase_many(created, PolicyPhase.Enforced)
+                except Exception as ex:
+                    logger.exception("Cannot activate the policies of the batch")
+                    for i in prepared:
+                        results[i].error = f"Policy created but not activated: {ex}"
+
+        for i, db_policy in zip(prepared, created):
+            results[i].policy = PolicyRead.from_policy(self._ps.get(db_policy.id))
+        return results
+
+    def process_set_policies_variables(self, update: PolicyVariablesUpdate) -> List[PolicyBatchItemResult]:
+        """Set variables of the selected policies, returning the result of each of them.
+
+        The specs of all the policies are rendered with the new variables first: the
+        ones that fail are reported and left unchanged. The active policies whose
+        rendered spec changes stay active, and their rules are replaced in place with
+        a request per rule file. All the changes are written together.
+        """
+        return self._ps.run_with_retries(self._set_policies_variables, update)
+
+    def _set_policies_variables(self, update: PolicyVariablesUpdate) -> List[PolicyBatchItemResult]:
+        targets: List[Policy | None]
+        if update.ids is not None:
+            targets = []
+            for pid in update.ids:
+                try:
+                    targets.append(self._ps.get(pid))
+                except PolicyNotFoundError:
+                    targets.append(None)
+        else:
+            if update.appInstance is not None:
+                filters = {"subject.appInstance": update.appInstance}
+            else:
+                filters = {"spec.templateName": update.templateName}
+            # the working copies, that are checked for concurrent changes
+            targets = [self._ps.get(p.id) for p in self._ps.list_page(filters=filters, page=_all("creation_time", "asc"))]
+
+        results = [PolicyBatchItemResult(index=i) for i in range(len(targets))]
+        prepared: dict[int, tuple[Policy, PolicySpec | None]] = {}
+        for i, policy in enumerate(targets):
+            if policy is None:
+                results[i].error = f"Policy {update.ids[i]} not found"  # type: ignore
+                continue
+            try:
+                for name, value in update.variables.items():
+                    if not value and name not in policy.variables:
+                        raise PolicyVariableNotExist(f"Variable {name} not found")
+                rendered = policy.status.renderedSpec
+                if rendered is None or referenced_variables(policy.spec) & update.variables.keys():
+                    rendered = render_with_variables(policy, update.variables)
+            except Exception as ex:
+                logger.debug("Cannot set the variables of policy %s: %s", policy.id, ex)
+                results[i] = PolicyBatchItemResult(index=i, policy=PolicyRead.from_policy(policy), error=str(ex))
+                continue
+            prepared[i] = (policy, rendered if rendered != policy.status.renderedSpec else None)
+
+        # the rules are replaced first: the policies whose rules are not replaced are left unchanged
+        active = {
+            i: policy for i, (policy, rendered) in prepared.items()
+            if rendered is not None and policy.status.phase in (PolicyPhase.Enforced, PolicyPhase.Violated)
+        }
+        errors = self._pw.update_measurement_backends_many(
+            list(active.values()), {p.id: prepared[i][1] for i, p in active.items()})  # type: ignore
+        for i, policy in active.items():
+            if policy.id in errors:
+                results[i] = PolicyBatchItemResult(
+                    index=i, policy=PolicyRead.from_policy(policy), error=f"Rules not replaced: {errors[policy.id]}")
+                del prepared[i]
+
+        for i, (policy, rendered) in prepared.items():
+            for name, value in update.variables.items():
+                self.set_policy_variable(policy, name, value)
+            if rendered is not None:
+                self._set_rendered_spec(policy, rendered)
+            results[i].policy = PolicyRead.from_policy(self._ps.get(policy.id))
+        return results
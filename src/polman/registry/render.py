@@ -18,27 +18,60 @@
 # and innovation programme under grant agreement No. 101070177.
 #
 
-from jinja2 import BaseLoader, Environment, StrictUndefined
 from jinja2.exceptions import UndefinedError
 
 from polman.common.errors import PolicyRenderingError, PolicyRenderingTestError
 from polman.common.model import PolicyCreate, PolicySpec, PolicySpecTelemetry, PolicySpecTemplate
+from polman.common.templating import compile_template, template_variables
 from polman.registry.templates_catalog import POLICY_SPEC_TEMPLATES_CATALOG
 from polman.watcher.prometheus_rule_engine import subject_to_labels_list, subject_to_labels_selector
 
 
+def expr_template_source(spec: PolicySpecTelemetry) -> str:
+    """Return the template of the full expression of a telemetry spec, condition included."""
+    full_expr_tpl = spec.expr
+    if spec.violatedIf:
+        full_expr_tpl += f" {spec.violatedIf}"
 
-def test_spec_rendering(policy: PolicyCreate, extra_variables: dict = {}):
-    # test if the new variable introduces rendering errors
-    test_policy = policy.model_copy(deep=True)
+    # since prometheus uses "{}" to specify the metric labels and jinja2 uses
+    # {{}} for template expressions, it might happen to have expressions like
+    # "container_cpu_utilization_ratio{{{subject_label_selector}}}" that is not
+    # well parsed by jinja2. If we change it to
+    # "container_cpu_utilization_ratio{ {{subject_label_selector}} }" it is
+    # parsed correctly by jinja
+    return full_expr_tpl.replace("{{{", "{ {{").replace("}}}", "}} }")
+
+
+# the catalog templates are rendered by most policies: compile them upfront
+for _spec in POLICY_SPEC_TEMPLATES_CATALOG.values():
+    compile_template(expr_template_source(_spec))
+
+
+def referenced_variables(spec: PolicySpec) -> frozenset[str]:
+    """Return the names of the variables that the rendering of a spec depends on."""
+    if isinstance(spec, PolicySpecTemplate):
+        spec = POLICY_SPEC_TEMPLATES_CATALOG[spec.templateName]
+    if isinstance(spec, PolicySpecTelemetry):
+        return template_variables(expr_template_source(spec))
+    return frozenset()
+
+
+def render_with_variables(policy: PolicyCreate, extra_variables: dict) -> PolicySpec:
+    """Render the spec of a policy with some variables set, or deleted if None, without changing the policy."""
+    variables = dict(policy.variables)
     for name, value in extra_variables.items():
         if not value:
-            del test_policy.variables[name]
+            del variables[name]
         else:
-            test_policy.variables[name] = value
+            variables[name] = value
+    # rendering does not change the policy: a shallow copy is enough
+    return render_policy_spec(policy.model_copy(update={"variables": variables}))
+
 
+def test_spec_rendering(policy: PolicyCreate, extra_variables: dict = {}):
+    # test if the new variable introduces rendering errors
     try:
-        render_policy_spec(test_policy)
+        render_with_variables(policy, extra_variables)
     except Exception as ex:
         raise PolicyRenderingTestError(str(ex)) from ex
         
@@ -46,16 +79,15 @@ def test_spec_rendering(policy: PolicyCreate, extra_variables: dict = {}):
 def render_policy_spec(policy: PolicyCreate) -> PolicySpec: # type: ignore
     """Render the template tokens in the policy expression."""
 
-    new_spec = policy.spec.model_copy(deep=True)
-
-    if isinstance(new_spec, PolicySpecTemplate):
-        new_spec = POLICY_SPEC_TEMPLATES_CATALOG[new_spec.templateName].model_copy()
+    if isinstance(policy.spec, PolicySpecTemplate):
+        new_spec = POLICY_SPEC_TEMPLATES_CATALOG[policy.spec.templateName].model_copy()
+    else:
+        new_spec = policy.spec.model_copy(deep=True)
 
     # rendering specific to telemetry specs
     if isinstance(new_spec, PolicySpecTelemetry):
-        full_expr_tpl = new_spec.expr
+        full_expr_tpl = expr_template_source(new_spec)
         if new_spec.violatedIf:
-            full_expr_tpl += f" {new_spec.violatedIf}"
             new_spec.violatedIf = None
 
         ctxt = {
@@ -66,15 +98,7 @@ def render_policy_spec(policy: PolicyCreate) -> PolicySpec: # type: ignore
 
         ctxt |= policy.variables
 
-        # since prometheus uses "{}" to specify the metric labels and jinja2 uses
-        # {{}} for template expressions, it might happen to have expressions like
-        # "container_cpu_utilization_ratio{{{subject_label_selector}}}" that is not
-        # well parsed by jinja2. If we change it to
-        # "container_cpu_utilization_ratio{ {{subject_label_selector}} }" it is
-        # parsed correctly by jinja
-        full_expr_tpl = full_expr_tpl.replace("{{{", "{ {{").replace("}}}", "}} }")
-
-        rtemplate = Environment(loader=BaseLoader(), undefined=StrictUndefined).from_string(full_expr_tpl)
+        rtemplate = compile_template(full_expr_tpl)
 
         try:
             new_spec.expr = rtemplate.render(**ctxt)
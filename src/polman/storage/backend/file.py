@@ -1,55 +1,315 @@
 #
 # ICOS Dynamic Policy Manager
 # Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
-# 
+#
 # Licensed under the Apache License, Version 2.0 (the "License");
 # you may not use this file except in compliance with the License.
 # You may obtain a copy of the License at
-# 
+#
 # http://www.apache.org/licenses/LICENSE-2.0
-# 
+#
 # Unless required by applicable law or agreed to in writing, software
 # distributed under the License is distributed on an "AS IS" BASIS,
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-# 
+#
 # This work has received funding from the European Union's HORIZON research
 # and innovation programme under grant agreement No. 101070177.
 #
 
+import hashlib
 import json
 import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from pydantic import TypeAdapter
 
 from polman.common.errors import PolicyNotFoundError
 from polman.common.model import Policy, PolicyEvent, PolicyPhase, PolicySpec, PolicyVariableType
+from .main import AsyncPolmanStorageBackend, ThreadedAsyncPolmanStorage
 from .memory import InMemoryPolmanStorage
+from .snapshot import check_encoding, decode, encode
 
 logger = logging.getLogger(__name__)
 
+JOURNAL_SUFFIX = ".journal"
+
+_policy_spec_adapter: TypeAdapter[PolicySpec] = TypeAdapter(PolicySpec)
+
+
+def _snapshot_digest(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
 
 class FilePolmanStorage(InMemoryPolmanStorage):
+    """A backend that keeps policies in memory and persists them to a json file.
+
+    By default the whole store is rewritten after every mutation. The snapshot is
+    written to a temporary file and then renamed, so a crash never leaves a partially
+    written store. Writes can be coalesced:
+
+    - inside a ``batch()`` the store is written once, when the outermost batch exits;
+    - with ``--db-file-flush-interval`` > 0 mutations only mark the store as dirty
+      and a background thread writes it at most once per interval.
+
+    ``flush()`` writes pending changes immediately and must be called at shutdown.
+
+    The snapshot is a json file by default. ``--db-file-format`` (orjson, msgpack)
+    and ``--db-file-zstd`` select a faster or smaller encoding (see ``snapshot``). A
+    snapshot in another encoding, e.g. a json file of a previous version, is read
+    and rewritten in the configured one at startup.
+
+    The snapshot stores the whole event history of each policy in `status.events`,
+    which is split again in ring buffer and inline events when the policy is loaded.
+
+    Policies are loaded lazily: the snapshot is decoded at startup, but each policy
+    is validated only when first accessed (see `InMemoryPolmanStorage`). Policies
+    that were never accessed are written back to the snapshot as they were read.
+
+    When the journal is enabled (``--db-file-journal``) mutations are appended as
+    compact records to ``<db-url>.journal`` instead, and the snapshot is rewritten
+    only when the journal grows beyond ``--db-file-journal-max-size`` bytes.
+
+    The first line of the journal is a header with the digest of the snapshot the
+    records apply to. If the snapshot is replaced but the journal is not (e.g. a
+    crash in the middle of a compaction) the digests do not match and the stale
+    journal is discarded, since its records are already part of the snapshot.
+    """
+
     def __init__(self, config) -> None:
         super().__init__(config)
 
         self._file = config.db.url
+        self._journal_enabled = config.db.file_journal
+        self._journal_file = self._file + JOURNAL_SUFFIX
+        self._journal_max_size = config.db.file_journal_max_size
+        self._journal = None
+        self._flush_interval = config.db.file_flush_interval
+        self._local = threading.local()
+        self._dirty = False
+        self._compaction_thread: threading.Thread | None = None
+        self._format = config.db.file_format
+        self._zstd = config.db.file_zstd
+        check_encoding(self._format, self._zstd)
+
         self._read_from_file()
 
+        if self._flush_interval > 0:
+            threading.Thread(target=self._flush_periodically, name="file-flush", daemon=True).start()
+
     def _read_from_file(self):
-        with open(self._file, "r") as infile:
-            json_list = json.load(infile)
-            models = [Policy.model_validate(o) for o in json_list]
-            self._store = {m.id: m for m in models}
+        with open(self._file, "rb") as infile:
+            data = infile.read()
+        documents, fmt, zstd = decode(data, raw=True)
+        self._reset(documents)
+
+        migrate = (fmt, zstd) != (self._format, self._zstd)
+        if migrate:
+            logger.info("Rewriting the snapshot %s in the %s format", self._file, self._format.value)
+
+        if self._journal_enabled:
+            digest = _snapshot_digest(data)
+            if self._replay_journal(digest) or migrate:
+                # rewrite the snapshot so that the journal restarts from a clean state
+                self._compact()
+            else:
+                self._open_journal(digest)
+        elif migrate:
+            self._write_to_file()
+
+    def _dump(self, policy: Policy) -> dict:
+        """Serialize a policy with its whole event history in `status.events`."""
+        res = policy.model_dump(mode="json", exclude={"status": {"events"}})
+        res["status"]["events"] = [e.model_dump(mode="json") for e in self._events[policy.id]]
+        return res
+
+    def _snapshot(self) -> list[Policy | dict]:
+        """Return shallow copies of the policies with their whole event history in `status.events`.
+
+        The documents of the policies not hydrated yet already have it, and are returned as they are.
+        """
+        return [
+            p.model_copy(update={"status": p.status.model_copy(update={"events": list(self._events[p.id])})})
+            if isinstance(p, Policy) else p
+            for p in self._store.values()
+        ]
+
+    def _write_to_file(self) -> bytes:
+        """Atomically replace the snapshot with the content of the store."""
+        data = encode(self._snapshot(), self._format, self._zstd)
+
+        tmp_file = self._file + ".tmp"
+        with open(tmp_file, "wb") as outfile:
+            outfile.write(data)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.replace(tmp_file, self._file)
+
+        self._dirty = False
+        return data
 
-    def _write_to_file(self):
-        models = list(self._store.values())
-        json_list = [m.model_dump(mode="json") for m in models]
-        with open(self._file, "w") as outfile:
-            json.dump(json_list, outfile)
+    def _flush_periodically(self) -> None:
+        while True:
+            time.sleep(self._flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Error writing the policies to %s", self._file)
+
+    def _in_batch(self) -> bool:
+        return getattr(self._local, "batch_depth", 0) > 0
+
+    #
+    # Journal
+    #
+
+    def _replay_journal(self, snapshot_digest: str) -> bool:
+        """Apply the journal records on top of the snapshot just loaded.
+
+        Returns True if the store has been modified by the journal.
+        """
+        if not os.path.exists(self._journal_file):
+            return False
+
+        with open(self._journal_file, "rb") as infile:
+            lines = infile.read().split(b"\n")
+
+        # the last element is what follows the last newline: either empty or a torn record
+        complete, tail = lines[:-1], lines[-1]
+        if tail:
+            logger.warning("Discarding incomplete record at the end of the journal %s", self._journal_file)
+
+        try:
+            header = json.loads(complete[0]) if complete else {}
+        except ValueError:
+            header = {}
+        if header.get("snapshot") != snapshot_digest:
+            logger.warning("Journal %s does not match the snapshot %s: discarding it", self._journal_file, self._file)
+            return False
+
+        applied = 0
+        for line in complete[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning("Corrupted record in the journal %s: ignoring the following records", self._journal_file)
+                break
+            self._apply_record(record)
+            applied += 1
+
+        logger.info("Replayed %s records from the journal %s", applied, self._journal_file)
+        return applied > 0 or bool(tail)
+
+    def _apply_record(self, record: dict) -> None:
+        op = record["op"]
+        pid = record.get("id")
+
+        if op == "insert":
+            super().insert(Policy.model_validate(record["policy"]))
+        elif op == "delete":
+            if pid in self._store:
+                super().delete(pid)
+        elif op == "add_policy_event":
+            super().add_policy_event(pid, PolicyEvent.model_validate(record["event"]))
+        elif op == "set_policy_phase":
+            super().set_policy_phase(pid, PolicyPhase(record["phase"]))
+        elif op == "update_measurement_backend":
+            super().update_measurement_backend(pid, record["name"], record["status"])
+        elif op == "delete_measurement_backend":
+            super().delete_measurement_backend(pid, record["name"])
+        elif op == "set_rendered_spec":
+            super().set_rendered_spec(pid, _policy_spec_adapter.validate_python(record["spec"]))
+        elif op == "set_variable":
+            super().set_variable(pid, record["name"], record["value"])
+        else:
+            logger.error("Unknown journal record type '%s'", op)
+
+    def _open_journal(self, snapshot_digest: str) -> None:
+        """Start a new, empty journal for the given snapshot."""
+        if self._journal:
+            self._journal.close()
+
+        header = json.dumps({"snapshot": snapshot_digest}).encode() + b"\n"
+
+        # write the new journal aside and move it in place atomically, so that a crash
+        # never leaves a journal without its header
+        tmp_file = self._journal_file + ".tmp"
+        with open(tmp_file, "wb") as outfile:
+            outfile.write(header)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.replace(tmp_file, self._journal_file)
+
+        self._journal = open(self._journal_file, "ab")  # noqa: SIM115
+
+    def _compact(self) -> None:
+        """Write a new snapshot and restart the journal from it."""
+        data = self._write_to_file()
+
+        # from now on the old journal does not match the snapshot anymore and would
+        # be discarded at startup even if the process dies before the next step
+        self._open_journal(_snapshot_digest(data))
+
+    def compact(self) -> None:
+        """Write a new snapshot and truncate the journal."""
+        with self._lock:
+            self._compact()
+
+    def _append_to_journal(self, record: dict) -> None:
+        line = json.dumps(record, separators=(",", ":")).encode() + b"\n"
+        self._journal.write(line)  # type: ignore
+        if not self._in_batch():
+            self._journal.flush()  # type: ignore
+
+        if self._journal.tell() > self._journal_max_size:  # type: ignore
+            self._start_background_compaction()
+
+    def _start_background_compaction(self) -> None:
+        if self._compaction_thread and self._compaction_thread.is_alive():
+            return
+        logger.debug("Journal %s exceeded %s bytes: compacting", self._journal_file, self._journal_max_size)
+        self._compaction_thread = threading.Thread(target=self.compact, name="file-compaction", daemon=True)
+        self._compaction_thread.start()
+
+    def _persist(self, op: str, **record) -> None:
+        if self._journal_enabled:
+            self._append_to_journal({"op": op} | record)
+            return
+
+        self._dirty = True
+        if not self._flush_interval and not self._in_batch():
+            self._write_to_file()
+
+    #
+    # PolmanStorageBackend
+    #
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._journal:
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+            elif self._dirty:
+                self._write_to_file()
+
+    @contextmanager
+    def batch(self):
+        self._local.batch_depth = getattr(self._local, "batch_depth", 0) + 1
+        try:
+            yield
+        finally:
+            self._local.batch_depth -= 1
+            if not self._in_batch() and not self._flush_interval:
+                self.flush()
 
     def insert(self, policy: Policy) -> Policy:
-        res = super().insert(policy)
-        self._write_to_file()
+        with self._lock:
+            res = super().insert(policy)
+            self._persist("insert", policy=self._dump(res))
         return res
 
     def get(self, policy_id: str) -> Policy:
@@ -59,30 +319,41 @@ class FilePolmanStorage(InMemoryPolmanStorage):
         return super().list(filters=filters)
 
     def delete(self, policy_id: str) -> Policy:
-        res = super().delete(policy_id)
-        self._write_to_file()
-        return res     
+        with self._lock:
+            res = super().delete(policy_id)
+            self._persist("delete", id=policy_id)
+        return res
 
     def add_policy_event(self, policy_id: str, event: PolicyEvent) -> None:
-        super().add_policy_event(policy_id, event)
-        self._write_to_file()
+        with self._lock:
+            super().add_policy_event(policy_id, event)
+            self._persist("add_policy_event", id=policy_id, event=event.model_dump(mode="json"))
 
     def set_policy_phase(self, policy_id: str, phase: PolicyPhase) -> None:
-        super().set_policy_phase(policy_id, phase)
-        self._write_to_file()
+        with self._lock:
+            super().set_policy_phase(policy_id, phase)
+            self._persist("set_policy_phase", id=policy_id, phase=PolicyPhase(phase).value)
 
     def update_measurement_backend(self, policy_id: str, name: str, status: dict) -> None:
-        super().update_measurement_backend(policy_id, name, status)
-        self._write_to_file()
+        with self._lock:
+            super().update_measurement_backend(policy_id, name, status)
+            self._persist("update_measurement_backend", id=policy_id, name=name, status=status)
 
     def delete_measurement_backend(self, policy_id: str, name: str) -> None:
-        super().delete_measurement_backend(policy_id, name)
-        self._write_to_file()
+        with self._lock:
+            super().delete_measurement_backend(policy_id, name)
+            self._persist("delete_measurement_backend", id=policy_id, name=name)
 
     def set_rendered_spec(self, policy_id: str, spec: PolicySpec) -> None:
-        super().set_rendered_spec(policy_id, spec)
-        self._write_to_file()
+        with self._lock:
+            super().set_rendered_spec(policy_id, spec)
+            self._persist("set_rendered_spec", id=policy_id, spec=spec.model_dump(mode="json"))
 
     def set_variable(self, policy_id: str, name: str, value: PolicyVariableType|None) -> None:
-        super().set_variable(policy_id, name, value)
-        self._write_to_file()
\ No newline at end of file
+        with self._lock:
+            super().set_variable(policy_id, name, value)
+            self._persist("set_variable", id=policy_id, name=name, value=value)
+
+    def asynchronous(self) -> AsyncPolmanStorageBackend:
+        # writes hit the disk: keep them off the event loop
+        return ThreadedAsyncPolmanStorage(self)
@@ -18,30 +18,166 @@
 # and innovation programme under grant agreement No. 101070177.
 #
 
+import asyncio
+import base64
+import datetime
+import heapq
+import json
 import logging
+import uuid
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, List, NamedTuple
 
+from polman.common.config import DBConfig
 from polman.common.model import PolicySpec, PolicyVariableType
-from polman.common.errors import PolicyNotFoundError
-from polman.common.model import Policy, PolicyEvent, PolicyPhase, Violation
+from polman.common.errors import PolicyConflictError, PolicyNotFoundError
+from polman.common.model import Policy, PolicyEvent, PolicyPhase, PolicySummary, Violation, copy_policy
 from polman.common.service import PolmanService
 
 logger = logging.getLogger(__name__)
 
 
+def db_config(config) -> DBConfig:
+    """Return the db section of the configuration, or the defaults if it is not set."""
+    return config.db if config and config.db else DBConfig()
+
+
+class Mutation(NamedTuple):
+    """A buffered change of a policy, named after the backend method that applies it.
+
+    An "insert" mutation carries the new policy, with all the changes of the batch.
+    """
+    op: str
+    policy_id: str
+    args: tuple = ()
+
+
+# sort keys of the paginated listings, with the policy field each one is read from
+SORT_KEYS = {
+    "creation_time": "status.createdAt",
+    "name": "name",
+}
+
+
+class Prefix(NamedTuple):
+    """A filter value matching the strings starting with `prefix` (e.g. `{"name": Prefix("app-1-")}`).
+
+    The other filter values match by equality.
+    """
+    prefix: str
+
+    def matches(self, value: Any) -> bool:
+        return isinstance(value, str) and value.startswith(self.prefix)
+
+
+class Page(NamedTuple):
+    """A page of a listing sorted by `sort_by` and then by id (keyset pagination).
+
+    `after` is the sort key value and the id of the last policy of the previous
+    page. Policies without a value come first in ascending order. With `limit`
+    None the page holds all the policies that follow.
+    """
+    limit: int | None = 100
+    after: tuple[Any, str] | None = None
+    sort_by: str = "creation_time"
+    descending: bool = False
+
+
+def sort_value(policy: Policy | PolicySummary, sort_by: str) -> Any:
+    """Return the value of the sort key of a policy or of its summary."""
+    if sort_by == "creation_time":
+        return policy.creationTime if isinstance(policy, PolicySummary) else policy.status.createdAt
+    if sort_by == "name":
+        return policy.name
+    raise ValueError(f"Unknown sort key {sort_by}")
+
+
+def page_key(value: Any, policy_id: str) -> tuple:
+    # None never compared with the values: it sorts before all of them
+    return (value is not None, value, policy_id)
+
+
+def paginate(policies, page: Page) -> list:
+    """Select a page from unsorted policies (or summaries), keeping only `page.limit` of them."""
+    def key(p):
+        return page_key(sort_value(p, page.sort_by), p.id)
+
+    if page.after is not None:
+        after = page_key(*page.after)
+        policies = (p for p in policies if (key(p) < after if page.descending else key(p) > after))
+    if page.limit is None:
+        return sorted(policies, key=key, reverse=page.descending)
+    select = heapq.nlargest if page.descending else heapq.nsmallest
+    return select(page.limit, policies, key=key)
+
+
+def page_cursor(page: Page, last: Policy | PolicySummary) -> str:
+    """Return an opaque cursor for the page following the one ending with `last`."""
+    value = sort_value(last, page.sort_by)
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+    data = json.dumps([page.sort_by, page.descending, value, last.id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def page_from_cursor(cursor: str, limit: int | None) -> Page:
+    """Return the page following a `page_cursor()`. Raises ValueError if the cursor is not valid."""
+    try:
+        sort_by, descending, value, policy_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, ValueError) as ex:
+        raise ValueError(f"Invalid cursor {cursor}") from ex
+    if sort_by not in SORT_KEYS:
+        raise ValueError(f"Invalid cursor {cursor}")
+    if sort_by == "creation_time" and value is not None:
+        value = datetime.datetime.fromisoformat(value)
+    return Page(limit=limit, after=(value, str(policy_id)), sort_by=sort_by, descending=bool(descending))
+
+
+def summarize(policy: Policy) -> PolicySummary:
+    """Build the summary of a policy, without validating it again."""
+    return PolicySummary.model_construct(
+        id=policy.id,
+        name=policy.name,
+        subject=policy.subject,
+        phase=policy.status.phase,
+        creationTime=policy.status.createdAt,
+    )
+
+
 class PolmanStorageBackend:
 
     @abstractmethod
     def insert(self, policy: Policy) -> Policy:
         pass
 
+    def insert_many(self, policies: List[Policy]) -> List[Policy]:
+        """Insert several policies with their ids, returning them."""
+        with self.batch():
+            return [self.insert(p) for p in policies]
+
+    def new_id(self) -> str:
+        """Return an id for a new policy, that `insert_many()` keeps."""
+        return str(uuid.uuid4())
+
     @abstractmethod
     def get(self, policy_id: str) -> Policy:
         pass
 
+    def get_version(self, policy_id: str) -> int:
+        """Return the version of a policy, without loading it when the backend allows it."""
+        return self.get(policy_id).version
+
+    def get_copy(self, policy_id: str) -> Policy:
+        """Return a copy of a policy, not affected by the writes that follow (see `copy_policy`)."""
+        return copy_policy(self.get(policy_id))
+
     @abstractmethod
     def list(self, filters={}) -> list[Policy]:
-        pass
+        """Return the policies matching `filters`, by dotted field path (e.g. "subject.appInstance").
+
+        The values match by equality, or by prefix if they are a `Prefix`.
+        """
 
     @abstractmethod
     def delete(self, policy_id: str) -> Policy:
@@ -49,7 +185,15 @@ class PolmanStorageBackend:
 
     @abstractmethod
     def add_policy_event(self, policy_id: str, event: PolicyEvent) -> None:
-        pass
+        """Add an event to the history of a policy.
+
+        Only the last `events_inline` events are kept in `status.events`. The history
+        is bounded by `events_max_count` and, if set, by `events_max_age` seconds.
+        """
+
+    def list_events(self, policy_id: str, skip: int = 0, limit: int = 100) -> List[PolicyEvent]:
+        """Return a page of the event history of a policy, from the oldest event."""
+        return self.get(policy_id).status.events[skip:skip + limit]
 
     @abstractmethod
     def set_policy_phase(self, policy_id: str, phase: PolicyPhase) -> None:
@@ -69,4 +213,190 @@ class PolmanStorageBackend:
 
     @abstractmethod
     def set_variable(self, policy_id: str, name: str, value: PolicyVariableType|None) -> None:
-        ...
\ No newline at end of file
+        ...
+
+    def list_summaries(self, filters={}) -> List[PolicySummary]:
+        """List the policies matching `filters`, reading only the fields of `PolicySummary`.
+
+        The default implementation builds the summaries from `list()`, which is cheap
+        for backends that keep validated policies in memory. Backends that need to
+        load and validate each policy should read only the summary fields instead.
+        """
+        return [summarize(p) for p in self.list(filters=filters)]
+
+    def list_page(self, filters={}, page: Page = Page()) -> List[Policy]:
+        """Return a page of the policies matching `filters` (see `Page`).
+
+        The default implementation selects the page from `list()`. Backends that
+        read the policies from a database should read only the page instead.
+        """
+        return paginate(self.list(filters=filters), page)
+
+    def list_summaries_page(self, filters={}, page: Page = Page()) -> List[PolicySummary]:
+        """Like `list_page()`, reading only the fields of `PolicySummary`."""
+        return [summarize(p) for p in self.list_page(filters=filters, page=page)]
+
+    def set_phase_many(self, policy_ids: List[str], phase: PolicyPhase) -> None:
+        """Set the phase of several policies.
+
+        The `*_many` methods change a set of policies with as few writes as the
+        backend allows. By default they call the single policy methods in a `batch()`.
+        """
+        with self.batch():
+            for pid in policy_ids:
+                self.set_policy_phase(pid, phase)
+
+    def add_event_many(self, policy_ids: List[str], event: PolicyEvent) -> None:
+        """Add the same event to several policies."""
+        with self.batch():
+            for pid in policy_ids:
+                self.add_policy_event(pid, event)
+
+    def update_measurement_backend_many(self, name: str, statuses: dict[str, dict]) -> None:
+        """Set the status of a measurement backend of several policies, given by policy id."""
+        with self.batch():
+            for pid, status in statuses.items():
+                self.update_measurement_backend(pid, name, status)
+
+    def delete_many(self, policy_ids: List[str]) -> List[Policy]:
+        """Delete several policies, returning them."""
+        with self.batch():
+            return [self.delete(pid) for pid in policy_ids]
+
+    def check_versions(self, expected_versions: dict[str, int]) -> None:
+        """Raise `PolicyConflictError` if the version of a policy is not the expected one."""
+        for pid, version in expected_versions.items():
+            if self.get_version(pid) != version:
+                raise PolicyConflictError(pid)
+
+    def apply(self, mutations: List[Mutation], expected_versions: dict[str, int] | None = None) -> None:
+        """Apply a list of mutations in order, with a single write where the backend allows it.
+
+        With `expected_versions` (by policy id) the mutations are compare-and-swap
+        updates: if a policy has been changed since it was read, `PolicyConflictError`
+        is raised, listing the policies that changed. Backends check all the versions
+        before applying any mutation, so that none of them is applied on a conflict.
+
+        The policies of the "insert" mutations are inserted with `insert_many()`
+        before the other mutations are applied.
+        """
+        with self.batch():
+            if expected_versions:
+                self.check_versions(expected_versions)
+            inserts = [m.args[0] for m in mutations if m.op == "insert"]
+            if inserts:
+                self.insert_many(inserts)
+            for m in mutations:
+                if m.op != "insert":
+                    getattr(self, m.op)(m.policy_id, *m.args)
+
+    def flush(self) -> None:
+        """Persist pending changes, for backends that defer their writes."""
+
+    @contextmanager
+    def batch(self):
+        """Group several mutations: backends may persist them together when the batch exits."""
+        yield
+
+    def asynchronous(self) -> "AsyncPolmanStorageBackend":
+        """Return an async backend working on the same data.
+
+        By default the calls of this backend are run in a worker thread.
+        """
+        return ThreadedAsyncPolmanStorage(self)
+
+
+class AsyncPolmanStorageBackend(ABC):
+    """The async counterpart of `PolmanStorageBackend`, to be used on the event loop."""
+
+    @abstractmethod
+    async def insert(self, policy: Policy) -> Policy:
+        pass
+
+    @abstractmethod
+    async def get(self, policy_id: str) -> Policy:
+        pass
+
+    async def get_version(self, policy_id: str) -> int:
+        """Return the version of a policy (see `PolmanStorageBackend.get_version`)."""
+        return (await self.get(policy_id)).version
+
+    async def get_copy(self, policy_id: str) -> Policy:
+        """Return a copy of a policy (see `PolmanStorageBackend.get_copy`)."""
+        return copy_policy(await self.get(policy_id))
+
+    @abstractmethod
+    async def list(self, filters={}) -> List[Policy]:
+        pass
+
+    @abstractmethod
+    async def list_summaries(self, filters={}) -> List[PolicySummary]:
+        pass
+
+    async def list_page(self, filters={}, page: Page = Page()) -> List[Policy]:
+        """Return a page of the policies (see `PolmanStorageBackend.list_page`)."""
+        return paginate(await self.list(filters=filters), page)
+
+    async def list_summaries_page(self, filters={}, page: Page = Page()) -> List[PolicySummary]:
+        return paginate(await self.list_summaries(filters=filters), page)
+
+    @abstractmethod
+    async def list_events(self, policy_id: str, skip: int = 0, limit: int = 100) -> List[PolicyEvent]:
+        pass
+
+    @abstractmethod
+    async def delete(self, policy_id: str) -> Policy:
+        pass
+
+    @abstractmethod
+    async def apply(self, mutations: List[Mutation], expected_versions: dict[str, int] | None = None) -> None:
+        """Apply a list of mutations in order (see `PolmanStorageBackend.apply`)."""
+
+    async def flush(self) -> None:
+        """Persist pending changes, for backends that defer their writes."""
+
+
+class ThreadedAsyncPolmanStorage(AsyncPolmanStorageBackend):
+    """Exposes a `PolmanStorageBackend` with the async API, running its calls in a worker thread."""
+
+    def __init__(self, backend: PolmanStorageBackend) -> None:
+        self._backend = backend
+
+    async def _call(self, method: str, *args, **kwargs):
+        return await asyncio.to_thread(getattr(self._backend, method), *args, **kwargs)
+
+    async def insert(self, policy: Policy) -> Policy:
+        return await self._call("insert", policy)
+
+    async def get(self, policy_id: str) -> Policy:
+        return await self._call("get", policy_id)
+
+    async def get_version(self, policy_id: str) -> int:
+        return await self._call("get_version", policy_id)
+
+    async def get_copy(self, policy_id: str) -> Policy:
+        return await self._call("get_copy", policy_id)
+
+    async def list(self, filters={}) -> List[Policy]:
+        return await self._call("list", filters=filters)
+
+    async def list_summaries(self, filters={}) -> List[PolicySummary]:
+        return await self._call("list_summaries", filters=filters)
+
+    async def list_page(self, filters={}, page: Page = Page()) -> List[Policy]:
+        return await self._call("list_page", filters=filters, page=page)
+
+    async def list_summaries_page(self, filters={}, page: Page = Page()) -> List[PolicySummary]:
+        return await self._call("list_summaries_page", filters=filters, page=page)
+
+    async def list_events(self, policy_id: str, skip: int = 0, limit: int = 100) -> List[PolicyEvent]:
+        return await self._call("list_events", policy_id, skip=skip, limit=limit)
+
+    async def delete(self, policy_id: str) -> Policy:
+        return await self._call("delete", policy_id)
+
+    async def apply(self, mutations: List[Mutation], expected_versions: dict[str, int] | None = None) -> None:
+        await self._call("apply", mutations, expected_versions)
+
+    async def flush(self) -> None:
+        await self._call("flush")
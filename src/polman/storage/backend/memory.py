@@ -18,62 +18,332 @@
 # and innovation programme under grant agreement No. 101070177.
 #
 
+import datetime
+import functools
 import logging
+import threading
+from collections import deque
+from enum import Enum
+from itertools import islice
+from typing import Any, List
+
+from pydantic import BaseModel, TypeAdapter
 
 from polman.common.errors import PolicyNotFoundError
-from polman.common.model import Policy, PolicyEvent, PolicyPhase, PolicySpec, PolicyVariableType
-from .main import PolmanStorageBackend
+from polman.common.model import (
+    Policy, PolicyEvent, PolicyEventType, PolicyPhase, PolicySpec, PolicySummary, PolicyVariableType,
+)
+from .main import (
+    AsyncPolmanStorageBackend, Mutation, Page, PolmanStorageBackend, Prefix, ThreadedAsyncPolmanStorage, copy_policy,
+    db_config, paginate, summarize,
+)
 
 logger = logging.getLogger(__name__)
 
+# fields with a secondary index: equality filters on them do not scan the whole store
+INDEXED_FIELDS = ("name", "subject.type", "subject.appInstance", "status.phase")
+
+_MISSING = object()
+
+_policies_adapter: TypeAdapter[List[Policy]] = TypeAdapter(List[Policy])
+
+
+def get_field(obj: Any, path: str) -> Any:
+    """Return the value at the dotted `path` of a model (e.g. "subject.appInstance").
+
+    Mirrors mongo field paths: returns None if any of the fields along the path is missing.
+    """
+    for key in path.split("."):
+        # dicts first: the isinstance() checks of models are slower
+        if isinstance(obj, dict):
+            obj = obj.get(key, _MISSING)
+        elif isinstance(obj, BaseModel):
+            obj = getattr(obj, key, _MISSING)
+        else:
+            obj = _MISSING
+        if obj is _MISSING:
+            return None
+    return obj
+
+
+def _locked(method):
+    """Run a method of the store holding its lock."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _normalize(value: Any) -> Any:
+    # str enums compare equal to their value but hash differently
+    return value.value if isinstance(value, Enum) else value
+
+
+def _matches(value: Any, condition: Any) -> bool:
+    if isinstance(condition, Prefix):
+        return condition.matches(value)
+    return _normalize(value) == condition
+
 
 class InMemoryPolmanStorage(PolmanStorageBackend):
-    """A backend that keeps policies in memory."""
+    """A backend that keeps policies in memory.
+
+    `list()` supports mongo-like equality filters on dotted paths. Filters on the
+    `INDEXED_FIELDS` are resolved with hash indexes kept up to date on insert,
+    delete and phase changes; other filters are evaluated on the candidates left.
+
+    The event history of each policy is a ring buffer of `events_max_count` events,
+    while the policy keeps only the last `events_inline` in `status.events`.
+
+    The store can be loaded with raw documents (see `_reset()`): they are indexed as
+    they are and validated into a `Policy` only when first accessed. Summaries are
+    built without validating the whole policy, so a store loaded at startup can be
+    listed without paying for the validation of every policy.
+    """
+
+    def __init__(self, config, init_store=None) -> None:
+        db = db_config(config)
+        self._events_max_count = db.events_max_count
+        self._events_max_age = db.events_max_age
+        self._events_inline = db.events_inline
+        # mutations, and the version checks of `apply()`, are serialized
+        self._lock = threading.RLock()
+        self._reset(list((init_store or {}).values()))
+
+    def _reset(self, policies: list[Policy | dict]) -> None:
+        """Replace the content of the store with policies or with their raw documents."""
+        # the raw documents are replaced by their policies when hydrated
+        self._store: dict[str, Policy | dict] = {}
+        # field -> value -> ids (dicts are used as insertion-ordered sets)
+        self._indexes: dict[str, dict[Any, dict[str, None]]] = {f: {} for f in INDEXED_FIELDS}
+        self._events: dict[str, deque[PolicyEvent]] = {}
+        for p in policies:
+            self._store[get_field(p, "id")] = p
+            self._index(p)
+            if isinstance(p, Policy):
+                self._init_events(p)
+
+    def _hydrate(self, record: Policy | dict) -> Policy:
+        """Return the policy of a record of the store, validating it if it is a raw document."""
+        if isinstance(record, Policy):
+            return record
+        with self._lock:
+            # another thread may have hydrated it in the meantime
+            current = self._store.get(record["id"])
+            if current is None:
+                raise PolicyNotFoundError(record["id"])
+            if isinstance(current, Policy):
+                return current
+            policy = Policy.model_validate(current)
+            self._init_events(policy)
+            # the indexed fields have the same values: the indexes are still valid
+            self._store[policy.id] = policy
+            return policy
+
+    def _hydrate_all(self, records: List[Policy | dict]) -> List[Policy]:
+        """Like `_hydrate()`, validating all the raw documents with a single call."""
+        if all(isinstance(r, Policy) for r in records):
+            return records
+        with self._lock:
+            pending = [self._store.get(r["id"]) for r in records if not isinstance(r, Policy)]
+            for policy in _policies_adapter.validate_python([d for d in pending if isinstance(d, dict)]):
+                self._init_events(policy)
+                self._store[policy.id] = policy
+            # skip the policies deleted in the meantime
+            current = (r if isinstance(r, Policy) else self._store.get(r["id"]) for r in records)
+            return [p for p in current if p is not None]
+
+    @staticmethod
+    def _summarize(record: Policy | dict) -> PolicySummary:
+        if isinstance(record, Policy):
+            return summarize(record)
+        status = record.get("status") or {}
+        created_at = status.get("createdAt")
+        if created_at is None and status.get("events"):
+            created_at = status["events"][0]["timestamp"]
+        return PolicySummary.model_validate({
+            "id": record["id"],
+            "name": record["name"],
+            "subject": record["subject"],
+            "phase": status.get("phase", PolicyPhase.Unknown),
+            "creationTime": created_at,
+        })
 
-    def __init__(self, config, init_store={}) -> None:
-        self._store = init_store
+    def _init_events(self, policy: Policy) -> None:
+        """Move the events of a new policy to its ring buffer."""
+        events = policy.status.events
+        if policy.status.createdAt is None and events:
+            # policies stored before the creation time was tracked apart
+            policy.status.createdAt = events[0].timestamp
+        self._events[policy.id] = deque(events, maxlen=self._events_max_count)
+        policy.status.events = self._inline_events(policy.id)
 
+    def _inline_events(self, policy_id: str) -> list[PolicyEvent]:
+        events = self._events[policy_id]
+        self._expire_events(events)
+        n = min(self._events_inline, len(events))
+        return [events[i] for i in range(len(events) - n, len(events))]
+
+    def _expire_events(self, events: deque[PolicyEvent]) -> None:
+        if not self._events_max_age:
+            return
+        while events:
+            age = datetime.datetime.now(events[0].timestamp.tzinfo) - events[0].timestamp
+            if age.total_seconds() <= self._events_max_age:
+                break
+            events.popleft()
+
+    def _index(self, policy: Policy | dict, fields=INDEXED_FIELDS) -> None:
+        pid = get_field(policy, "id")
+        for f in fields:
+            key = _normalize(get_field(policy, f))
+            self._indexes[f].setdefault(key, {})[pid] = None
+
+    def _unindex(self, policy: Policy | dict, fields=INDEXED_FIELDS) -> None:
+        pid = get_field(policy, "id")
+        for f in fields:
+            key = _normalize(get_field(policy, f))
+            ids = self._indexes[f].get(key)
+            if ids is None:
+                continue
+            ids.pop(pid, None)
+            if not ids:
+                del self._indexes[f][key]
+
+    @_locked
     def insert(self, policy: Policy) -> Policy:
+        if policy.id in self._store:
+            self._unindex(self._store[policy.id])
         self._store[policy.id] = policy
+        self._index(policy)
+        self._init_events(policy)
         return policy
 
     def get(self, policy_id: str):
-        if policy_id in self._store:
-            return self._store[policy_id]
-        raise PolicyNotFoundError(policy_id)
+        record = self._store.get(policy_id)
+        if record is None:
+            raise PolicyNotFoundError(policy_id)
+        return self._hydrate(record)
+
+    @_locked
+    def get_copy(self, policy_id: str) -> Policy:
+        # get() returns the stored policy: copy it while no one is changing it
+        return copy_policy(self.get(policy_id))
 
+    @_locked
     def add_policy_event(self, policy_id: str, event: PolicyEvent) -> None:
         p = self.get(policy_id)
-        p.status.events.append(event)
+        p.version += 1
+        if event.type == PolicyEventType.Created:
+            p.status.createdAt = event.timestamp
+        self._events[policy_id].append(event)
+        p.status.events = self._inline_events(policy_id)
+
+    def list_events(self, policy_id: str, skip: int = 0, limit: int = 100) -> List[PolicyEvent]:
+        self.get(policy_id)
+        events = self._events[policy_id]
+        self._expire_events(events)
+        return list(islice(events, skip, skip + limit))
 
+    @_locked
     def set_policy_phase(self, policy_id: str, phase: PolicyPhase) -> None:
         p = self.get(policy_id)
+        p.version += 1
+        self._unindex(p, fields=("status.phase",))
         p.status.phase = phase
+        self._index(p, fields=("status.phase",))
 
+    @_locked
     def update_measurement_backend(self, policy_id: str, name: str, status: dict) -> None:
         p = self.get(policy_id)
+        p.version += 1
         p.status.measurementBackends[name] = status
 
+    @_locked
     def delete_measurement_backend(self, policy_id: str, name: str) -> None:
         p = self.get(policy_id)
+        p.version += 1
         del p.status.measurementBackends[name]
 
     def list(self, filters={}) -> list[Policy]:
-        # TODO: implement filtering
-        return list(self._store.values())
+        return self._hydrate_all(self._select(filters))
+
+    def list_summaries(self, filters={}) -> List[PolicySummary]:
+        return [self._summarize(r) for r in self._select(filters)]
+
+    def list_summaries_page(self, filters={}, page: Page = Page()) -> List[PolicySummary]:
+        return paginate(self.list_summaries(filters=filters), page)
+
+    @_locked
+    def _select(self, filters: dict) -> List[Policy | dict]:
+        """Return the records of the store matching `filters`.
+
+        The lock is held while walking the indexes and the store, that the writes change.
+        """
+        if not filters:
+            return list(self._store.values())
+
+        indexed = [self._index_lookup(f, v) for f, v in filters.items() if f in self._indexes]
+        others = {f: _normalize(v) for f, v in filters.items() if f not in self._indexes}
 
+        if indexed:
+            # walk the smallest index and check the membership in the others
+            indexed.sort(key=len)
+            candidates = (self._store[pid] for pid in indexed[0] if all(pid in ids for ids in indexed[1:]))
+        else:
+            candidates = iter(self._store.values())
+
+        # on raw documents the values are compared as stored in json, as with the indexes
+        return [p for p in candidates if all(_matches(get_field(p, f), v) for f, v in others.items())]
+
+    def _index_lookup(self, field: str, value: Any) -> dict[str, None]:
+        """Return the ids of the policies whose indexed `field` matches `value`."""
+        if not isinstance(value, Prefix):
+            return self._indexes[field].get(_normalize(value), {})
+        # a scan of the distinct values only
+        ids: dict[str, None] = {}
+        for key, key_ids in self._indexes[field].items():
+            if value.matches(key):
+                ids |= key_ids
+        return ids
+
+    @_locked
     def delete(self, policy_id: str) -> Policy:
-        p = self._store[policy_id]
+        p = self.get(policy_id)
         del self._store[policy_id]
+        self._unindex(p)
+        del self._events[policy_id]
         return p
 
+    @_locked
     def set_rendered_spec(self, policy_id: str, spec: PolicySpec) -> None:
         p = self.get(policy_id)
+        p.version += 1
         p.status.renderedSpec = spec
 
+    @_locked
     def set_variable(self, policy_id: str, name: str, value: PolicyVariableType|None) -> None:
         p = self.get(policy_id)
+        p.version += 1
         if not value:
             del p.variables[name]
         else:
-            p.variables[name] = value
\ No newline at end of file
+            p.variables[name] = value
+
+    @_locked
+    def apply(self, mutations: List[Mutation], expected_versions: dict[str, int] | None = None) -> None:
+        super().apply(mutations, expected_versions)
+
+    def asynchronous(self) -> AsyncPolmanStorageBackend:
+        return AsyncInMemoryPolmanStorage(self)
+
+
+class AsyncInMemoryPolmanStorage(ThreadedAsyncPolmanStorage):
+    """The async API of an `InMemoryPolmanStorage`.
+
+    The calls never block, so they run directly on the event loop.
+    """
+
+    async def _call(self, method: str, *args, **kwargs):
+        return getattr(self._backend, method)(*args, **kwargs)
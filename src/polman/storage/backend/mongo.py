@@ -19,7 +19,8 @@
 #
 
 import logging
-from typing import Annotated
+import re
+from typing import Annotated, Iterable, List
 from urllib.parse import quote_plus
 
 from pydantic_mongo.abstract_repository import AbstractRepository
@@ -27,11 +28,14 @@ from pydantic_mongo.fields import ObjectIdField
 import pymongo
 from bson import ObjectId
 from pydantic import BeforeValidator, ConfigDict
-from pymongo.results import UpdateResult
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateMany
+from pymongo.errors import OperationFailure
 
-from polman.common.errors import PolicyNotFoundError
-from polman.common.model import Policy, PolicyEvent, PolicyPhase, PolicySpec, PolicyVariableType
-from .main import PolmanStorageBackend
+from polman.common.errors import PolicyConflictError, PolicyNotFoundError
+from polman.common.model import (
+    Policy, PolicyEvent, PolicyEventType, PolicyPhase, PolicySpec, PolicyStatus, PolicySummary, PolicyVariableType,
+)
+from .main import SORT_KEYS, AsyncPolmanStorageBackend, Mutation, Page, PolmanStorageBackend, Prefix, db_config
 
 logger = logging.getLogger(__name__)
 
@@ -55,87 +59,723 @@ class PoliciesRepository(AbstractRepository[PolicyDB]):
         collection_name = "policies"
 
 
+EVENTS_COLLECTION = "policy_events"
+
+# Indexes of the "policies" collection, one for each of the query shapes below.
+# They are created (if missing) when the store is initialized.
+POLICY_INDEXES = [
+    IndexModel([("subject.type", ASCENDING), ("subject.appInstance", ASCENDING)], name="subject_app_instance"),
+    IndexModel([("status.phase", ASCENDING)], name="status_phase"),
+    IndexModel([("name", ASCENDING)], name="name"),
+    IndexModel([("status.createdAt", ASCENDING)], name="created_at"),
+    # the policies sharing a rule file, read when one of them is deactivated
+    IndexModel([("status.measurementBackends.prom-1.rule_file", ASCENDING)], name="rule_file", sparse=True),
+]
+
+# Indexes of the "policy_events" collection, that stores the event history of the
+# policies. A TTL index on "timestamp" is added when `events_max_age` is set.
+POLICY_EVENTS_INDEXES = [
+    IndexModel([("policyId", ASCENDING), ("timestamp", ASCENDING)], name="policy_timestamp"),
+]
+EVENTS_OLDEST_FIRST = [("timestamp", ASCENDING), ("_id", ASCENDING)]
+EVENTS_NEWEST_FIRST = [("timestamp", DESCENDING), ("_id", DESCENDING)]
+
+# Query shapes issued against the "policies" collection (see `pmctl explain-queries`)
+POLICY_QUERY_SHAPES = {
+    "policies of an app": {"filter": {"subject.type": "app", "subject.appInstance": "app-instance"}},
+    "policies by phase": {"filter": {"status.phase": "enforced"}},
+    "policies by name": {"filter": {"name": "policy-name"}},
+    "policies of a rule file": {"filter": {"status.measurementBackends.prom-1.rule_file": "rules-0.yml"}},
+    "policies by creation time": {"filter": {}, "sort": [("status.createdAt", DESCENDING)]},
+    "policies by name prefix": {"filter": {"name": {"$regex": "^policy-"}}, "sort": [("name", ASCENDING)]},
+}
+
+# Projection of the fields of a PolicySummary: spec, variables and events are never read
+POLICY_SUMMARY_PROJECTION = {
+    "_id": 0,
+    "id": {"$toString": "$_id"},
+    "name": 1,
+    "subject": 1,
+    "phase": "$status.phase",
+    "creationTime": "$status.createdAt",
+}
+
+# Projection used to revalidate cached policies
+VERSION_PROJECTION = {"_id": 0, "version": 1}
+
+
+def winning_plan_stages(explain: dict) -> list[str]:
+    """Return the stages of the winning plan of an explain output, from the outermost.
+
+    Index scans are reported with the name of the index, e.g. ["FETCH", "IXSCAN(name)"].
+    """
+    stages = []
+    plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+    # newer versions of mongodb wrap the plan in "queryPlan"
+    plan = plan.get("queryPlan", plan)
+    while plan:
+        stage = plan.get("stage", "?")
+        if "indexName" in plan:
+            stage += f"({plan['indexName']})"
+        stages.append(stage)
+        plan = plan.get("inputStage") or next(iter(plan.get("inputStages", [])), None)
+    return stages
+
+
+def merge_updates(updates: list[dict]) -> dict:
+    """Merge the update operator documents of several mutations of a policy into one.
+
+    The result is equivalent to applying the updates in order: on the same field
+    the last $set or $unset wins, while $push-ed items are appended.
+    """
+    merged: dict[str, dict] = {"$set": {}, "$unset": {}, "$push": {}}
+    for update in updates:
+        for path, value in update.get("$set", {}).items():
+            merged["$unset"].pop(path, None)
+            merged["$set"][path] = value
+        for path in update.get("$unset", {}):
+            merged["$set"].pop(path, None)
+            merged["$unset"][path] = ""
+        for path, push in update.get("$push", {}).items():
+            if path in merged["$push"]:
+                merged["$push"][path]["$each"] += push["$each"]
+            else:
+                merged["$push"][path] = push | {"$each": list(push["$each"])}
+    return {op: fields for op, fields in merged.items() if fields}
+
+
+def with_version_bump(update: dict) -> dict:
+    """Add the increment of the policy version to an update operator document."""
+    return update | {"$inc": {"version": 1}}
+
+
+def version_filter(policy_id: str, expected_versions: dict[str, int] | None) -> dict:
+    """Return the filter of a policy, matching only its expected version if given."""
+    res: dict = {"_id": ObjectId(policy_id)}
+    if expected_versions and policy_id in expected_versions:
+        version = expected_versions[policy_id]
+        # policies stored before the version was introduced do not have it
+        res["version"] = {"$in": [0, None]} if version == 0 else version
+    return res
+
+
+def version_conflicts(docs: Iterable[dict], expected_versions: dict[str, int]) -> tuple[list[str], list[str]]:
+    """Return the ids of the policies missing from the documents read, and of those without the expected version."""
+    # policies stored before the version was introduced do not have it
+    versions = {str(d["_id"]): d.get("version") or 0 for d in docs}
+    missing = [pid for pid in expected_versions if pid not in versions]
+    conflicts = [pid for pid, v in expected_versions.items() if pid in versions and versions[pid] != v]
+    return missing, conflicts
+
+
+def raise_version_conflicts(missing: list[str], conflicts: list[str]) -> None:
+    if missing:
+        raise PolicyNotFoundError(missing[0])
+    if conflicts:
+        raise PolicyConflictError(", ".join(conflicts))
+
+
+def supports_transactions(client) -> bool:
+    """Return whether the client is connected to a replica set or a sharded cluster, where transactions are available."""
+    # mongomock clients have no topology
+    description = getattr(client, "topology_description", None)
+    return description is not None and description.topology_type_name in ("ReplicaSetWithPrimary", "Sharded")
+
+
+def bulk_updates(updates: dict[str, dict], expected_versions: dict[str, int] | None = None) -> list[UpdateMany]:
+    """Return the bulk write operations applying an update to each policy, by id.
+
+    `UpdateMany` on the unique id updates a single document, like `UpdateOne`, which
+    mongomock does not support in bulk writes.
+    """
+    return [UpdateMany(version_filter(pid, expected_versions), with_version_bump(u)) for pid, u in updates.items()]
+
+
+def mongo_filter(filters: dict) -> dict:
+    """Translate the `Prefix` values of the filters into anchored regexes, that use the indexes."""
+    return {
+        path: {"$regex": "^" + re.escape(value.prefix)} if isinstance(value, Prefix) else value
+        for path, value in filters.items()
+    }
+
+
+def page_query(filters: dict, page: Page) -> tuple[dict, dict]:
+    """Return the filter and the sort reading a page of the policies (see `Page`).
+
+    Like mongodb, the pages sort missing values before all the others.
+    """
+    filters = mongo_filter(filters)
+    field = SORT_KEYS[page.sort_by]
+    direction = DESCENDING if page.descending else ASCENDING
+    sort = {field: direction, "_id": direction}
+    if page.after is None:
+        return filters, sort
+
+    value, policy_id = page.after
+    op = "$lt" if page.descending else "$gt"
+    same_value = {field: value, "_id": {op: ObjectId(policy_id)}}
+    if value is None:
+        after = same_value if page.descending else {"$or": [{field: {"$ne": None}}, same_value]}
+    elif page.descending:
+        after = {"$or": [{field: {"$lt": value}}, {field: None}, same_value]}
+    else:
+        after = {"$or": [{field: {"$gt": value}}, same_value]}
+    return ({"$and": [filters, after]} if filters else after), sort
+
+
+def page_summaries_pipeline(filters: dict, page: Page) -> list[dict]:
+    query, sort = page_query(filters, page)
+    limit = [{"$limit": page.limit}] if page.limit is not None else []
+    return [{"$match": query}, {"$sort": sort}, *limit, {"$project": POLICY_SUMMARY_PROJECTION}]
+
+
+def events_over_limit_pipeline(policy_ids: list[str], max_count: int) -> list[dict]:
+    """Return the aggregation finding which of the given policies have more than `max_count` events."""
+    return [
+        {"$match": {"policyId": {"$in": policy_ids}}},
+        {"$group": {"_id": "$policyId", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": max_count}}},
+    ]
+
+
+def mutation_update(op: str, args: tuple, events_inline: int) -> dict:
+    """Return the update operator document of a mutation (see `Mutation`)."""
+    if op == "add_policy_event":
+        (event,) = args
+        update: dict = {"$push": {"status.events": {"$each": [event.model_dump()], "$slice": -events_inline}}}
+        if event.type == PolicyEventType.Created:
+            update["$set"] = {"status.createdAt": event.timestamp}
+        return update
+    if op == "set_policy_phase":
+        return {"$set": {"status.phase": args[0]}}
+    if op == "update_measurement_backend":
+        name, status = args
+        return {"$set": {f"status.measurementBackends.{name}": status}}
+    if op == "delete_measurement_backend":
+        return {"$unset": {f"status.measurementBackends.{args[0]}": ""}}
+    if op == "set_rendered_spec":
+        return {"$set": {"status.renderedSpec": args[0].model_dump()}}
+    if op == "set_variable":
+        name, value = args
+        if not value:
+            return {"$unset": {f"variables.{name}": ""}}
+        return {"$set": {f"variables.{name}": value}}
+    raise ValueError(f"Unknown mutation '{op}'")
+
+
+def group_mutations(mutations: List[Mutation], events_inline: int) -> tuple[dict[str, dict], list[dict], list[str]]:
+    """Turn a list of mutations into a single update for each policy.
+
+    Returns the updates by policy id, the event documents to store and the ids of
+    the deleted policies.
+    """
+    updates: dict[str, list[dict]] = {}
+    events = []
+    deleted = []
+    for m in mutations:
+        if m.op == "delete":
+            updates.pop(m.policy_id, None)
+            deleted.append(m.policy_id)
+            continue
+        updates.setdefault(m.policy_id, []).append(mutation_update(m.op, m.args, events_inline))
+        if m.op == "add_policy_event":
+            events.append({"policyId": m.policy_id} | m.args[0].model_dump())
+
+    events = [e for e in events if e["policyId"] not in deleted]
+    return {pid: merge_updates(u) for pid, u in updates.items()}, events, deleted
+
+
+def split_events(policy: Policy, events_inline: int) -> tuple[PolicyStatus, list[PolicyEvent]]:
+    """Return the status to store for a new policy, with only the inline events, and its events."""
+    events = policy.status.events
+    status = policy.status.model_copy(update={
+        "events": events[-events_inline:] if events_inline else [],
+        "createdAt": policy.status.createdAt or (events[0].timestamp if events else None),
+    })
+    return status, events
+
+
+def new_policy_documents(policies: List[Policy], events_inline: int) -> tuple[list[dict], list[dict]]:
+    """Return the documents of new policies and of their events.
+
+    A policy keeps its id if it is an ObjectId (see `MongodbPolicyStore.new_id()`),
+    otherwise it gets a new one.
+    """
+    docs, events = [], []
+    for policy in policies:
+        status, policy_events = split_events(policy, events_inline)
+        oid = ObjectId(policy.id) if ObjectId.is_valid(policy.id) else ObjectId()
+        # the policy is already valid: no PolicyDB is validated again from its dump
+        docs.append({"_id": oid} | policy.model_dump(exclude={"id", "status"}) | {"status": status.model_dump()})
+        events += [{"policyId": str(oid)} | e.model_dump() for e in policy_events]
+    return docs, events
+
+
+def trimmed_events_filter(policy_id: str, oldest_kept: dict) -> dict:
+    """Return the filter of the events of a policy older than `oldest_kept`."""
+    return {
+        "policyId": policy_id,
+        "$or": [
+            {"timestamp": {"$lt": oldest_kept["timestamp"]}},
+            {"timestamp": oldest_kept["timestamp"], "_id": {"$lt": oldest_kept["_id"]}},
+        ],
+    }
+
+
+def mongodb_url(config) -> str:
+    """Return the connection url of the configured mongodb."""
+    if config.db.url:
+        return config.db.url
+    if config.db.user or config.db.password:
+        return "mongodb://%s:%s@%s:%s" % (
+            quote_plus(config.db.user),
+            quote_plus(config.db.password.get_secret_value()),
+            config.db.host,
+            config.db.port,
+        )
+    return "mongodb://%s:%s" % (config.db.host, config.db.port)
+
+
 class MongodbPolicyStore(PolmanStorageBackend):
     def __init__(self, config, mongo_db_client=None, mongo_db_database_name=None) -> None:
+        # the url is kept to open an async client on the same database
+        self._url = None
         if mongo_db_client:
             client = mongo_db_client
         else:
-            if config.db.url:
-                url = config.db.url
-            else:
-                if config.db.user or config.db.password:
-                    url = "mongodb://%s:%s@%s:%s" % (
-                        quote_plus(config.db.user),
-                        quote_plus(config.db.password.get_secret_value()),
-                        config.db.host,
-                        config.db.port,
-                    )
-                else:
-                    url = "mongodb://%s:%s" % (config.db.host, config.db.port)
-
-            client = pymongo.MongoClient(url)
-
-        self.__policies_repo = PoliciesRepository(database=client[mongo_db_database_name or config.db.name])
+            self._url = mongodb_url(config)
+            client = pymongo.MongoClient(self._url)
+        self._client = client
+
+        self._config = config
+        db = db_config(config)
+        self._events_max_count = db.events_max_count
+        self._events_max_age = db.events_max_age
+        self._events_inline = db.events_inline
+
+        self._database_name = mongo_db_database_name or config.db.name
+        database = client[self._database_name]
+        self.__policies_repo = PoliciesRepository(database=database)
+        self.__events = database[EVENTS_COLLECTION]
+        self._ensure_indexes()
+        self._migrate_inline_events()
         logger.info("Initialized mongodb store")
 
+    def _ensure_indexes(self) -> None:
+        policies = self.__policies_repo.get_collection()
+        try:
+            names = policies.create_indexes(POLICY_INDEXES)
+            logger.debug("Policies collection indexes: %s", names)
+        except OperationFailure as ex:
+            # e.g. an index with the same name but different keys created by hand
+            logger.error("Cannot create the indexes of the policies collection: %s", ex)
+
+        indexes = list(POLICY_EVENTS_INDEXES)
+        ttl = self.__events.index_information().get("ttl")
+        if ttl and ttl.get("expireAfterSeconds") != self._events_max_age:
+            self.__events.drop_index("ttl")
+        if self._events_max_age:
+            indexes.append(IndexModel([("timestamp", ASCENDING)], name="ttl", expireAfterSeconds=self._events_max_age))
+        try:
+            self.__events.create_indexes(indexes)
+        except OperationFailure as ex:
+            logger.error("Cannot create the indexes of the policy events collection: %s", ex)
+
+    def _migrate_inline_events(self) -> None:
+        """Move the events of the policies stored before the history was kept apart."""
+        policies = self.__policies_repo.get_collection()
+        migrated = 0
+        for doc in policies.find({"status.createdAt": {"$exists": False}}, {"status.events": 1}):
+            events = doc.get("status", {}).get("events", [])
+            if events:
+                self.__events.insert_many([{"policyId": str(doc["_id"])} | e for e in events])
+                self._trim_events(str(doc["_id"]))
+            policies.update_one({"_id": doc["_id"]}, {"$set": {
+                "status.createdAt": events[0]["timestamp"] if events else None,
+                "status.events": events[-self._events_inline:] if self._events_inline else [],
+            }})
+            migrated += 1
+        if migrated:
+            logger.info("Moved the events of %s policies to the %s collection", migrated, EVENTS_COLLECTION)
+
+    def _trim_events(self, policy_id: str) -> None:
+        """Delete the events of a policy beyond the most recent `events_max_count`."""
+        oldest_kept = list(
+            self.__events.find({"policyId": policy_id}, {"timestamp": 1})
+            .sort(EVENTS_NEWEST_FIRST)
+            .skip(self._events_max_count - 1)
+            .limit(1)
+        )
+        if oldest_kept:
+            self.__events.delete_many(trimmed_events_filter(policy_id, oldest_kept[0]))
+
+    def _trim_events_many(self, policy_ids: list[str]) -> None:
+        """Trim the history of the policies that exceed `events_max_count`, finding them with one query."""
+        for doc in self.__events.aggregate(events_over_limit_pipeline(policy_ids, self._events_max_count)):
+            self._trim_events(doc["_id"])
+
+    def _check_versions(self, expected_versions: dict[str, int], session=None) -> None:
+        """Raise `PolicyConflictError` with the policies whose version is not the expected one, reading them once."""
+        ids = [ObjectId(pid) for pid in expected_versions]
+        docs = self.__policies_repo.get_collection().find({"_id": {"$in": ids}}, {"version": 1}, session=session)
+        raise_version_conflicts(*version_conflicts(docs, expected_versions))
+
+    def _update_policies(self, updates: dict[str, dict], expected_versions: dict[str, int] | None = None, session=None) -> None:
+        """Apply an update operator document to each policy, by id, with a single bulk write.
+
+        With `expected_versions` each update is applied only if the policy has not
+        been changed since it was read.
+        """
+        if not updates:
+            return
+        policies = self.__policies_repo.get_collection()
+        res = policies.bulk_write(bulk_updates(updates, expected_versions), ordered=False, session=session)
+        if res.matched_count < len(updates):
+            docs = policies.find({"_id": {"$in": [ObjectId(p) for p in updates]}}, {"version": 1}, session=session)
+            missing, _ = version_conflicts(docs, dict.fromkeys(updates, 0))
+            # the policies changed since their versions were checked
+            raise_version_conflicts(missing, [p for p in updates if p not in missing and expected_versions and p in expected_versions])
+
+    def asynchronous(self) -> AsyncPolmanStorageBackend:
+        if self._url is None:
+            # e.g. a mock client given by the tests: no async counterpart
+            return super().asynchronous()
+        return AsyncMongodbPolicyStore(self._config, self._url, self._database_name)
+
+    def explain_queries(self) -> dict[str, dict]:
+        """Return the explain output of each query shape in POLICY_QUERY_SHAPES."""
+        res = {}
+        for name, shape in POLICY_QUERY_SHAPES.items():
+            cursor = self.__policies_repo.get_collection().find(shape["filter"])
+            if "sort" in shape:
+                cursor = cursor.sort(shape["sort"])
+            res[name] = cursor.explain()
+        return res
+
     def insert(self, policy: Policy) -> Policy:
-        res = self.__policies_repo.save(PolicyDB(**policy.model_dump(exclude={"id"})))
+        return self.insert_many([policy])[0]
 
-        if isinstance(res, UpdateResult):
-            pid = res.upserted_id
-        else:
-            pid = res.inserted_id
-        return self.get(str(pid))
+    def insert_many(self, policies: List[Policy]) -> List[Policy]:
+        """Insert several policies with one write, and their events with another."""
+        ids = [d["_id"] for d in self._insert_policies(policies)]
+        self._trim_events_many([str(oid) for oid in ids])
+        # read back as get() does, with one query
+        stored = {d["_id"]: d for d in self.__policies_repo.get_collection().find({"_id": {"$in": ids}})}
+        return [policy_from_document(stored[oid]) for oid in ids]
+
+    def new_id(self) -> str:
+        return str(ObjectId())
 
-    def _update_existing_policy(self, policy: Policy) -> None:
-        self.__policies_repo.save(PolicyDB(**policy.model_dump()))
+    def _insert_policies(self, policies: List[Policy], session=None) -> list[dict]:
+        """Insert new policies and their events, returning the documents of the policies."""
+        docs, events = new_policy_documents(policies, self._events_inline)
+        if docs:
+            self.__policies_repo.get_collection().insert_many(docs, session=session)
+        if events:
+            self.__events.insert_many(events, session=session)
+        return docs
+
+    def _update_policy(self, policy_id: str, update: dict) -> None:
+        """Apply an atomic update operator document to a single policy, bumping its version."""
+        res = self.__policies_repo.get_collection().update_one({"_id": ObjectId(policy_id)}, with_version_bump(update))
+        if res.matched_count == 0:
+            raise PolicyNotFoundError(policy_id)
 
     def get(self, policy_id: str):
-        res = self.__policies_repo.find_one_by_id(ObjectId(policy_id))
-        if res:
-            return Policy(**res.model_dump())
+        doc = self.__policies_repo.get_collection().find_one({"_id": ObjectId(policy_id)})
+        if doc:
+            return policy_from_document(doc)
         raise PolicyNotFoundError(policy_id)
 
+    def get_copy(self, policy_id: str) -> Policy:
+        # every get() returns a new policy
+        return self.get(policy_id)
+
+    def get_version(self, policy_id: str) -> int:
+        doc = self.__policies_repo.get_collection().find_one({"_id": ObjectId(policy_id)}, VERSION_PROJECTION)
+        if doc:
+            return doc.get("version", 0)
+        raise PolicyNotFoundError(policy_id)
+
+    def apply(self, mutations: List[Mutation], expected_versions: dict[str, int] | None = None) -> None:
+        """Write the mutations merged in a single update for each policy, with one bulk write.
+
+        Nothing is written if a policy has been changed since it was read: the versions
+        of all the policies are checked first, and `PolicyConflictError` reports the
+        ones that changed. On a replica set the check and the writes are a transaction;
+        otherwise a policy changed between the check and the bulk write still has its
+        update discarded, while the others are applied. The new policies are inserted
+        with one more write, after the check.
+        """
+        inserts = [m.args[0] for m in mutations if m.op == "insert"]
+        updates, events, deleted = group_mutations([m for m in mutations if m.op != "insert"], self._events_inline)
+
+        if supports_transactions(self._client):
+            with self._client.start_session() as session, session.start_transaction():
+                self._write(inserts, updates, events, deleted, expected_versions, session)
+        else:
+            self._write(inserts, updates, events, deleted, expected_versions)
+
+        if events or inserts:
+            # outside of the transaction: trimming again is harmless
+            self._trim_events_many(list({e["policyId"] for e in events} | {p.id for p in inserts}))
+
+    def _write(
+        self, inserts: List[Policy], updates: dict[str, dict], events: List[dict], deleted: List[str],
+        expected_versions, session=None,
+    ) -> None:
+        if expected_versions:
+            self._check_versions(expected_versions, session)
+
+        if inserts:
+            self._insert_policies(inserts, session)
+
+        self._update_policies(updates, expected_versions, session)
+
+        if events:
+            self.__events.insert_many(events, session=session)
+
+        if deleted:
+            self.__policies_repo.get_collection().delete_many({"_id": {"$in": [ObjectId(pid) for pid in deleted]}}, session=session)
+            self.__events.delete_many({"policyId": {"$in": deleted}}, session=session)
+
     def add_policy_event(self, policy_id: str, event: PolicyEvent) -> None:
-        p = self.get(policy_id)
-        p.status.events.append(event)
-        self._update_existing_policy(p)
+        self._update_policy(policy_id, mutation_update("add_policy_event", (event,), self._events_inline))
+        self.__events.insert_one({"policyId": policy_id} | event.model_dump())
+        self._trim_events(policy_id)
+
+    def list_events(self, policy_id: str, skip: int = 0, limit: int = 100) -> List[PolicyEvent]:
+        docs = list(
+            self.__events.find({"policyId": policy_id}, {"_id": 0, "policyId": 0})
+            .sort(EVENTS_OLDEST_FIRST)
+            .skip(skip)
+            .limit(limit)
+        )
+        if not docs:
+            # tell an empty page from a missing policy
+            self.get(policy_id)
+        return [PolicyEvent.model_validate(d) for d in docs]
 
     def set_policy_phase(self, policy_id: str, phase: PolicyPhase) -> None:
-        p = self.get(policy_id)
-        p.status.phase = phase
-        self._update_existing_policy(p)
+        self._update_policy(policy_id, mutation_update("set_policy_phase", (phase,), self._events_inline))
 
     def update_measurement_backend(self, policy_id: str, name: str, status: dict) -> None:
-        p = self.get(policy_id)
-        p.status.measurementBackends[name] = status
-        self._update_existing_policy(p)
+        self._update_policy(policy_id, mutation_update("update_measurement_backend", (name, status), self._events_inline))
 
     def delete_measurement_backend(self, policy_id: str, name: str) -> None:
         """Delete a measurement backend status."""
-        p = self.get(policy_id)
-        del p.status.measurementBackends[name]
-        self._update_existing_policy(p)
+        self._update_policy(policy_id, mutation_update("delete_measurement_backend", (name,), self._events_inline))
 
     def list(self, filters={}) -> list[Policy]:
-        return [Policy(**p.model_dump()) for p in self.__policies_repo.find_by(filters)]
+        return [policy_from_document(d) for d in self.__policies_repo.get_collection().find(mongo_filter(filters))]
+
+    def list_summaries(self, filters={}) -> List[PolicySummary]:
+        docs = self.__policies_repo.get_collection().aggregate(
+            [{"$match": mongo_filter(filters)}, {"$project": POLICY_SUMMARY_PROJECTION}]
+        )
+        return [PolicySummary.model_validate(d) for d in docs]
+
+    def list_page(self, filters={}, page: Page = Page()) -> List[Policy]:
+        query, sort = page_query(filters, page)
+        # a limit of 0 reads all the documents
+        docs = self.__policies_repo.get_collection().find(query).sort(list(sort.items())).limit(page.limit or 0)
+        return [policy_from_document(d) for d in docs]
+
+    def list_summaries_page(self, filters={}, page: Page = Page()) -> List[PolicySummary]:
+        docs = self.__policies_repo.get_collection().aggregate(page_summaries_pipeline(filters, page))
+        return [PolicySummary.model_validate(d) for d in docs]
 
     def delete(self, policy_id: str) -> Policy:
-        o = self.__policies_repo.find_one_by_id(ObjectId(policy_id))
-        if not o:
+        doc = self.__policies_repo.get_collection().find_one_and_delete({"_id": ObjectId(policy_id)})
+        if not doc:
             raise PolicyNotFoundError(policy_id)
-        self.__policies_repo.delete(o)
-        return Policy(**o.model_dump())
+        self.__events.delete_many({"policyId": policy_id})
+        return policy_from_document(doc)
+
+    def set_phase_many(self, policy_ids: List[str], phase: PolicyPhase) -> None:
+        self._update_many(policy_ids, mutation_update("set_policy_phase", (phase,), self._events_inline))
+
+    def add_event_many(self, policy_ids: List[str], event: PolicyEvent) -> None:
+        if not policy_ids:
+            return
+        self._update_many(policy_ids, mutation_update("add_policy_event", (event,), self._events_inline))
+        doc = event.model_dump()
+        self.__events.insert_many([{"policyId": pid} | doc for pid in policy_ids])
+        self._trim_events_many(list(policy_ids))
+
+    def update_measurement_backend_many(self, name: str, statuses: dict[str, dict]) -> None:
+        self._update_policies({
+            pid: mutation_update("update_measurement_backend", (name, status), self._events_inline)
+            for pid, status in statuses.items()
+        })
+
+    def delete_many(self, policy_ids: List[str]) -> List[Policy]:
+        policies = self.__policies_repo.get_collection()
+        docs = {str(d["_id"]): d for d in policies.find({"_id": {"$in": [ObjectId(p) for p in policy_ids]}})}
+        for pid in policy_ids:
+            if pid not in docs:
+                raise PolicyNotFoundError(pid)
+        policies.delete_many({"_id": {"$in": [d["_id"] for d in docs.values()]}})
+        self.__events.delete_many({"policyId": {"$in": list(docs)}})
+        return [policy_from_document(docs[pid]) for pid in policy_ids]
+
+    def _update_many(self, policy_ids: List[str], update: dict) -> None:
+        """Apply the same update operator document to several policies with one query."""
+        if not policy_ids:
+            return
+        oids = [ObjectId(pid) for pid in policy_ids]
+        policies = self.__policies_repo.get_collection()
+        res = policies.update_many({"_id": {"$in": oids}}, with_version_bump(update))
+        if res.matched_count < len(set(oids)):
+            found = {str(d["_id"]) for d in policies.find({"_id": {"$in": oids}}, {"_id": 1})}
+            raise PolicyNotFoundError(next(pid for pid in policy_ids if pid not in found))
 
     def set_rendered_spec(self, policy_id: str, spec: PolicySpec) -> None:
-        p = self.get(policy_id)
-        p.status.renderedSpec = spec
-        self._update_existing_policy(p)        
+        self._update_policy(policy_id, mutation_update("set_rendered_spec", (spec,), self._events_inline))
 
     def set_variable(self, policy_id: str, name: str, value: PolicyVariableType|None) -> None:
-        p = self.get(policy_id)
-        if not value:
-            del p.variables[name]
+        self._update_policy(policy_id, mutation_update("set_variable", (name, value), self._events_inline))
+
+
+def policy_from_document(doc: dict) -> Policy:
+    """Validate a policy read from the database, without going through `PolicyDB`."""
+    doc["id"] = str(doc.pop("_id"))
+    return Policy.model_validate(doc)
+
+
+class AsyncMongodbPolicyStore(AsyncPolmanStorageBackend):
+    """The async API of `MongodbPolicyStore`, built on the asyncio client of pymongo.
+
+    Indexes and migrations are left to the `MongodbPolicyStore` on the same database.
+    """
+
+    def __init__(self, config, url: str, database_name: str) -> None:
+        db = db_config(config)
+        self._events_max_count = db.events_max_count
+        self._events_inline = db.events_inline
+
+        # the client binds to the event loop of its first operation
+        self._client = pymongo.AsyncMongoClient(url)
+        database = self._client[database_name]
+        self._policies = database[PoliciesRepository.Meta.collection_name]
+        self._events = database[EVENTS_COLLECTION]
+
+    async def _trim_events(self, policy_id: str) -> None:
+        oldest_kept = await (
+            self._events.find({"policyId": policy_id}, {"timestamp": 1})
+            .sort(EVENTS_NEWEST_FIRST)
+            .skip(self._events_max_count - 1)
+            .limit(1)
+            .to_list()
+        )
+        if oldest_kept:
+            await self._events.delete_many(trimmed_events_filter(policy_id, oldest_kept[0]))
+
+    async def insert(self, policy: Policy) -> Policy:
+        pid = str((await self._insert_policies([policy]))[0]["_id"])
+        await self._trim_events(pid)
+        return await self.get(pid)
+
+    async def _insert_policies(self, policies: List[Policy], session=None) -> list[dict]:
+        """Insert new policies and their events (see `MongodbPolicyStore._insert_policies`)."""
+        docs, events = new_policy_documents(policies, self._events_inline)
+        if docs:
+            await self._policies.insert_many(docs, session=session)
+        if events:
+            await self._events.insert_many(events, session=session)
+        return docs
+
+    async def get(self, policy_id: str) -> Policy:
+        doc = await self._policies.find_one({"_id": ObjectId(policy_id)})
+        if doc:
+            return policy_from_document(doc)
+        raise PolicyNotFoundError(policy_id)
+
+    async def get_copy(self, policy_id: str) -> Policy:
+        return await self.get(policy_id)
+
+    async def get_version(self, policy_id: str) -> int:
+        doc = await self._policies.find_one({"_id": ObjectId(policy_id)}, VERSION_PROJECTION)
+        if doc:
+            return doc.get("version", 0)
+        raise PolicyNotFoundError(policy_id)
+
+    async def list(self, filters={}) -> List[Policy]:
+        return [policy_from_document(d) async for d in self._policies.find(mongo_filter(filters))]
+
+    async def list_summaries(self, filters={}) -> List[PolicySummary]:
+        cursor = await self._policies.aggregate([{"$match": mongo_filter(filters)}, {"$project": POLICY_SUMMARY_PROJECTION}])
+        return [PolicySummary.model_validate(d) async for d in cursor]
+
+    async def list_page(self, filters={}, page: Page = Page()) -> List[Policy]:
+        query, sort = page_query(filters, page)
+        cursor = self._policies.find(query).sort(list(sort.items())).limit(page.limit or 0)
+        return [policy_from_document(d) async for d in cursor]
+
+    async def list_summaries_page(self, filters={}, page: Page = Page()) -> List[PolicySummary]:
+        cursor = await self._policies.aggregate(page_summaries_pipeline(filters, page))
+        return [PolicySummary.model_validate(d) async for d in cursor]
+
+    async def list_events(self, policy_id: str, skip: int = 0, limit: int = 100) -> List[PolicyEvent]:
+        docs = await (
+            self._events.find({"policyId": policy_id}, {"_id": 0, "policyId": 0})
+            .sort(EVENTS_OLDEST_FIRST)
+            .skip(skip)
+            .limit(limit)
+            .to_list()
+        )
+        if not docs:
+            await self.get(policy_id)
+        return [PolicyEvent.model_validate(d) for d in docs]
+
+    async def delete(self, policy_id: str) -> Policy:
+        doc = await self._policies.find_one_and_delete({"_id": ObjectId(policy_id)})
+        if not doc:
+            raise PolicyNotFoundError(policy_id)
+        await self._events.delete_many({"policyId": policy_id})
+        return policy_from_document(doc)
+
+    async def apply(self, mutations: List[Mutation], expected_versions: dict[str, int] | None = None) -> None:
+        """Write the mutations, all or none of them (see `MongodbPolicyStore.apply`)."""
+        inserts = [m.args[0] for m in mutations if m.op == "insert"]
+        updates, events, deleted = group_mutations([m for m in mutations if m.op != "insert"], self._events_inline)
+
+        if supports_transactions(self._client):
+            async with self._client.start_session() as session:
+                async with await session.start_transaction():
+                    await self._write(inserts, updates, events, deleted, expected_versions, session)
         else:
-            p.variables[name] = value
-        self._update_existing_policy(p)  
\ No newline at end of file
+            await self._write(inserts, updates, events, deleted, expected_versions)
+
+        if events or inserts:
+            policy_ids = list({e["policyId"] for e in events} | {p.id for p in inserts})
+            cursor = await self._events.aggregate(events_over_limit_pipeline(policy_ids, self._events_max_count))
+            async for doc in cursor:
+                await self._trim_events(doc["_id"])
+
+    async def _write(
+        self, inserts: List[Policy], updates: dict[str, dict], events: List[dict], deleted: List[str],
+        expected_versions, session=None,
+    ) -> None:
+        if expected_versions:
+            ids = [ObjectId(pid) for pid in expected_versions]
+            docs = await self._policies.find({"_id": {"$in": ids}}, {"version": 1}, session=session).to_list()
+            raise_version_conflicts(*version_conflicts(docs, expected_versions))
+
+        if inserts:
+            await self._insert_policies(inserts, session)
+
+        if updates:
+            res = await self._policies.bulk_write(bulk_updates(updates, expected_versions), ordered=False, session=session)
+            if res.matched_count < len(updates):
+                ids = [ObjectId(p) for p in updates]
+                docs = await self._policies.find({"_id": {"$in": ids}}, {"version": 1}, session=session).to_list()
+                missing, _ = version_conflicts(docs, dict.fromkeys(updates, 0))
+                raise_version_conflicts(missing, [p for p in updates if p not in missing and expected_versions and p in expected_versions])
+
+        if events:
+            await self._events.insert_many(events, session=session)
+
+        if deleted:
+            await self._policies.delete_many({"_id": {"$in": [ObjectId(pid) for pid in deleted]}}, session=session)
+            await self._events.delete_many({"policyId": {"$in": deleted}}, session=session)
@@ -0,0 +1,132 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+"""Encodings of the snapshots written by the file backend.
+
+A `json` snapshot without compression is a plain json list of policies, as written
+by the previous versions. An `orjson` snapshot is the same json list, parsed faster
+with orjson. Any other snapshot starts with a header line, `MAGIC`
+followed by a json object with the format and the compression of the payload:
+
+    POLMAN-SNAPSHOT {"format": "msgpack", "compression": "zstd"}
+    <payload>
+
+orjson, msgpack and zstandard are optional dependencies, listed in
+snapshot-requirements.txt and required only by the encodings that use them.
+
+The file backend validates the policies lazily: `decode(raw=True)` returns the
+documents as they are, and `encode()` accepts them mixed with `Policy` objects.
+"""
+
+import importlib
+import json
+from types import ModuleType
+from typing import Any, Union
+
+from pydantic import TypeAdapter
+
+from polman.common.config import SnapshotFormat
+from polman.common.errors import PolmanError
+from polman.common.model import Policy
+
+MAGIC = b"POLMAN-SNAPSHOT "
+
+_policies_adapter: TypeAdapter[list[Policy]] = TypeAdapter(list[Policy])
+_document_adapter: TypeAdapter[Any] = TypeAdapter(Any)
+
+# a policy, or its document as decoded from a snapshot
+Record = Union[Policy, dict[str, Any]]
+
+
+def _require(module: str) -> ModuleType:
+    try:
+        return importlib.import_module(module)
+    except ImportError as ex:
+        raise PolmanError(f"The snapshot encoding requires the '{module}' package: pip install {module}") from ex
+
+
+def check_encoding(fmt: SnapshotFormat, zstd: bool) -> None:
+    """Raise `PolmanError` if the packages needed by an encoding are not installed."""
+    if fmt in (SnapshotFormat.ORJSON, SnapshotFormat.MSGPACK):
+        _require(fmt.value)
+    if zstd:
+        _require("zstandard")
+
+
+def _dump_json(record: Record) -> bytes:
+    if isinstance(record, Policy):
+        return Policy.__pydantic_serializer__.to_json(record)
+    return _document_adapter.dump_json(record)
+
+
+def _dump_python(record: Record) -> dict[str, Any]:
+    return record.model_dump(mode="json") if isinstance(record, Policy) else record
+
+
+def encode(policies: list[Record], fmt: SnapshotFormat, zstd: bool = False) -> bytes:
+    """Encode the policies, or their raw documents, of a snapshot."""
+    if fmt is SnapshotFormat.MSGPACK:
+        payload = _require("msgpack").packb([_dump_python(p) for p in policies])
+    else:
+        # serialized by pydantic without going through python dicts: the same output as
+        # orjson, and faster than a list[Policy | dict] adapter that resolves the union
+        payload = b"[" + b",".join(_dump_json(p) for p in policies) + b"]"
+
+    if fmt is SnapshotFormat.JSON and not zstd:
+        return payload
+
+    if zstd:
+        payload = _require("zstandard").ZstdCompressor().compress(payload)
+    header = json.dumps({"format": fmt.value, "compression": "zstd" if zstd else None}).encode()
+    return MAGIC + header + b"\n" + payload
+
+
+def decode(data: bytes, raw: bool = False) -> tuple[list[Record], SnapshotFormat, bool]:
+    """Decode and validate the policies of a snapshot, returning them with its format and compression.
+
+    With `raw` the documents are returned without validating them.
+    """
+    if not data.startswith(MAGIC):
+        return _validate(json.loads(data), raw), SnapshotFormat.JSON, False
+
+    header, payload = data[len(MAGIC):].split(b"\n", 1)
+    options = json.loads(header)
+    fmt = SnapshotFormat(options["format"])
+    zstd = options.get("compression") == "zstd"
+
+    if zstd:
+        payload = _require("zstandard").ZstdDecompressor().decompress(payload)
+    if fmt is SnapshotFormat.ORJSON:
+        documents = _require("orjson").loads(payload)
+    elif fmt is SnapshotFormat.MSGPACK:
+        documents = _require("msgpack").unpackb(payload)
+    else:
+        documents = json.loads(payload)
+    return _validate(documents, raw), fmt, zstd
+
+
+def _validate(documents: list[dict[str, Any]], raw: bool) -> list[Record]:
+    if not isinstance(documents, list) or not all(isinstance(d, dict) and "id" in d for d in documents):
+        raise PolmanError("The snapshot is not a list of policies")
+    if raw:
+        return documents
+    # validated with a single call, but not with validate_json() that is slower: it
+    # converts the enums in python
+    return _policies_adapter.validate_python(documents)
@@ -0,0 +1,382 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from enum import Enum
+from typing import Any, List
+
+from polman.common.errors import PolicyConflictError, PolicyNotFoundError
+from polman.common.model import Policy, PolicyEvent, PolicyEventType, PolicyPhase, PolicySpec, PolicySummary, PolicyVariableType
+from .main import SORT_KEYS, Page, PolmanStorageBackend, Prefix, db_config
+
+logger = logging.getLogger(__name__)
+
+# policy fields stored in their own column, to be indexed
+COLUMNS = {
+    "id": "id",
+    "name": "name",
+    "subject.type": "subject_type",
+    "subject.appName": "app_name",
+    "subject.appComponent": "app_component",
+    "subject.appInstance": "app_instance",
+    "subject.hostId": "host_id",
+    "subject.agentId": "agent_id",
+    "status.phase": "phase",
+    "status.createdAt": "created_at",
+}
+
+# the strings starting with a prefix sort before the prefix followed by the last code point
+PREFIX_UPPER_BOUND = "\U0010ffff"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS policies (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    subject_type TEXT,
+    app_name TEXT,
+    app_component TEXT,
+    app_instance TEXT,
+    host_id TEXT,
+    agent_id TEXT,
+    phase TEXT NOT NULL,
+    created_at TEXT,
+    version INTEGER NOT NULL DEFAULT 0,
+    -- the policy without the fields above, with only the inline events
+    document TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS policies_name ON policies (name);
+CREATE INDEX IF NOT EXISTS policies_subject_app ON policies (subject_type, app_instance);
+CREATE INDEX IF NOT EXISTS policies_app_name ON policies (app_name, app_component);
+CREATE INDEX IF NOT EXISTS policies_host ON policies (host_id, agent_id);
+CREATE INDEX IF NOT EXISTS policies_phase ON policies (phase);
+CREATE INDEX IF NOT EXISTS policies_created_at ON policies (created_at);
+
+CREATE TABLE IF NOT EXISTS policy_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    policy_id TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    event TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS policy_events_policy_seq ON policy_events (policy_id, seq);
+"""
+
+# the statements are constant strings: sqlite3 prepares each of them once per connection
+SELECT_POLICY = "SELECT id, phase, created_at, version, document FROM policies"
+SELECT_SUMMARY = "SELECT id, name, json_extract(document, '$.subject'), phase, created_at FROM policies"
+SELECT_VERSION = "SELECT version FROM policies WHERE id = ?"
+# a no-op update: it matches only the expected version and takes the write lock until the commit
+CHECK_VERSION = "UPDATE policies SET version = version WHERE id = ? AND version = ?"
+INSERT_POLICY = (
+    "INSERT INTO policies (id, name, subject_type, app_name, app_component, app_instance, host_id, agent_id,"
+    " phase, created_at, version, document) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+DELETE_POLICY = "DELETE FROM policies WHERE id = ?"
+SET_PHASE = "UPDATE policies SET phase = ?, version = version + 1 WHERE id = ?"
+SET_CREATED_AT = "UPDATE policies SET created_at = ? WHERE id = ?"
+# append an event to the inline events, dropping the oldest one when they are already `events_inline`
+PUSH_INLINE_EVENT = """
+UPDATE policies SET version = version + 1, document = CASE
+    WHEN json_array_length(document, '$.status.events') >= :inline
+    THEN json_insert(json_remove(document, '$.status.events[0]'), '$.status.events[#]', json(:event))
+    ELSE json_insert(document, '$.status.events[#]', json(:event))
+END WHERE id = :id
+"""
+BUMP_VERSION = "UPDATE policies SET version = version + 1 WHERE id = ?"
+SET_DOCUMENT_FIELD = "UPDATE policies SET document = json_set(document, ?, json(?)), version = version + 1 WHERE id = ?"
+REMOVE_DOCUMENT_FIELD = "UPDATE policies SET document = json_remove(document, ?), version = version + 1 WHERE id = ?"
+INSERT_EVENT = "INSERT INTO policy_events (policy_id, timestamp, event) VALUES (?, ?, ?)"
+SELECT_EVENTS = (
+    "SELECT event FROM policy_events WHERE policy_id = ? AND timestamp >= ? ORDER BY seq LIMIT ? OFFSET ?"
+)
+TRIM_EVENTS = """
+DELETE FROM policy_events WHERE policy_id = :id AND (timestamp < :oldest OR seq <= (
+    SELECT seq FROM policy_events WHERE policy_id = :id ORDER BY seq DESC LIMIT 1 OFFSET :max_count
+))
+"""
+DELETE_EVENTS = "DELETE FROM policy_events WHERE policy_id = ?"
+
+
+def json_path(*keys: str) -> str:
+    """Return the sqlite json path of a field (e.g. "$.variables."my-var"")."""
+    return "$" + "".join("." + json.dumps(k) for k in keys)
+
+
+def _normalize(value: Any) -> Any:
+    return value.value if isinstance(value, Enum) else value
+
+
+def where_clause(filters: dict) -> tuple[str, list]:
+    """Translate mongo-like equality and `Prefix` filters on dotted paths into a sql condition.
+
+    Filters on `COLUMNS` use the indexed columns, the others are evaluated on the
+    json document.
+    """
+    if not filters:
+        return "", []
+    conditions, params = [], []
+    for path, value in filters.items():
+        if path in COLUMNS:
+            field, field_params = COLUMNS[path], []
+        else:
+            field, field_params = "json_extract(document, ?)", [json_path(*path.split("."))]
+        if isinstance(value, Prefix):
+            # a range rather than LIKE, that sqlite cannot match with the indexes
+            conditions.append(f"{field} >= ? AND {field} < ?")
+            params += field_params + [value.prefix] + field_params + [value.prefix + PREFIX_UPPER_BOUND]
+        else:
+            conditions.append(f"{field} = ?")
+            params += field_params + [_normalize(value)]
+    return " WHERE " + " AND ".join(conditions), params
+
+
+def page_clause(filters: dict, page: Page) -> tuple[str, list]:
+    """Return the condition, the order and the limit reading a page of the policies (see `Page`).
+
+    Like sqlite, the pages sort NULL before all the other values.
+    """
+    where, params = where_clause(filters)
+    column = COLUMNS[SORT_KEYS[page.sort_by]]
+    direction = "DESC" if page.descending else "ASC"
+
+    if page.after is not None:
+        value, policy_id = page.after
+        op = "<" if page.descending else ">"
+        if value is None:
+            after = f"({column} IS NULL AND id {op} ?)" if page.descending else f"({column} IS NOT NULL OR id > ?)"
+            after_params = [policy_id]
+        else:
+            value = _normalize(value.isoformat() if hasattr(value, "isoformat") else value)
+            nulls = f" OR {column} IS NULL" if page.descending else ""
+            after = f"({column} {op} ?{nulls} OR ({column} = ? AND id {op} ?))"
+            after_params = [value, value, policy_id]
+        where = (where + " AND " if where else " WHERE ") + after
+        params += after_params
+
+    # a negative limit reads all the rows
+    limit = page.limit if page.limit is not None else -1
+    return f"{where} ORDER BY {column} {direction}, id {direction} LIMIT ?", params + [limit]
+
+
+class SqlitePolmanStorage(PolmanStorageBackend):
+    """A backend storing policies in a sqlite database, for single node deployments.
+
+    The fields used by the queries (`COLUMNS`) are indexed columns, while the rest of
+    the policy is a json document updated in place with the sqlite json functions.
+    The event history is stored in the `policy_events` table.
+
+    The database runs in WAL mode: readers do not block the writer and each change
+    is committed with a single append to the log. Each thread uses its own
+    connection, and the changes made inside a `batch()` are committed together, or
+    rolled back together if it raises.
+    """
+
+    def __init__(self, config) -> None:
+        db = db_config(config)
+        self._file = db.url
+        self._events_max_count = db.events_max_count
+        self._events_max_age = db.events_max_age
+        self._events_inline = db.events_inline
+        self._local = threading.local()
+
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+        logger.info("Initialized sqlite store %s", self._file)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "connection", None)
+        if conn is None:
+            conn = sqlite3.connect(self._file, timeout=30, cached_statements=256)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # with WAL a crash of the process never loses committed changes
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = conn
+        return conn
+
+    def _in_batch(self) -> bool:
+        return getattr(self._local, "batch_depth", 0) > 0
+
+    @contextmanager
+    def _write(self):
+        """Run the statements of a change in the current transaction, committed unless in a batch."""
+        conn = self._connection()
+        try:
+            yield conn
+        except Exception:
+            if not self._in_batch():
+                conn.rollback()
+            raise
+        if not self._in_batch():
+            conn.commit()
+
+    def _update(self, conn: sqlite3.Connection, sql: str, params) -> None:
+        if conn.execute(sql, params).rowcount == 0:
+            raise PolicyNotFoundError(params["id"] if isinstance(params, dict) else params[-1])
+
+    def _oldest_timestamp(self) -> float:
+        return time.time() - self._events_max_age if self._events_max_age else 0
+
+    def _insert_events(self, conn: sqlite3.Connection, policy_id: str, events: list[PolicyEvent]) -> None:
+        conn.executemany(INSERT_EVENT, [(policy_id, e.timestamp.timestamp(), e.model_dump_json()) for e in events])
+        conn.execute(TRIM_EVENTS, {"id": policy_id, "oldest": self._oldest_timestamp(), "max_count": self._events_max_count})
+
+    @staticmethod
+    def _policy_from_row(row) -> Policy:
+        pid, phase, created_at, version, document = row
+        doc = json.loads(document)
+        doc["status"] |= {"phase": phase, "createdAt": created_at}
+        return Policy.model_validate(doc | {"id": pid, "version": version})
+
+    @staticmethod
+    def _summary_from_row(row) -> PolicySummary:
+        pid, name, subject, phase, created_at = row
+        return PolicySummary.model_validate({
+            "id": pid, "name": name, "subject": json.loads(subject), "phase": phase, "creationTime": created_at,
+        })
+
+    #
+    # PolmanStorageBackend
+    #
+
+    @contextmanager
+    def batch(self):
+        """Run the changes of the block in one transaction, rolled back if the outermost block raises."""
+        self._local.batch_depth = getattr(self._local, "batch_depth", 0) + 1
+        try:
+            yield
+        except BaseException:
+            self._local.batch_depth -= 1
+            if not self._in_batch():
+                self._connection().rollback()
+            raise
+        self._local.batch_depth -= 1
+        if not self._in_batch():
+            self._connection().commit()
+
+    def check_versions(self, expected_versions: dict[str, int]) -> None:
+        with self._write() as conn:
+            for pid, version in expected_versions.items():
+                if conn.execute(CHECK_VERSION, (pid, version)).rowcount == 0:
+                    self.get_version(pid)
+                    raise PolicyConflictError(pid)
+
+    def insert(self, policy: Policy) -> Policy:
+        events = policy.status.events
+        created_at = policy.status.createdAt or (events[0].timestamp if events else None)
+        inline = events[-self._events_inline:] if self._events_inline else []
+        document = policy.model_dump(mode="json", exclude={"id": True, "version": True, "status": {"phase", "createdAt", "events"}})
+        document["status"]["events"] = [e.model_dump(mode="json") for e in inline]
+        subject = policy.subject.model_dump()
+
+        with self._write() as conn:
+            conn.execute(INSERT_POLICY, (
+                policy.id, policy.name, subject.get("type"), subject.get("appName"), subject.get("appComponent"),
+                subject.get("appInstance"), subject.get("hostId"), subject.get("agentId"),
+                PolicyPhase(policy.status.phase).value, created_at.isoformat() if created_at else None,
+                policy.version, json.dumps(document),
+            ))
+            if events:
+                self._insert_events(conn, policy.id, events)
+        return self.get(policy.id)
+
+    def get(self, policy_id: str) -> Policy:
+        row = self._connection().execute(SELECT_POLICY + " WHERE id = ?", (policy_id,)).fetchone()
+        if row is None:
+            raise PolicyNotFoundError(policy_id)
+        return self._policy_from_row(row)
+
+    def get_copy(self, policy_id: str) -> Policy:
+        # every get() returns a new policy
+        return self.get(policy_id)
+
+    def get_version(self, policy_id: str) -> int:
+        row = self._connection().execute(SELECT_VERSION, (policy_id,)).fetchone()
+        if row is None:
+            raise PolicyNotFoundError(policy_id)
+        return row[0]
+
+    def list(self, filters={}) -> List[Policy]:
+        where, params = where_clause(filters)
+        return [self._policy_from_row(r) for r in self._connection().execute(SELECT_POLICY + where, params)]
+
+    def list_summaries(self, filters={}) -> List[PolicySummary]:
+        where, params = where_clause(filters)
+        return [self._summary_from_row(r) for r in self._connection().execute(SELECT_SUMMARY + where, params)]
+
+    def list_page(self, filters={}, page: Page = Page()) -> List[Policy]:
+        clause, params = page_clause(filters, page)
+        return [self._policy_from_row(r) for r in self._connection().execute(SELECT_POLICY + clause, params)]
+
+    def list_summaries_page(self, filters={}, page: Page = Page()) -> List[PolicySummary]:
+        clause, params = page_clause(filters, page)
+        return [self._summary_from_row(r) for r in self._connection().execute(SELECT_SUMMARY + clause, params)]
+
+    def delete(self, policy_id: str) -> Policy:
+        with self._write() as conn:
+            res = self.get(policy_id)
+            conn.execute(DELETE_POLICY, (policy_id,))
+            conn.execute(DELETE_EVENTS, (policy_id,))
+        return res
+
+    def add_policy_event(self, policy_id: str, event: PolicyEvent) -> None:
+        with self._write() as conn:
+            if self._events_inline:
+                params = {"id": policy_id, "inline": self._events_inline, "event": event.model_dump_json()}
+                self._update(conn, PUSH_INLINE_EVENT, params)
+            else:
+                self._update(conn, BUMP_VERSION, (policy_id,))
+            if event.type == PolicyEventType.Created:
+                conn.execute(SET_CREATED_AT, (event.timestamp.isoformat(), policy_id))
+            self._insert_events(conn, policy_id, [event])
+
+    def list_events(self, policy_id: str, skip: int = 0, limit: int = 100) -> List[PolicyEvent]:
+        rows = self._connection().execute(SELECT_EVENTS, (policy_id, self._oldest_timestamp(), limit, skip)).fetchall()
+        if not rows:
+            self.get_version(policy_id)
+        return [PolicyEvent.model_validate_json(r[0]) for r in rows]
+
+    def set_policy_phase(self, policy_id: str, phase: PolicyPhase) -> None:
+        with self._write() as conn:
+            self._update(conn, SET_PHASE, (PolicyPhase(phase).value, policy_id))
+
+    def update_measurement_backend(self, policy_id: str, name: str, status: dict) -> None:
+        with self._write() as conn:
+            path = json_path("status", "measurementBackends", name)
+            self._update(conn, SET_DOCUMENT_FIELD, (path, json.dumps(status), policy_id))
+
+    def delete_measurement_backend(self, policy_id: str, name: str) -> None:
+        with self._write() as conn:
+            self._update(conn, REMOVE_DOCUMENT_FIELD, (json_path("status", "measurementBackends", name), policy_id))
+
+    def set_rendered_spec(self, policy_id: str, spec: PolicySpec) -> None:
+        with self._write() as conn:
+            self._update(conn, SET_DOCUMENT_FIELD, (json_path("status", "renderedSpec"), spec.model_dump_json(), policy_id))
+
+    def set_variable(self, policy_id: str, name: str, value: PolicyVariableType|None) -> None:
+        with self._write() as conn:
+            if not value:
+                self._update(conn, REMOVE_DOCUMENT_FIELD, (json_path("variables", name), policy_id))
+            else:
+                self._update(conn, SET_DOCUMENT_FIELD, (json_path("variables", name), json.dumps(value), policy_id))
@@ -0,0 +1,111 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+
+import threading
+from collections import OrderedDict
+
+from polman.common.errors import PolicyNotFoundError
+from polman.common.model import Policy
+from polman.meter.main import PolmanMeter
+from polman.storage.backend.main import AsyncPolmanStorageBackend, PolmanStorageBackend
+
+
+class PolicyCache:
+    """A LRU cache of validated policies, in front of a storage backend.
+
+    Every policy stored by the backends has a `version` that is incremented at each
+    change. A cached policy is returned only if its version is still the one stored
+    by the backend, which is read without loading the policy: this keeps the cache
+    coherent with the changes made by other replicas sharing the same database.
+
+    Cached policies are shared between callers and must not be modified.
+    """
+
+    def __init__(self, size: int, pm: PolmanMeter) -> None:
+        self._size = size
+        self._pm = pm
+        self._policies: OrderedDict[str, Policy] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, policy_id: str) -> bool:
+        return policy_id in self._policies
+
+    def __len__(self) -> int:
+        return len(self._policies)
+
+    def _lookup(self, policy_id: str, version: int) -> Policy | None:
+        with self._lock:
+            policy = self._policies.get(policy_id)
+            if policy is not None and policy.version == version:
+                self._policies.move_to_end(policy_id)
+                self._pm.add_cache_hit()
+                return policy
+            # stale: changed by another replica
+            self._policies.pop(policy_id, None)
+        self._pm.add_cache_miss()
+        return None
+
+    def _put(self, policy: Policy) -> Policy:
+        evicted = 0
+        with self._lock:
+            self._policies[policy.id] = policy
+            self._policies.move_to_end(policy.id)
+            while len(self._policies) > self._size:
+                self._policies.popitem(last=False)
+                evicted += 1
+        if evicted:
+            self._pm.add_cache_eviction(evicted)
+        return policy
+
+    def invalidate(self, policy_id: str) -> None:
+        """Drop a policy that has been changed or deleted."""
+        with self._lock:
+            self._policies.pop(policy_id, None)
+
+    def get(self, policy_id: str, backend: PolmanStorageBackend) -> Policy:
+        """Return a policy from the cache if it is still current, otherwise from the backend."""
+        if policy_id in self._policies:
+            try:
+                version = backend.get_version(policy_id)
+            except PolicyNotFoundError:
+                self.invalidate(policy_id)
+                raise
+            policy = self._lookup(policy_id, version)
+            if policy is not None:
+                return policy
+        else:
+            self._pm.add_cache_miss()
+        return self._put(backend.get(policy_id))
+
+    async def get_async(self, policy_id: str, backend: AsyncPolmanStorageBackend) -> Policy:
+        """The async counterpart of `get`."""
+        if policy_id in self._policies:
+            try:
+                version = await backend.get_version(policy_id)
+            except PolicyNotFoundError:
+                self.invalidate(policy_id)
+                raise
+            policy = self._lookup(policy_id, version)
+            if policy is not None:
+                return policy
+        else:
+            self._pm.add_cache_miss()
+        return self._put(await backend.get(policy_id))
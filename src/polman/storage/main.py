@@ -18,18 +18,31 @@
 # and innovation programme under grant agreement No. 101070177.
 #
 
+import asyncio
+import itertools
 import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
 from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Iterator, List
 
 from polman.common.config import DBType, PolmanConfig
+from polman.common.errors import PolicyConflictError, PolicyNotFoundError
 from polman.common.logging import log_object
-from polman.common.model import Policy, PolicyEvent, PolicyPhase, PolicySpec, PolicyVariableType
+from polman.common.model import Policy, PolicyEvent, PolicyPhase, PolicySpec, PolicySummary, PolicyVariableType
 from polman.common.service import PolmanService
 from polman.meter.main import PolmanMeter
-from polman.storage.backend.main import PolmanStorageBackend
+from polman.storage.backend.main import (
+    AsyncPolmanStorageBackend, Mutation, Page, PolmanStorageBackend, copy_policy, db_config, sort_value,
+)
 from polman.storage.backend.memory import InMemoryPolmanStorage
 from polman.storage.backend.file import FilePolmanStorage
 from polman.storage.backend.mongo import MongodbPolicyStore
+from polman.storage.backend.sqlite import SqlitePolmanStorage
+from polman.storage.cache import PolicyCache
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +50,61 @@ logger = logging.getLogger(__name__)
 #
 #
 
+class _UnitOfWork:
+    """The mutations buffered by `PolmanStorage.batch()` and the policies they apply to."""
+
+    def __init__(self, config: PolmanConfig, owner=None) -> None:
+        self.owner = owner
+        self.mutations: list[Mutation] = []
+        # identity map: working copies of the policies read or changed in the batch
+        self.policies = InMemoryPolmanStorage(config)
+        self.events_max_count = db_config(config).events_max_count
+        self.deleted: set[str] = set()
+        # version of the policies read from the backend: the mutations are written
+        # only if they have not been changed in the meantime
+        self.versions: dict[str, int] = {}
+        # callbacks run once the mutations are written, or discarded on a conflict
+        self.after_write: list[Callable[[], None]] = []
+        self.on_conflict: list[Callable[[], None]] = []
+
+    def expected_versions(self, mutations: list[Mutation]) -> dict[str, int]:
+        return {m.policy_id: self.versions[m.policy_id] for m in mutations if m.policy_id in self.versions}
+
+    def with_inserted_policies(self, mutations: list[Mutation]) -> list[Mutation]:
+        """Replace the mutations of the policies inserted in the batch with the insert of their working copies."""
+        inserted = {m.policy_id for m in mutations if m.op == "insert"}
+        if not inserted:
+            return mutations
+        res = []
+        for m in mutations:
+            if m.policy_id not in inserted:
+                res.append(m)
+            elif m.op == "insert" and m.policy_id not in self.deleted:
+                policy = copy_policy(self.policies.get(m.policy_id))
+                # the whole history, not only the inline events
+                policy.status.events = self.policies.list_events(m.policy_id, limit=self.events_max_count)
+                res.append(Mutation("insert", m.policy_id, (policy,)))
+        return res
+
+    def run_callbacks(self, conflict: bool) -> None:
+        callbacks = self.on_conflict if conflict else self.after_write
+        self.after_write, self.on_conflict = [], []
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception:
+                logger.exception("Error running a callback of the unit of work")
+
+
+def _retry_delay(attempt: int) -> float:
+    # jittered, so that the conflicting writers do not retry in lockstep
+    return random.uniform(0, 0.01) * (attempt + 1)
+
+
+# the unit of work of the current task, for AsyncPolmanStorage.batch()
+_current_unit_of_work: ContextVar["_UnitOfWork | None"] = ContextVar("unit_of_work", default=None)
+
+
 class PolmanStorage(PolmanService, ABC):
     """The PolmanStorage service."""
 
@@ -44,7 +112,13 @@ class PolmanStorage(PolmanService, ABC):
         super().__init__(config)
 
         self._backend: PolmanStorageBackend
+        self._config = config
         self._pm = pm
+        self._local = threading.local()
+        self._aio: "AsyncPolmanStorage | None" = None
+
+        cache_size = db_config(config).cache_size
+        self._cache = PolicyCache(cache_size, pm) if cache_size > 0 else None
 
         if backend:
             self._backend = backend
@@ -59,43 +133,344 @@ class PolmanStorage(PolmanService, ABC):
         if config.db.type is DBType.FILE:
             self._backend = FilePolmanStorage(config)
 
+        if config.db.type is DBType.SQLITE:
+            self._backend = SqlitePolmanStorage(config)
+
     async def start(self) -> None:
         """Start the service."""
 
+    @property
+    def aio(self) -> "AsyncPolmanStorage":
+        """The async API of the storage, on the same data. Use it only on the event loop."""
+        if self._aio is None:
+            self._aio = AsyncPolmanStorage(self._config, self._pm, self._backend.asynchronous(), cache=self._cache)
+        return self._aio
+
+    def flush(self) -> None:
+        """Persist pending changes. Must be called before shutting down."""
+        self._backend.flush()
+
+    @contextmanager
+    def batch(self):
+        """Group the mutations performed inside the block in a unit of work.
+
+        Mutations are buffered and applied to working copies of the policies, that
+        are returned by `get()` inside the block, and are written with a single
+        backend operation when the outermost block exits. They are written even if
+        the block raises, since they track changes already made to the measurement
+        backends. Inserts are written immediately, because the backend assigns the
+        ids, while `list*()` reads write the pending mutations before reading.
+
+        The mutations of the policies read from the backend in the block are written
+        only if those policies have not been changed since they were read; otherwise
+        they are discarded and `PolicyConflictError` is raised (see `run_with_retries()`).
+        Changes to external resources are coordinated with `after_write()` and
+        `on_conflict()`.
+        """
+        if self._unit_of_work() is not None:
+            yield
+            return
+
+        uow = self._local.unit_of_work = _UnitOfWork(self._config)
+        error = None
+        with self._backend.batch():
+            try:
+                yield
+            except Exception as ex:
+                # raised once the backend batch exits, so that it does not discard the mutations
+                error = ex
+            finally:
+                self._local.unit_of_work = None
+                self._write_mutations(uow)
+        if error is not None:
+            raise error
+
+    def _unit_of_work(self) -> _UnitOfWork | None:
+        return getattr(self._local, "unit_of_work", None)
+
+    def _write_mutations(self, uow: _UnitOfWork) -> None:
+        mutations, uow.mutations = uow.mutations, []
+        if not mutations:
+            uow.run_callbacks(conflict=False)
+            return
+        try:
+            self._backend.apply(uow.with_inserted_policies(mutations), uow.expected_versions(mutations))
+        except PolicyConflictError:
+            uow.run_callbacks(conflict=True)
+            raise
+        finally:
+            self._invalidate(*{m.policy_id for m in mutations})
+        # from now on the stored versions include our own changes
+        for m in mutations:
+            uow.versions.pop(m.policy_id, None)
+        uow.run_callbacks(conflict=False)
+
+    def after_write(self, fn: Callable[[], None]) -> None:
+        """Call `fn` once the mutations of the current batch are written (now, outside a batch)."""
+        uow = self._unit_of_work()
+        if uow is None:
+            fn()
+        else:
+            uow.after_write.append(fn)
+
+    def on_conflict(self, fn: Callable[[], None]) -> None:
+        """Call `fn` if the mutations of the current batch are discarded because of a conflict.
+
+        It is used to undo changes to external resources referenced by the discarded
+        mutations, e.g. the alerting rules created when activating a policy.
+        """
+        uow = self._unit_of_work()
+        if uow is not None:
+            uow.on_conflict.append(fn)
+
+    def run_with_retries(self, fn, *args, **kwargs):
+        """Call `fn` in a batch, calling it again when a policy it read has been changed concurrently.
+
+        `fn` must read the policies it depends on with `get()`. Inside another batch
+        `fn` is just called, and the conflict is raised when the outer batch exits.
+        """
+        if self._unit_of_work() is not None:
+            return fn(*args, **kwargs)
+
+        retries = db_config(self._config).conflict_retries
+        for attempt in itertools.count():
+            try:
+                with self.batch():
+                    return fn(*args, **kwargs)
+            except PolicyConflictError as ex:
+                if attempt >= retries:
+                    raise
+                logger.info("Policy %s changed concurrently: retrying (%s/%s)", ex, attempt + 1, retries)
+                time.sleep(_retry_delay(attempt))
+
+    def _invalidate(self, *policy_ids: str) -> None:
+        if self._cache is not None:
+            for pid in policy_ids:
+                self._cache.invalidate(pid)
+
+    def _load(self, policy_id: str) -> Policy:
+        """Read a policy from the backend, through the cache if enabled."""
+        if self._cache is None:
+            return self._backend.get(policy_id)
+        return self._cache.get(policy_id, self._backend)
+
+    def _load_copy(self, policy_id: str) -> Policy:
+        """Read a policy to be changed in a unit of work."""
+        if self._cache is None:
+            return self._backend.get_copy(policy_id)
+        return copy_policy(self._load(policy_id))
+
+    def _working_copy(self, uow: _UnitOfWork, policy_id: str) -> Policy:
+        if policy_id in uow.deleted:
+            raise PolicyNotFoundError(policy_id)
+        try:
+            return uow.policies.get(policy_id)
+        except PolicyNotFoundError:
+            policy = uow.policies.insert(self._load_copy(policy_id))
+            uow.versions[policy_id] = policy.version
+            return policy
+
+    def _mutate(self, op: str, policy_id: str, *args) -> None:
+        """Apply a mutation now, or buffer it when inside a batch."""
+        uow = self._unit_of_work()
+        if uow is None:
+            try:
+                getattr(self._backend, op)(policy_id, *args)
+            finally:
+                self._invalidate(policy_id)
+            return
+        self._working_copy(uow, policy_id)
+        getattr(uow.policies, op)(policy_id, *args)
+        uow.mutations.append(Mutation(op, policy_id, args))
+
+    def _seed_working_copy(self, uow: _UnitOfWork, policy: Policy) -> Policy:
+        """Return the working copy of a policy, made from `policy` if not loaded yet.
+
+        Used by the `*_many` methods, whose callers already have the policies, to
+        avoid reading each of them again from the backend. As with `get()`, the
+        mutations are written only if the policy has not changed since it was read.
+        """
+        if policy.id in uow.deleted:
+            raise PolicyNotFoundError(policy.id)
+        try:
+            return uow.policies.get(policy.id)
+        except PolicyNotFoundError:
+            uow.versions[policy.id] = policy.version
+            return uow.policies.insert(copy_policy(policy))
+
+    def _buffer(self, uow: _UnitOfWork, policy: Policy, op: str, *args) -> None:
+        self._seed_working_copy(uow, policy)
+        getattr(uow.policies, op)(policy.id, *args)
+        uow.mutations.append(Mutation(op, policy.id, args))
+
+    def _before_list(self) -> None:
+        # reads that cannot be served by the working copies see the pending mutations
+        uow = self._unit_of_work()
+        if uow is not None:
+            self._write_mutations(uow)
+
+    def insert_many(self, policies: List[Policy]) -> List[Policy]:
+        """Insert several policies, returning them.
+
+        Inside a batch the inserts are buffered with the other mutations, and the
+        policies get their ids from the backend: the working copies are returned,
+        and are written with all their changes when the batch exits.
+        """
+        uow = self._unit_of_work()
+        if uow is None:
+            res = self._backend.insert_many(policies)
+        else:
+            res = []
+            for policy in policies:
+                policy = policy.model_copy(update={"id": self._backend.new_id()})
+                working_copy = uow.policies.insert(copy_policy(policy))
+                uow.mutations.append(Mutation("insert", working_copy.id))
+                res.append(working_copy)
+        logger.info("%s new policies added", len(res))
+        return res
+
     def insert(self, db_policy: Policy):
         res = self._backend.insert(db_policy)
+        uow = self._unit_of_work()
+        if uow is not None:
+            uow.deleted.discard(res.id)
+            uow.policies.insert(copy_policy(res))
         logger.info('New Policy added\n%s', log_object(res))
         return res
 
     def get(self, policy_id: str):
-        return self._backend.get(policy_id)
+        uow = self._unit_of_work()
+        if uow is not None:
+            return self._working_copy(uow, policy_id)
+        return self._load(policy_id)
 
     def add_policy_event(self, policy: Policy, event: PolicyEvent) -> None:
-        self._backend.add_policy_event(policy.id, event)
+        self._mutate("add_policy_event", policy.id, event)
         logger.debug(f"Policy \"{policy.name}\" event: {event}")
 
+    def list_events(self, policy_id: str, skip: int = 0, limit: int = 100) -> List[PolicyEvent]:
+        """Return a page of the event history of a policy, from the oldest event."""
+        self._before_list()
+        return self._backend.list_events(policy_id, skip=skip, limit=limit)
+
     def set_policy_phase(self, policy: Policy, phase: PolicyPhase) -> None:
         old_phase = policy.status.phase
-        self._backend.set_policy_phase(policy.id, phase)
+        self._mutate("set_policy_phase", policy.id, phase)
         logger.info(f"Policy \"{policy.name}\" phase changed: {old_phase} -> {phase}")
         self._pm.set_policy_enforced(policy)
 
     def set_rendered_spec(self, policy: Policy, rendered_spec: PolicySpec) ->  None:
-        self._backend.set_rendered_spec(policy.id, rendered_spec)
+        self._mutate("set_rendered_spec", policy.id, rendered_spec)
 
     def update_variable(self, policy: Policy, variable_name: str, variable_value: PolicyVariableType | None) ->  None:
-        self._backend.set_variable(policy.id, variable_name, variable_value)
+        self._mutate("set_variable", policy.id, variable_name, variable_value)
 
     def update_measurement_backend(self, policy: Policy, name: str, status: dict) -> None:
-        self._backend.update_measurement_backend(policy.id, name, status)
+        self._mutate("update_measurement_backend", policy.id, name, status)
 
     def delete_measurement_backend(self, policy: Policy, name: str) -> None:
         """Delete a measurement backend status."""
-        self._backend.delete_measurement_backend(policy.id, name)
+        self._mutate("delete_measurement_backend", policy.id, name)
+
+    def set_phase_many(self, policies: List[Policy], phase: PolicyPhase) -> None:
+        """Set the phase of several policies with a single write.
+
+        Like the other `*_many` methods, inside a batch the policies given are used
+        as working copies if they have not been read yet.
+        """
+        uow = self._unit_of_work()
+        if uow is None:
+            ids = [p.id for p in policies]
+            try:
+                self._backend.set_phase_many(ids, phase)
+            finally:
+                self._invalidate(*ids)
+        else:
+            for policy in policies:
+                self._buffer(uow, policy, "set_policy_phase", phase)
+        logger.info("Phase of %s policies changed to %s", len(policies), phase)
+        for policy in policies:
+            self._pm.set_policy_enforced(policy)
+
+    def add_event_many(self, policies: List[Policy], event: PolicyEvent) -> None:
+        """Add the same event to several policies with a single write."""
+        uow = self._unit_of_work()
+        if uow is None:
+            ids = [p.id for p in policies]
+            try:
+                self._backend.add_event_many(ids, event)
+            finally:
+                self._invalidate(*ids)
+        else:
+            for policy in policies:
+                self._buffer(uow, policy, "add_policy_event", event)
+        logger.debug("Event of %s policies: %s", len(policies), event)
+
+    def update_measurement_backend_many(self, policies: List[Policy], name: str, statuses: dict[str, dict]) -> None:
+        """Set the status of a measurement backend of several policies, given by policy id."""
+        uow = self._unit_of_work()
+        if uow is None:
+            try:
+                self._backend.update_measurement_backend_many(name, statuses)
+            finally:
+                self._invalidate(*statuses)
+            return
+        for policy in policies:
+            if policy.id in statuses:
+                self._buffer(uow, policy, "update_measurement_backend", name, statuses[policy.id])
+
+    def delete_measurement_backend_many(self, policies: List[Policy], name: str) -> None:
+        """Delete a measurement backend status of several policies."""
+        uow = self._unit_of_work()
+        for policy in policies:
+            if uow is None:
+                self._mutate("delete_measurement_backend", policy.id, name)
+            else:
+                self._buffer(uow, policy, "delete_measurement_backend", name)
+
+    def delete_many(self, policies: List[Policy]) -> List[Policy]:
+        """Delete several policies with a single write, returning them."""
+        uow = self._unit_of_work()
+        if uow is None:
+            ids = [p.id for p in policies]
+            self._invalidate(*ids)
+            return self._backend.delete_many(ids)
+        res = []
+        for policy in policies:
+            res.append(self._seed_working_copy(uow, policy))
+            uow.policies.delete(policy.id)
+            uow.deleted.add(policy.id)
+            uow.mutations.append(Mutation("delete", policy.id))
+        return res
 
     def list(self, filters={}) -> list[Policy]:
+        self._before_list()
         return self._backend.list(filters=filters)
 
+    def list_summaries(self, filters={}) -> List[PolicySummary]:
+        """List the policies reading only id, name, subject, phase and creation time."""
+        self._before_list()
+        return self._backend.list_summaries(filters=filters)
+
+    def list_page(self, filters={}, page: Page = Page()) -> List[Policy]:
+        """Return a page of the policies, sorted by `page.sort_by` (see `Page`)."""
+        self._before_list()
+        return self._backend.list_page(filters=filters, page=page)
+
+    def list_summaries_page(self, filters={}, page: Page = Page()) -> List[PolicySummary]:
+        self._before_list()
+        return self._backend.list_summaries_page(filters=filters, page=page)
+
+    def iter_policies(self, filters={}, page: Page = Page(), summaries: bool = False) -> Iterator[Policy | PolicySummary]:
+        """Yield all the policies from `page` on, reading `page.limit` of them at a time."""
+        list_page = self.list_summaries_page if summaries else self.list_page
+        while True:
+            items = list_page(filters=filters, page=page)
+            yield from items
+            if page.limit is None or len(items) < page.limit:
+                return
+            page = page._replace(after=(sort_value(items[-1], page.sort_by), items[-1].id))
+
     def delete(self, policy_id: str) -> Policy:
         """Delete a policy by id
 
@@ -108,4 +483,197 @@ class PolmanStorage(PolmanService, ABC):
             Policy: the policy deleted
 
         """
-        return self._backend.delete(policy_id)
+        uow = self._unit_of_work()
+        if uow is None:
+            self._invalidate(policy_id)
+            return self._backend.delete(policy_id)
+        res = self._working_copy(uow, policy_id)
+        uow.policies.delete(policy_id)
+        uow.deleted.add(policy_id)
+        uow.mutations.append(Mutation("delete", policy_id))
+        return res
+
+
+class AsyncPolmanStorage:
+    """The async API of `PolmanStorage`, with the same unit of work semantics.
+
+    The unit of work of `batch()` belongs to the current asyncio task.
+    """
+
+    def __init__(self, config: PolmanConfig, pm: PolmanMeter, backend: AsyncPolmanStorageBackend, cache: PolicyCache | None = None) -> None:
+        self._config = config
+        self._pm = pm
+        self._backend = backend
+        self._cache = cache
+
+    def _unit_of_work(self) -> _UnitOfWork | None:
+        uow = _current_unit_of_work.get()
+        return uow if uow is not None and uow.owner is self else None
+
+    @asynccontextmanager
+    async def batch(self):
+        """Group the mutations performed inside the block (see `PolmanStorage.batch`)."""
+        if self._unit_of_work() is not None:
+            yield
+            return
+
+        uow = _UnitOfWork(self._config, owner=self)
+        token = _current_unit_of_work.set(uow)
+        try:
+            yield
+        finally:
+            _current_unit_of_work.reset(token)
+            await self._write_mutations(uow)
+
+    async def _write_mutations(self, uow: _UnitOfWork) -> None:
+        mutations, uow.mutations = uow.mutations, []
+        if not mutations:
+            return
+        try:
+            await self._backend.apply(mutations, uow.expected_versions(mutations))
+        finally:
+            self._invalidate(*{m.policy_id for m in mutations})
+        for m in mutations:
+            uow.versions.pop(m.policy_id, None)
+
+    async def run_with_retries(self, fn, *args, **kwargs):
+        """Await `fn` in a batch, retrying on conflicts (see `PolmanStorage.run_with_retries`)."""
+        if self._unit_of_work() is not None:
+            return await fn(*args, **kwargs)
+
+        retries = db_config(self._config).conflict_retries
+        for attempt in itertools.count():
+            try:
+                async with self.batch():
+                    return await fn(*args, **kwargs)
+            except PolicyConflictError as ex:
+                if attempt >= retries:
+                    raise
+                logger.info("Policy %s changed concurrently: retrying (%s/%s)", ex, attempt + 1, retries)
+                await asyncio.sleep(_retry_delay(attempt))
+
+    def _invalidate(self, *policy_ids: str) -> None:
+        if self._cache is not None:
+            for pid in policy_ids:
+                self._cache.invalidate(pid)
+
+    async def _load(self, policy_id: str) -> Policy:
+        if self._cache is None:
+            return await self._backend.get(policy_id)
+        return await self._cache.get_async(policy_id, self._backend)
+
+    async def _load_copy(self, policy_id: str) -> Policy:
+        if self._cache is None:
+            return await self._backend.get_copy(policy_id)
+        return copy_policy(await self._load(policy_id))
+
+    async def _working_copy(self, uow: _UnitOfWork, policy_id: str) -> Policy:
+        if policy_id in uow.deleted:
+            raise PolicyNotFoundError(policy_id)
+        try:
+            return uow.policies.get(policy_id)
+        except PolicyNotFoundError:
+            policy = uow.policies.insert(await self._load_copy(policy_id))
+            uow.versions[policy_id] = policy.version
+            return policy
+
+    async def _mutate(self, op: str, policy_id: str, *args) -> None:
+        uow = self._unit_of_work()
+        if uow is None:
+            try:
+                await self._backend.apply([Mutation(op, policy_id, args)])
+            finally:
+                self._invalidate(policy_id)
+            return
+        await self._working_copy(uow, policy_id)
+        getattr(uow.policies, op)(policy_id, *args)
+        uow.mutations.append(Mutation(op, policy_id, args))
+
+    async def _before_list(self) -> None:
+        uow = self._unit_of_work()
+        if uow is not None:
+            await self._write_mutations(uow)
+
+    async def flush(self) -> None:
+        await self._backend.flush()
+
+    async def insert(self, db_policy: Policy) -> Policy:
+        res = await self._backend.insert(db_policy)
+        uow = self._unit_of_work()
+        if uow is not None:
+            uow.deleted.discard(res.id)
+            uow.policies.insert(copy_policy(res))
+        logger.info('New Policy added\n%s', log_object(res))
+        return res
+
+    async def get(self, policy_id: str) -> Policy:
+        uow = self._unit_of_work()
+        if uow is not None:
+            return await self._working_copy(uow, policy_id)
+        return await self._load(policy_id)
+
+    async def add_policy_event(self, policy: Policy, event: PolicyEvent) -> None:
+        await self._mutate("add_policy_event", policy.id, event)
+        logger.debug(f"Policy \"{policy.name}\" event: {event}")
+
+    async def list_events(self, policy_id: str, skip: int = 0, limit: int = 100) -> List[PolicyEvent]:
+        await self._before_list()
+        return await self._backend.list_events(policy_id, skip=skip, limit=limit)
+
+    async def set_policy_phase(self, policy: Policy, phase: PolicyPhase) -> None:
+        old_phase = policy.status.phase
+        await self._mutate("set_policy_phase", policy.id, phase)
+        logger.info(f"Policy \"{policy.name}\" phase changed: {old_phase} -> {phase}")
+        self._pm.set_policy_enforced(policy)
+
+    async def set_rendered_spec(self, policy: Policy, rendered_spec: PolicySpec) -> None:
+        await self._mutate("set_rendered_spec", policy.id, rendered_spec)
+
+    async def update_variable(self, policy: Policy, variable_name: str, variable_value: PolicyVariableType | None) -> None:
+        await self._mutate("set_variable", policy.id, variable_name, variable_value)
+
+    async def update_measurement_backend(self, policy: Policy, name: str, status: dict) -> None:
+        await self._mutate("update_measurement_backend", policy.id, name, status)
+
+    async def delete_measurement_backend(self, policy: Policy, name: str) -> None:
+        await self._mutate("delete_measurement_backend", policy.id, name)
+
+    async def list(self, filters={}) -> List[Policy]:
+        await self._before_list()
+        return await self._backend.list(filters=filters)
+
+    async def list_summaries(self, filters={}) -> List[PolicySummary]:
+        await self._before_list()
+        return await self._backend.list_summaries(filters=filters)
+
+    async def list_page(self, filters={}, page: Page = Page()) -> List[Policy]:
+        await self._before_list()
+        return await self._backend.list_page(filters=filters, page=page)
+
+    async def list_summaries_page(self, filters={}, page: Page = Page()) -> List[PolicySummary]:
+        await self._before_list()
+        return await self._backend.list_summaries_page(filters=filters, page=page)
+
+    async def iter_policies(
+        self, filters={}, page: Page = Page(), summaries: bool = False,
+    ) -> AsyncIterator[Policy | PolicySummary]:
+        """Yield all the policies from `page` on (see `PolmanStorage.iter_policies`)."""
+        list_page = self.list_summaries_page if summaries else self.list_page
+        while True:
+            items = await list_page(filters=filters, page=page)
+            for item in items:
+                yield item
+            if page.limit is None or len(items) < page.limit:
+                return
+            page = page._replace(after=(sort_value(items[-1], page.sort_by), items[-1].id))
+
+    async def delete(self, policy_id: str) -> Policy:
+        uow = self._unit_of_work()
+        if uow is None:
+            self._invalidate(policy_id)
+            return await self._backend.delete(policy_id)
+        res = await self._working_copy(uow, policy_id)
+        uow.policies.delete(policy_id)
+        uow.deleted.add(policy_id)
+        uow.mutations.append(Mutation("delete", policy_id))
+        return res
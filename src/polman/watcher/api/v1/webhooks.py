@@ -35,6 +35,6 @@ router = APIRouter(
 
 
 @router.post("/alertmanager")
-def alertmanager_webhook(webhook: AlertmanagerWebhook, pw: PolmanWatcherInstance):
+async def alertmanager_webhook(webhook: AlertmanagerWebhook, pw: PolmanWatcherInstance):
     for a in webhook.alerts:
-        pw.process_alertmanager_alert(a)
+        await pw.process_alertmanager_alert_async(a)
@@ -20,13 +20,15 @@
 
 """Watcher module."""
 
+import asyncio
+import functools
 import logging
 
 from polman.common.config import PolmanConfig
 from polman.common.errors import PolmanError
 from polman.common.events import PolicyEventsFactory
 from polman.common.logging import log_object
-from polman.common.model import Policy, PolicyPhase, PolicySpecTelemetry
+from polman.common.model import Policy, PolicyPhase, PolicySpecTelemetry, Violation
 from polman.common.service import PolmanService
 from polman.enforcer.main import PolmanEnforcer
 from polman.storage.main import PolmanStorage
@@ -57,28 +59,33 @@ class PolmanWatcher(PolmanService):
 
 
     def violate_policy(self, policy: Policy, backend_name: str, current_value: float, labels: dict):
+        violation = self._record_violation(policy, backend_name, current_value, labels)
+        if violation:
+            self._pe.execute_violation_action(policy, violation)
 
-
+    def _record_violation(self, policy: Policy, backend_name: str, current_value: float, labels: dict) -> Violation | None:
+        """Set a policy as violated, returning the violation or None if it cannot be built."""
         try:
           violation = build_violation(backend_name, current_value, labels, policy)
         except Exception as ex:
-            self._ps.add_policy_event(policy, PolicyEventsFactory.policy_rendering_error(policy.spec, str(ex)))
-            self._ps.set_policy_phase(policy, PolicyPhase.Violated)
-            return
+            with self._ps.batch():
+                self._ps.add_policy_event(policy, PolicyEventsFactory.policy_rendering_error(policy.spec, str(ex)))
+                self._ps.set_policy_phase(policy, PolicyPhase.Violated)
+            return None
         
-        
-        self._ps.add_policy_event(
-            policy,
-            PolicyEventsFactory.policy_violated(violation),
-        )
-        self._ps.set_policy_phase(policy, PolicyPhase.Violated)
-
-        self._pe.execute_violation_action(policy, violation)
+        with self._ps.batch():
+            self._ps.add_policy_event(
+                policy,
+                PolicyEventsFactory.policy_violated(violation),
+            )
+            self._ps.set_policy_phase(policy, PolicyPhase.Violated)
+        return violation
 
     def resolve_policy(self, policy: Policy):
         # TODO(gabriele): trigger the action also for resolved?
-        self._ps.add_policy_event(policy, PolicyEventsFactory.policy_resolved())
-        self._ps.set_policy_phase(policy, PolicyPhase.Enforced)
+        with self._ps.batch():
+            self._ps.add_policy_event(policy, PolicyEventsFactory.policy_resolved())
+            self._ps.set_policy_phase(policy, PolicyPhase.Enforced)
 
     def process_alertmanager_alert(self, alert: AlertmanagerAlert) -> None:
         """Process an alert received by the Alertmanager."""
@@ -90,24 +97,95 @@ class PolmanWatcher(PolmanService):
 
         policy_id = alert.annotations["plm_id"]
 
+        if alert.status == "firing":
+            backend_name = alert.annotations['plm_measurement_backend']
+            current_value = float(alert.annotations['plm_expr_value'])
+            labels = dict(alert.labels)
+            del labels['alertname']
+            # the violation is built from the policy read in the same unit of work
+            # that records it, and the action is executed only once it is recorded
+            policy, violation = self._ps.run_with_retries(
+                self._read_and_record_violation, policy_id, backend_name, current_value, labels)
+            if violation:
+                self._pe.execute_violation_action(policy, violation)
+            return
+
+        if alert.status == "resolved":
+            self._ps.run_with_retries(self._read_and_resolve, policy_id)
+            return
+
+        logger.warning('Ignoring alert with status "%s"', alert.status)
+        return
+
+    def _read_and_record_violation(self, policy_id: str, backend_name: str, current_value: float, labels: dict):
         policy = self._ps.get(policy_id)
+        # build_violation() consumes the labels, that must be intact if this is retried
+        return policy, self._record_violation(policy, backend_name, current_value, dict(labels))
+
+    def _read_and_resolve(self, policy_id: str):
+        self.resolve_policy(self._ps.get(policy_id))
+
+    async def violate_policy_async(self, policy: Policy, backend_name: str, current_value: float, labels: dict):
+        violation = await self._record_violation_async(policy, backend_name, current_value, labels)
+        if violation:
+            # the webhook is sent with a blocking http client
+            await asyncio.to_thread(self._pe.execute_violation_action, policy, violation)
+
+    async def _record_violation_async(self, policy: Policy, backend_name: str, current_value: float, labels: dict) -> Violation | None:
+        aps = self._ps.aio
+
+        try:
+            violation = build_violation(backend_name, current_value, labels, policy)
+        except Exception as ex:
+            async with aps.batch():
+                await aps.add_policy_event(policy, PolicyEventsFactory.policy_rendering_error(policy.spec, str(ex)))
+                await aps.set_policy_phase(policy, PolicyPhase.Violated)
+            return None
+
+        async with aps.batch():
+            await aps.add_policy_event(policy, PolicyEventsFactory.policy_violated(violation))
+            await aps.set_policy_phase(policy, PolicyPhase.Violated)
+        return violation
+
+    async def _read_and_record_violation_async(self, policy_id: str, backend_name: str, current_value: float, labels: dict):
+        policy = await self._ps.aio.get(policy_id)
+        return policy, await self._record_violation_async(policy, backend_name, current_value, dict(labels))
+
+    async def _read_and_resolve_async(self, policy_id: str):
+        await self.resolve_policy_async(await self._ps.aio.get(policy_id))
+
+    async def resolve_policy_async(self, policy: Policy):
+        aps = self._ps.aio
+        async with aps.batch():
+            await aps.add_policy_event(policy, PolicyEventsFactory.policy_resolved())
+            await aps.set_policy_phase(policy, PolicyPhase.Enforced)
+
+    async def process_alertmanager_alert_async(self, alert: AlertmanagerAlert) -> None:
+        """Process an alert received by the Alertmanager, on the event loop."""
+        logger.debug("Processing received Webhook from AlertManager:\n%s", log_object(alert))
 
-        if not policy:
-            logger.error("No policy with id %s found", policy_id)
+        if "plm_id" not in alert.annotations:
+            logger.error("plm_id not found: this is not an alert for a policy!")
             return
 
+        policy_id = alert.annotations["plm_id"]
+
         if alert.status == "firing":
-            backend_name = alert.annotations['plm_measurement_backend']
-            current_value = float(alert.annotations['plm_expr_value'])
             labels = dict(alert.labels)
             del labels['alertname']
-            self.violate_policy(policy, backend_name, current_value, labels)
+            policy, violation = await self._ps.aio.run_with_retries(
+                self._read_and_record_violation_async,
+                policy_id, alert.annotations['plm_measurement_backend'], float(alert.annotations['plm_expr_value']), labels)
+            if violation:
+                # the webhook is sent with a blocking http client
+                await asyncio.to_thread(self._pe.execute_violation_action, policy, violation)
+            return
 
         if alert.status == "resolved":
-            self.resolve_policy(policy)
+            await self._ps.aio.run_with_retries(self._read_and_resolve_async, policy_id)
+            return
 
         logger.warning('Ignoring alert with status "%s"', alert.status)
-        return
 
     def unset_measurement_backends(self, policy: Policy) -> None:
         """Stop watching a policy."""
@@ -128,10 +206,16 @@ class PolmanWatcher(PolmanService):
             api_url=self._config.prometheus.rules_api_url
         )
 
-        prom_rule_engine.delete_rule(str(rule_file))  # str() is not needed but required for type checking
-
+        # changed first: outside a batch the callbacks below run at once, and must see the policy inactive
         self._ps.delete_measurement_backend(policy, "prom-1")
         self._ps.add_policy_event(policy, PolicyEventsFactory.policy_deactivated())
+
+        if "rule_group" in status:
+            self._release_shared_rule_file(prom_rule_engine, str(rule_file), [policy])
+        else:
+            # the rule is deleted only once the policy stops referencing it, so it is kept
+            # if the change is discarded because of a concurrent update
+            self._ps.after_write(lambda: prom_rule_engine.delete_rule(str(rule_file)))  # str() is not needed but required for type checking
         return
 
 
@@ -150,19 +234,7 @@ class PolmanWatcher(PolmanService):
                 api_url=self._config.prometheus.rules_api_url
             )
 
-            rule_file = prom_rule_engine.add_rule(
-                policy_name=policy.name,
-                policy_id=policy.id,
-                expression=spec.expr,
-                extra_annotations={"plm_measurement_backend": "prom-1"},
-                for_param=policy.properties.get("pendingInterval", "0"),
-            )
-
-            measurement_backend_status = {
-                "service": "prometheus",
-                "url": prom_rule_engine.prom_api,
-                "rule_file": rule_file,
-            }
+            measurement_backend_status = self._add_rule(prom_rule_engine, policy)
 
             self._ps.update_measurement_backend(
                 policy, "prom-1", measurement_backend_status
@@ -171,3 +243,193 @@ class PolmanWatcher(PolmanService):
             return
 
         raise PolmanError("Policy cannot be watched")
+
+    def _add_rule(self, prom_rule_engine: PrometheusRuleEngine, policy: Policy) -> dict:
+        """Add the alerting rule of a telemetry policy, returning the status of its measurement backend."""
+        rule_file = prom_rule_engine.add_rule(
+            policy_name=policy.name,
+            policy_id=policy.id,
+            expression=policy.status.renderedSpec.expr,  # type: ignore
+            extra_annotations={"plm_measurement_backend": "prom-1"},
+            for_param=policy.properties.get("pendingInterval", "0"),
+        )
+        # no policy will reference the rule if the change is discarded
+        self._ps.on_conflict(lambda: prom_rule_engine.delete_rule(rule_file))
+        return {
+            "service": "prometheus",
+            "url": prom_rule_engine.prom_api,
+            "rule_file": rule_file,
+        }
+
+    def _rule_group(self, policy: Policy, group_name: str | None = None, spec: PolicySpecTelemetry | None = None) -> dict:
+        """Return the rule group of a policy, with the expression of `spec` or else of its rendered spec."""
+        spec = spec or policy.status.renderedSpec
+        return PrometheusRuleEngine.rule_group(
+            policy_name=policy.name,
+            policy_id=policy.id,
+            expression=spec.expr,  # type: ignore
+            extra_annotations={"plm_measurement_backend": "prom-1"},
+            for_param=policy.properties.get("pendingInterval", "0"),
+            group_name=group_name,
+        )
+
+    def _add_shared_rules(self, prom_rule_engine: PrometheusRuleEngine, policies: list[Policy]) -> dict[str, dict]:
+        """Add the alerting rules of several telemetry policies with a single request.
+
+        The rules share a rule file, with a group per policy named after its id.
+        Returns the statuses of the measurement backends by policy id.
+        """
+        if not policies:
+            return {}
+        rule_file = prom_rule_engine.add_rule_groups([self._rule_group(p, group_name=p.id) for p in policies])
+        # no policy will reference the rules if the change is discarded
+        self._ps.on_conflict(lambda: prom_rule_engine.delete_rule(rule_file))
+        return {
+            p.id: {
+                "service": "prometheus",
+                "url": prom_rule_engine.prom_api,
+                "rule_file": rule_file,
+                "rule_group": p.id,
+            }
+            for p in policies
+        }
+
+    def _release_shared_rule_file(self, prom_rule_engine: PrometheusRuleEngine, rule_file: str, released: list[Policy]) -> None:
+        """Remove the rules of some policies from a rule file shared by several policies.
+
+        Once the released policies stop referencing it, the file is rewritten in place
+        with the groups of the policies still referencing it, or deleted if there are
+        none. The file is left untouched if the change is discarded.
+        """
+        released_ids = {p.id for p in released}
+
+        def _release():
+            others = [
+                p for p in self._ps.list(filters={"status.measurementBackends.prom-1.rule_file": rule_file})
+                if p.id not in released_ids
+            ]
+            if others:
+                prom_rule_engine.replace_rule_groups(rule_file, [self._rule_group(p, group_name=p.id) for p in others])
+            else:
+                prom_rule_engine.delete_rule(rule_file)
+
+        self._ps.after_write(_release)
+
+    def set_measurement_backends_many(self, policies: list[Policy], shared_rule_file: bool = False) -> None:
+        """Watch several policies, writing the changes of all of them together.
+
+        With `shared_rule_file` the alerting rules of all the policies are added with
+        a single request, in the same rule file.
+        """
+        if not self._config.prometheus.rules_api_url:
+            raise PolmanError(
+                "Prometheus backend not enabled in the config! Cannot activate policy"
+            )
+
+        for policy in policies:
+            if not isinstance(policy.status.renderedSpec, PolicySpecTelemetry):
+                raise PolmanError(f"Policy {policy.id} cannot be watched")
+
+        prom_rule_engine = PrometheusRuleEngine(
+            api_url=self._config.prometheus.rules_api_url
+        )
+
+        statuses = {}
+        try:
+            if shared_rule_file:
+                statuses = self._add_shared_rules(prom_rule_engine, policies)
+            else:
+                for policy in policies:
+                    statuses[policy.id] = self._add_rule(prom_rule_engine, policy)
+        finally:
+            # keep track of the rules added, even if adding one of them failed
+            activated = [p for p in policies if p.id in statuses]
+            self._ps.update_measurement_backend_many(activated, "prom-1", statuses)
+            self._ps.add_event_many(activated, PolicyEventsFactory.policy_activated())
+
+    def update_measurement_backends(self, policy: Policy, rendered_spec: PolicySpecTelemetry) -> None:
+        """Replace the alerting rule of a watched policy with the one of a new rendered spec."""
+        errors = self.update_measurement_backends_many([policy], {policy.id: rendered_spec})
+        if errors:
+            raise errors[policy.id]
+
+    def update_measurement_backends_many(
+        self, policies: list[Policy], rendered_specs: dict[str, PolicySpecTelemetry]
+    ) -> dict[str, Exception]:
+        """Replace the alerting rules of watched policies with the ones of their new rendered specs.
+
+        The rule files are rewritten in place with a request per file, so the policies
+        are watched all along and the statuses of their measurement backends do not
+        change. The rules of the stored specs are restored if the change is discarded.
+
+        Returns the errors of the policies whose rules could not be replaced, by id.
+        """
+        errors: dict[str, Exception] = {}
+        files: dict[str, list[Policy]] = {}
+        for policy in policies:
+            status = policy.status.measurementBackends.get("prom-1")
+            if status is None:
+                errors[policy.id] = PolmanError(f"Measurement backend of policy {policy.id} not active")
+            elif self._config.prometheus.rules_api_url != status["url"]:
+                errors[policy.id] = PolmanError("URL mismatch. The rule was created from a different instance?")
+            else:
+                files.setdefault(str(status["rule_file"]), []).append(policy)
+
+        prom_rule_engine = PrometheusRuleEngine(
+            api_url=self._config.prometheus.rules_api_url
+        )
+
+        for rule_file, updated in files.items():
+            if "rule_group" in updated[0].status.measurementBackends["prom-1"]:
+                # the whole file is rewritten: the groups of the other policies sharing it
+                # are read in the unit of work, to detect concurrent changes to them
+                updated_ids = {p.id for p in updated}
+                others = [
+                    self._ps.get(p.id)
+                    for p in self._ps.list(filters={"status.measurementBackends.prom-1.rule_file": rule_file})
+                    if p.id not in updated_ids
+                ]
+                previous = [self._rule_group(p, group_name=p.id) for p in others + updated]
+                groups = [self._rule_group(p, group_name=p.id, spec=rendered_specs.get(p.id)) for p in others + updated]
+            else:
+                previous = [self._rule_group(p) for p in updated]
+                groups = [self._rule_group(p, spec=rendered_specs[p.id]) for p in updated]
+
+            try:
+                prom_rule_engine.replace_rule_groups(rule_file, groups)
+            except Exception as ex:
+                logger.error("Cannot replace the rules of the file %s: %s", rule_file, ex)
+                errors |= {p.id: ex for p in updated}
+                continue
+            self._ps.on_conflict(functools.partial(prom_rule_engine.replace_rule_groups, rule_file, previous))
+        return errors
+
+    def unset_measurement_backends_many(self, policies: list[Policy]) -> None:
+        """Stop watching several policies, writing the changes of all of them together."""
+        watched = []
+        for policy in policies:
+            if "prom-1" not in policy.status.measurementBackends:
+                logger.error("Measurement backend of policy %s not active", policy.id)
+                continue
+            if self._config.prometheus.rules_api_url != policy.status.measurementBackends["prom-1"]["url"]:
+                raise PolmanError("URL mismatch. The rule was created from a different instance?")
+            watched.append(policy)
+
+        prom_rule_engine = PrometheusRuleEngine(
+            api_url=self._config.prometheus.rules_api_url
+        )
+
+        statuses = {p.id: p.status.measurementBackends["prom-1"] for p in watched}
+        self._ps.delete_measurement_backend_many(watched, "prom-1")
+        self._ps.add_event_many(watched, PolicyEventsFactory.policy_deactivated())
+
+        shared: dict[str, list[Policy]] = {}
+        for policy in watched:
+            status = statuses[policy.id]
+            if "rule_group" in status:
+                shared.setdefault(str(status["rule_file"]), []).append(policy)
+            else:
+                # as in unset_measurement_backends(), the rules are kept if the change is discarded
+                self._ps.after_write(functools.partial(prom_rule_engine.delete_rule, str(status["rule_file"])))
+        for rule_file, released in shared.items():
+            self._release_shared_rule_file(prom_rule_engine, rule_file, released)
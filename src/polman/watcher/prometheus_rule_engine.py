@@ -22,10 +22,10 @@ import os
 from typing import List
 
 import requests
-from jinja2 import BaseLoader, Environment
 from pydantic import TypeAdapter
 
 from polman.common.model import PolicySubject
+from polman.common.templating import compile_template
 from polman.watcher.model import PrometheusRuleGroup
 
 SUBJECT_FIELDS_TO_ICOS_TELEMETRY_LABELS = {
@@ -97,16 +97,15 @@ def get_telemetry_expr(db_policy, spec_override=None):
     if spec.violatedIf:
         full_expr_tpl += f" {spec.violatedIf}"
 
-    dump = db_policy.model_dump(mode="python")
     ctxt = {
         "subject": db_policy.subject,
         "subject_label_selector": subject_to_labels_selector(db_policy.subject),
         "subject_label_list": subject_to_labels_list(db_policy.subject),
     }
 
-    ctxt |= dump["variables"]
+    ctxt |= db_policy.variables
 
-    rtemplate = Environment(loader=BaseLoader()).from_string(full_expr_tpl)
+    rtemplate = compile_template(full_expr_tpl, strict=False)
     expr_data = rtemplate.render(**ctxt)
 
     return expr_data
@@ -119,44 +118,69 @@ class PrometheusRuleEngine:
         """Initialize the PrometheusRuleEngine."""
         self.prom_api: str = api_url
 
-    def add_rule(
-        self,
+    @staticmethod
+    def rule_group(
         policy_name,
         policy_id,
         expression,
         for_param=None,
         extra_labels=None,
         extra_annotations=None,
-    ):
+        group_name=None,
+    ) -> dict:
+        """Return the rule group with the alerting rule of a policy, named `group_name` or after the policy."""
         annotations = {"plm_id": policy_id, "plm_expr_value": "{{ $value }}"}
         if extra_annotations:
             annotations.update(extra_annotations)
         labels = dict(extra_labels) if extra_labels else {}
 
-        body = {
-            "data": {
-                "groups": [
-                    {
-                        "name": policy_name,
-                        "rules": [
-                            {
-                                "alert": f"{policy_name}:rule-0",
-                                "expr": expression,
-                                "for": for_param,
-                                "labels": labels,
-                                "annotations": annotations,
-                            }
-                        ],
-                    }
-                ]
-            }
+        return {
+            "name": group_name or policy_name,
+            "rules": [
+                {
+                    "alert": f"{policy_name}:rule-0",
+                    "expr": expression,
+                    "for": for_param,
+                    "labels": labels,
+                    "annotations": annotations,
+                }
+            ],
         }
 
+    def add_rule(
+        self,
+        policy_name,
+        policy_id,
+        expression,
+        for_param=None,
+        extra_labels=None,
+        extra_annotations=None,
+    ):
+        group = self.rule_group(policy_name, policy_id, expression, for_param, extra_labels, extra_annotations)
+        return self.add_rule_groups([group])
+
+    def add_rule_groups(self, groups: List[dict]) -> str:
+        """Add several rule groups (see `rule_group()`) in a single rule file, returning its name."""
+        body = {"data": {"groups": groups}}
+
         headers = {"Content-Type": "application/json; charset=UTF-8"}
 
         res = requests.post(self.prom_api, headers=headers, json=body, timeout=60)
         return res.json()["file"]
 
+    def replace_rule_groups(self, rule_file: str, groups: List[dict]) -> None:
+        """Replace the rule groups of an existing rule file with a single request, keeping its name.
+
+        Unlike deleting the rule file and adding a new one, the alerts of the rules
+        are evaluated all along.
+        """
+        body = {"data": {"groups": groups}}
+
+        headers = {"Content-Type": "application/json; charset=UTF-8"}
+
+        res = requests.put(f"{self.prom_api}/{rule_file}", headers=headers, json=body, timeout=60)
+        res.raise_for_status()
+
     def list_rules(self):
         headers = {"Content-Type": "application/json; charset=UTF-8"}
         res = requests.get(self.prom_api, headers=headers, timeout=60)
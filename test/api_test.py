@@ -18,9 +18,114 @@
 # and innovation programme under grant agreement No. 101070177.
 #
 
+import json
+
 from polman.watcher.prometheus_rule_engine import PrometheusRuleEngine
 
 def test_get_policies(test_http_client):
   response = test_http_client.get("/polman/registry/api/v1/policies")
   assert response.status_code == 200
-  assert len(response.json()) == 0
\ No newline at end of file
+  assert len(response.json()) == 0
+
+def test_list_policies_summary_and_detail(test_http_client, policy_c1):
+  created = test_http_client.post("/polman/registry/api/v1/policies?do_not_activate=true", json=policy_c1).json()
+
+  summaries = test_http_client.get("/polman/registry/api/v1/policies").json()
+  assert len(summaries) == 1
+  assert set(summaries[0]) == {"id", "name", "subject", "phase", "creationTime"}
+  assert summaries[0]["id"] == created["id"]
+  assert summaries[0]["phase"] == "inactive"
+
+  detailed = test_http_client.get("/polman/registry/api/v1/policies?detail=true").json()
+  assert detailed[0]["spec"] == created["spec"]
+  assert len(detailed[0]["status"]["events"]) > 0
+
+
+def test_list_policies_pages(test_http_client, policy_c1):
+  for i in range(5):
+    test_http_client.post("/polman/registry/api/v1/policies?do_not_activate=true", json=policy_c1 | {"name": f"p-{i}"})
+  url = "/polman/registry/api/v1/policies"
+  everything = test_http_client.get(url).json()
+
+  first = test_http_client.get(f"{url}?limit=2")
+  second = test_http_client.get(f"{url}?limit=2&cursor={first.headers['X-Next-Cursor']}")
+  last = test_http_client.get(f"{url}?limit=2&cursor={second.headers['X-Next-Cursor']}&detail=true")
+
+  assert first.json() + second.json() == everything[:4]
+  assert [p["id"] for p in last.json()] == [everything[4]["id"]]
+  assert "X-Next-Cursor" not in last.headers
+  assert test_http_client.get(f"{url}?limit=2&cursor=invalid").status_code == 400
+
+
+def test_stream_policies(test_http_client, policy_c1):
+  for i in range(3):
+    test_http_client.post("/polman/registry/api/v1/policies?do_not_activate=true", json=policy_c1 | {"name": f"p-{i}"})
+
+  response = test_http_client.get("/polman/registry/api/v1/policies?stream=true")
+  assert response.headers["content-type"] == "application/x-ndjson"
+  lines = [json.loads(line) for line in response.text.splitlines()]
+  assert lines == test_http_client.get("/polman/registry/api/v1/policies").json()
+
+  detailed = test_http_client.get("/polman/registry/api/v1/policies?stream=true&detail=true").text.splitlines()
+  assert [json.loads(line)["name"] for line in detailed] == ["p-0", "p-1", "p-2"]
+
+
+def test_list_policies_filters_and_sort(test_http_client, policy_c1):
+  url = "/polman/registry/api/v1/policies"
+  for i, name in enumerate(["web-b", "db-a", "web-a"]):
+    subject = {"type": "app", "appName": "shop", "appInstance": f"shop-{i % 2}", "appComponent": name}
+    test_http_client.post(f"{url}?do_not_activate=true", json=policy_c1 | {"name": name, "subject": subject})
+  test_http_client.post(f"{url}?do_not_activate=true", json=policy_c1 | {"name": "web-host"})
+
+  def names(query):
+    return [p["name"] for p in test_http_client.get(f"{url}?{query}").json()]
+
+  assert names("name_prefix=web-&sort_by=name") == ["web-a", "web-b", "web-host"]
+  assert names("name_prefix=web-&sort_by=name&order=desc") == ["web-host", "web-b", "web-a"]
+  assert names("subject_type=app&app_instance=shop-0&sort_by=name") == ["web-a", "web-b"]
+  assert names("phase=inactive&host_id=*") == ["web-host"]
+  assert names("phase=enforced") == []
+  assert names("name_prefix=web-&sort_by=name&limit=2&detail=true") == ["web-a", "web-b"]
+
+  # the cursor keeps the sort and the filters are given again
+  first = test_http_client.get(f"{url}?name_prefix=web-&sort_by=name&order=desc&limit=2")
+  second = test_http_client.get(f"{url}?name_prefix=web-&limit=2&cursor={first.headers['X-Next-Cursor']}")
+  assert [p["name"] for p in second.json()] == ["web-a"]
+
+  streamed = test_http_client.get(f"{url}?stream=true&sort_by=name&app_name=shop").text.splitlines()
+  assert [json.loads(line)["name"] for line in streamed] == ["db-a", "web-a", "web-b"]
+
+  assert test_http_client.get(f"{url}?sort_by=version").status_code == 422
+
+
+def test_list_policies_fields(test_http_client, policy_c1):
+  url = "/polman/registry/api/v1/policies"
+  for i in range(3):
+    test_http_client.post(f"{url}?do_not_activate=true", json=policy_c1 | {"name": f"p-{i}"})
+
+  summaries = test_http_client.get(f"{url}?fields=name,phase").json()
+  assert summaries == [{"name": f"p-{i}", "phase": "inactive"} for i in range(3)]
+
+  detailed = test_http_client.get(f"{url}?fields=name,variables&limit=2")
+  assert detailed.json() == [{"name": f"p-{i}", "variables": {"maxCpu": 0.8}} for i in range(2)]
+  assert "X-Next-Cursor" in detailed.headers
+
+  streamed = test_http_client.get(f"{url}?fields=id&stream=true").text.splitlines()
+  assert [set(json.loads(line)) for line in streamed] == [{"id"}] * 3
+
+  response = test_http_client.get(f"{url}?fields=name,phase,spec")
+  assert response.status_code == 400
+  assert "phase" in response.json()["detail"]
+
+
+def test_get_policy_events(test_http_client, policy_c1):
+  created = test_http_client.post("/polman/registry/api/v1/policies?do_not_activate=true", json=policy_c1).json()
+
+  events = test_http_client.get(f"/polman/registry/api/v1/policies/{created['id']}/events").json()
+  assert events[0]["type"] == "created"
+
+  page = test_http_client.get(f"/polman/registry/api/v1/policies/{created['id']}/events?skip=1&limit=1").json()
+  assert page == events[1:2]
+
+  response = test_http_client.get("/polman/registry/api/v1/policies/123/events")
+  assert response.status_code == 404
@@ -49,5 +49,6 @@ def test_http_client_mongo(test_config, test_storage_with_mongo_backend, mocker)
    
   mocker.patch.object(PrometheusRuleEngine, "add_rule", return_value="test-rule.yml")
   mocker.patch.object(PrometheusRuleEngine, "delete_rule", return_value="test-rule.yml")
+  mocker.patch.object(PrometheusRuleEngine, "replace_rule_groups")
 
   return TestClient(api.app)
\ No newline at end of file
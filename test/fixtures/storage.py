@@ -22,8 +22,10 @@ import mongomock
 import pymongo
 import pytest
 
+from polman.common.config import DBConfig, DBType, PolmanConfig
 from polman.storage.main import InMemoryPolmanStorage
 from polman.storage.backend.mongo import MongodbPolicyStore
+from polman.storage.backend.sqlite import SqlitePolmanStorage
 
 
 @pytest.fixture
@@ -42,3 +44,30 @@ def test_mongo_backend() -> MongodbPolicyStore:
             mongo_db_client=pymongo.MongoClient("server.example.com"),
             mongo_db_database_name="test",
         )
+
+
+@pytest.fixture
+def test_file_db_config(tmp_path):
+    """Return a function building a config for a file backend stored in a temporary folder."""
+    db_file = tmp_path / "polman.json"
+    db_file.write_text("[]")
+
+    def __build_config(**kwargs) -> PolmanConfig:
+        return PolmanConfig(db=DBConfig(type=DBType.FILE, url=str(db_file), **kwargs))
+
+    return __build_config
+
+
+@pytest.fixture
+def test_sqlite_db_config(tmp_path):
+    """Return a function building a config for a sqlite backend stored in a temporary folder."""
+
+    def __build_config(**kwargs) -> PolmanConfig:
+        return PolmanConfig(db=DBConfig(type=DBType.SQLITE, url=str(tmp_path / "polman.db"), **kwargs))
+
+    return __build_config
+
+
+@pytest.fixture
+def test_sqlite_backend(test_sqlite_db_config) -> SqlitePolmanStorage:
+    return SqlitePolmanStorage(test_sqlite_db_config())
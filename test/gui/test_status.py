@@ -29,3 +29,16 @@ def test_status_page(test_http_client_mongo, policy_1_create):
 
     assert response.status_code == 200
     assert f"<a href=#{p.id}" in response.text
+
+
+def test_status_page_creation_time(test_http_client_mongo, policy_1_create):
+    reg = get_registry_from_http_client(test_http_client_mongo)
+    p = reg.process_policy_create_request(policy_1_create, activate_created_policy=False)
+    # enough events to push the creation out of the inline ones
+    for i in range(10):
+        p = reg.process_set_policy_variable(p, "maxCpu", 0.5 + i / 100)
+    assert "created" not in [e.type.value for e in p.status.events]
+
+    response = test_http_client_mongo.get("/polman/status")
+
+    assert str(p.status.createdAt) in response.text
@@ -19,7 +19,7 @@
 #
 
 import pytest
-from polman.common.model import Policy, PolicyAction, PolicyCreate, PolicySpec, PolicySpecTelemetry, PolicySubject, PolicySubjectApplication, PolicySubjectCustom, PolicySubjectHost
+from polman.common.model import Policy, PolicyAction, PolicyCreate, PolicyRead, PolicySpec, PolicyStatus, PolicySpecTelemetry, PolicySpecTemplate, PolicySubject, PolicySubjectApplication, PolicySubjectCustom, PolicySubjectHost
 from polman.watcher.prometheus_rule_engine import subject_to_labels_dict, subject_to_labels_list, subject_to_labels_selector
 from .utils import build
 
@@ -73,8 +73,35 @@ def test_subject(policy_c1):
   
 def test_spec():
   assert isinstance(c1, PolicySpecTelemetry)
+  assert isinstance(build(PolicySpec, {'templateName': 't'}), PolicySpecTemplate)
+
+  with pytest.raises(ValidationError):
+    build(PolicySpec, {'description': 'neither a template nor a query'})
+
+def test_unknown_subject_type():
+  with pytest.raises(ValidationError):
+    build(PolicySubject, {'type': 'cluster', 'name': 'c1'})
 
 def test_subject_to_label(policy_2_db):
   res = subject_to_labels_dict(policy_2_db.subject)
   
-  assert len(res) == 3
\ No newline at end of file
+  assert len(res) == 3
+
+def test_policy_read_from_policy():
+  res = PolicyRead.from_policy(p1)
+
+  assert isinstance(res, PolicyRead)
+  assert res.model_dump() == PolicyRead(**p1.model_dump()).model_dump()
+  assert res.model_fields_set == p1.model_fields_set
+  assert subject_to_labels_dict(res.subject) == subject_to_labels_dict(p1.subject)
+
+def test_policy_read_from_policy_is_a_copy(test_in_memory_backend):
+  p = test_in_memory_backend.insert(p1.model_copy(update={"status": PolicyStatus()}, deep=True))
+  res = PolicyRead.from_policy(test_in_memory_backend.get(p.id))
+
+  # the in-memory backend changes the stored policy in place
+  test_in_memory_backend.set_variable(p.id, "thresholdTimeSeconds", "60")
+  test_in_memory_backend.update_measurement_backend(p.id, "prom-1", {"rule_file": "rules-0.yml"})
+
+  assert res.variables["thresholdTimeSeconds"] == "120"
+  assert res.status.measurementBackends == {}
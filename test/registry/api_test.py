@@ -102,11 +102,10 @@ def test_get_set_variable(test_http_client_mongo: TestClient, policy_c1) -> None
     response = test_http_client_mongo.post(f"/polman/registry/api/v1/policies/{p1.id}/variables/maxCpu/0.2")
     p1 = pr.list_all_policies()[0]
     assert p1.variables["maxCpu"] == 0.2
-    assert [evt.type for evt in p1.status.events[-4:]] == [
-        PolicyEventType.Deactivated,
+    assert [evt.type for evt in p1.status.events[-3:]] == [
+        PolicyEventType.Activated,
         PolicyEventType.VariableSet,
-        PolicyEventType.Rendered,
-        PolicyEventType.Activated]
+        PolicyEventType.Rendered]
 
     response = test_http_client_mongo.get(f"/polman/registry/api/v1/policies/{p1.id}/variables/")
     assert response.json() == {"maxCpu": 0.2}
@@ -0,0 +1,275 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+# ruff: noqa: S101
+
+import itertools
+
+import pytest
+from starlette.testclient import TestClient
+
+from polman.common.errors import PolicyConflictError
+from polman.common.events import PolicyEventsFactory
+from polman.common.model import PolicyCreate, PolicyPhase, PolicyVariablesUpdate
+from polman.registry.main import PolmanRegistry
+from polman.watcher.prometheus_rule_engine import PrometheusRuleEngine
+from test.utils import get_registry_from_http_client, get_storage_from_http_client
+
+
+@pytest.fixture
+def rules_api(mocker):
+    """Mock the rules API, naming the rule files added rules-0.yml, rules-1.yml, ..."""
+    names = itertools.count()
+    add_rule_groups = mocker.patch.object(
+        PrometheusRuleEngine, "add_rule_groups", side_effect=lambda groups: f"rules-{next(names)}.yml")
+    delete_rule = mocker.patch.object(PrometheusRuleEngine, "delete_rule")
+    return add_rule_groups, delete_rule
+
+
+def _policies(policy_c1, n):
+    return [policy_c1 | {"name": f"policy-{i}"} for i in range(n)]
+
+
+def test_create_policies(test_http_client_mongo: TestClient, policy_c1, rules_api) -> None:
+    add_rule_groups, _ = rules_api
+    not_rendered = policy_c1 | {"name": "no-variables", "variables": {}}
+    not_valid = {"name": "no-spec"}
+
+    response = test_http_client_mongo.post(
+        "/polman/registry/api/v1/policies/batch", json=[*_policies(policy_c1, 2), not_rendered, not_valid])
+
+    assert response.status_code == 200
+    results = response.json()
+    assert [r["index"] for r in results] == [0, 1, 2, 3]
+    assert [r["policy"]["name"] for r in results[:2]] == ["policy-0", "policy-1"]
+    assert [r["error"] for r in results[:2]] == [None, None]
+    assert results[2]["policy"] is None and "maxCpu" in results[2]["error"]
+    assert results[3]["policy"] is None and results[3]["error"]
+
+    # the rules of the policies created are added with a single request
+    add_rule_groups.assert_called_once()
+    groups = add_rule_groups.call_args.args[0]
+    assert [g["name"] for g in groups] == [r["policy"]["id"] for r in results[:2]]
+    assert [g["rules"][0]["expr"] for g in groups] == [r["policy"]["status"]["renderedSpec"]["expr"] for r in results[:2]]
+
+    stored = get_storage_from_http_client(test_http_client_mongo).list()
+    assert sorted(p.name for p in stored) == ["policy-0", "policy-1"]
+    for p in stored:
+        assert p.status.phase == PolicyPhase.Enforced
+        assert p.status.measurementBackends["prom-1"]["rule_file"] == "rules-0.yml"
+        assert p.status.measurementBackends["prom-1"]["rule_group"] == p.id
+
+
+def test_create_policies_without_activation(test_http_client_mongo: TestClient, policy_c1, rules_api) -> None:
+    add_rule_groups, _ = rules_api
+
+    response = test_http_client_mongo.post(
+        "/polman/registry/api/v1/policies/batch?do_not_activate=true", json=_policies(policy_c1, 3))
+
+    assert response.status_code == 200
+    assert [r["policy"]["status"]["phase"] for r in response.json()] == [PolicyPhase.Inactive] * 3
+    add_rule_groups.assert_not_called()
+
+
+def test_create_policies_activation_error(test_registry: PolmanRegistry, policy_c1, mocker) -> None:
+    mocker.patch.object(PrometheusRuleEngine, "add_rule_groups", side_effect=ConnectionError("rules API down"))
+
+    results = test_registry.process_policies_create_request(_policies(policy_c1, 2))
+
+    # the policies are created, but left inactive
+    assert all(r.policy and r.policy.status.phase == PolicyPhase.Inactive for r in results)
+    assert all("rules API down" in r.error for r in results)
+    assert len(test_registry.list_all_policies()) == 2
+
+
+def test_deactivate_policy_with_shared_rule_file(test_http_client_mongo: TestClient, policy_c1, rules_api, mocker) -> None:
+    add_rule_groups, delete_rule = rules_api
+    replace_rule_groups = mocker.patch.object(PrometheusRuleEngine, "replace_rule_groups")
+    pr: PolmanRegistry = get_registry_from_http_client(test_http_client_mongo)
+    created = [pr.get_policy_by_id(r.policy.id) for r in pr.process_policies_create_request(_policies(policy_c1, 3))]
+
+    pr.deactivate_policy(created[0])
+
+    # the shared rule file is rewritten in place with the groups of the other policies
+    add_rule_groups.assert_called_once()
+    delete_rule.assert_not_called()
+    rule_file, groups = replace_rule_groups.call_args.args
+    assert rule_file == "rules-0.yml"
+    assert [g["name"] for g in groups] == [p.id for p in created[1:]]
+    assert pr.get_policy_by_id(created[0].id).status.measurementBackends == {}
+    for p in created[1:]:
+        assert pr.get_policy_by_id(p.id).status.measurementBackends["prom-1"]["rule_file"] == "rules-0.yml"
+
+    pr.delete_policies([pr.get_policy_by_id(p.id) for p in created[1:]])
+
+    # no policy is left watched: the rule file is deleted
+    add_rule_groups.assert_called_once()
+    replace_rule_groups.assert_called_once()
+    delete_rule.assert_called_once_with("rules-0.yml")
+    assert [p.id for p in pr.list_all_policies()] == [created[0].id]
+
+
+def test_discarded_deactivation_keeps_the_shared_rule_file(
+    test_http_client_mongo: TestClient, test_mongo_backend, policy_c1, rules_api, mocker
+) -> None:
+    add_rule_groups, delete_rule = rules_api
+    replace_rule_groups = mocker.patch.object(PrometheusRuleEngine, "replace_rule_groups")
+    pr: PolmanRegistry = get_registry_from_http_client(test_http_client_mongo)
+    ps = get_storage_from_http_client(test_http_client_mongo)
+    created = [pr.get_policy_by_id(r.policy.id) for r in pr.process_policies_create_request(_policies(policy_c1, 2))]
+
+    with pytest.raises(PolicyConflictError):
+        with ps.batch():
+            pr.deactivate_policy(ps.get(created[0].id))
+            # another replica changes the policy
+            test_mongo_backend.add_policy_event(created[0].id, PolicyEventsFactory.policy_resolved())
+
+    # the policy still references the rule file, that keeps its group
+    replace_rule_groups.assert_not_called()
+    delete_rule.assert_not_called()
+    assert pr.get_policy_by_id(created[0].id).status.measurementBackends["prom-1"]["rule_file"] == "rules-0.yml"
+
+
+def test_set_variable_with_shared_rule_file(test_http_client_mongo: TestClient, policy_c1, rules_api, mocker) -> None:
+    add_rule_groups, delete_rule = rules_api
+    replace_rule_groups = mocker.patch.object(PrometheusRuleEngine, "replace_rule_groups")
+    pr: PolmanRegistry = get_registry_from_http_client(test_http_client_mongo)
+    created = [pr.get_policy_by_id(r.policy.id) for r in pr.process_policies_create_request(_policies(policy_c1, 3))]
+
+    updated = pr.process_set_policy_variable(created[1], "maxCpu", 0.5)
+
+    # the shared rule file is rewritten in place, with the groups of all its policies
+    add_rule_groups.assert_called_once()
+    delete_rule.assert_not_called()
+    rule_file, groups = replace_rule_groups.call_args.args
+    assert rule_file == "rules-0.yml"
+    assert sorted(g["name"] for g in groups) == sorted(p.id for p in created)
+    exprs = {g["name"]: g["rules"][0]["expr"] for g in groups}
+    assert exprs[created[1].id] == updated.status.renderedSpec.expr
+    assert exprs[created[0].id] == created[0].status.renderedSpec.expr
+    assert updated.status.phase == PolicyPhase.Enforced
+    assert updated.status.measurementBackends["prom-1"]["rule_file"] == "rules-0.yml"
+
+
+# a valid id for mongodb, of no policy
+MISSING_ID = "0" * 24
+
+
+def _set_variables(client: TestClient, **update):
+    return client.post("/polman/registry/api/v1/policies/batch/variables", json=update)
+
+
+def test_set_variables_of_app_instance(test_http_client_mongo: TestClient, policy_c1, rules_api, mocker) -> None:
+    add_rule_groups, delete_rule = rules_api
+    replace_rule_groups = mocker.patch.object(PrometheusRuleEngine, "replace_rule_groups")
+    pr: PolmanRegistry = get_registry_from_http_client(test_http_client_mongo)
+    subject = {"appName": "app", "appInstance": "app-1", "appComponent": "component-1"}
+    app = [p | {"subject": subject} for p in _policies(policy_c1, 3)]
+    other = policy_c1 | {"subject": subject | {"appInstance": "app-2"}}
+    created = [r.policy for r in pr.process_policies_create_request(app)]
+    pr.process_policies_create_request([other])
+
+    response = _set_variables(test_http_client_mongo, appInstance="app-1", variables={"maxCpu": 0.5})
+
+    assert response.status_code == 200
+    results = response.json()
+    assert [r["policy"]["id"] for r in results] == [p.id for p in created]
+    assert [r["error"] for r in results] == [None] * 3
+    for r in results:
+        assert r["policy"]["variables"] == {"maxCpu": 0.5}
+        assert r["policy"]["status"]["renderedSpec"]["expr"].endswith("> 0.5")
+        assert r["policy"]["status"]["phase"] == PolicyPhase.Enforced
+        assert r["policy"]["status"]["measurementBackends"]["prom-1"]["rule_file"] == "rules-0.yml"
+
+    # the rules of the policies are replaced with a single request, in their rule file
+    assert add_rule_groups.call_count == 2
+    delete_rule.assert_not_called()
+    replace_rule_groups.assert_called_once()
+    rule_file, groups = replace_rule_groups.call_args.args
+    assert rule_file == "rules-0.yml"
+    assert [g["rules"][0]["expr"] for g in groups] == [r["policy"]["status"]["renderedSpec"]["expr"] for r in results]
+
+
+def test_set_variables_errors(test_http_client_mongo: TestClient, policy_c1, rules_api, mocker) -> None:
+    replace_rule_groups = mocker.patch.object(PrometheusRuleEngine, "replace_rule_groups")
+    pr: PolmanRegistry = get_registry_from_http_client(test_http_client_mongo)
+    created = [r.policy for r in pr.process_policies_create_request(_policies(policy_c1, 2))]
+
+    # a variable that the spec does not reference: the rules do not change
+    response = _set_variables(test_http_client_mongo, ids=[created[0].id, MISSING_ID], variables={"owner": "team-a"})
+
+    results = response.json()
+    assert results[0]["error"] is None and results[0]["policy"]["variables"] == {"maxCpu": 0.8, "owner": "team-a"}
+    assert results[1]["policy"] is None and MISSING_ID in results[1]["error"]
+    replace_rule_groups.assert_not_called()
+
+    # the policies that cannot be rendered are left unchanged
+    response = _set_variables(test_http_client_mongo, ids=[created[1].id], variables={"maxCpu": None})
+
+    results = response.json()
+    assert "maxCpu" in results[0]["error"]
+    assert results[0]["policy"]["variables"] == {"maxCpu": 0.8}
+    assert pr.get_policy_by_id(created[1].id).variables == {"maxCpu": 0.8}
+    replace_rule_groups.assert_not_called()
+
+    assert _set_variables(test_http_client_mongo, variables={"maxCpu": 0.5}).status_code == 422
+    assert _set_variables(
+        test_http_client_mongo, ids=[created[0].id], templateName="t", variables={"maxCpu": 0.5}).status_code == 422
+
+
+def test_set_variables_rules_not_replaced(test_registry: PolmanRegistry, policy_c1, rules_api, mocker) -> None:
+    mocker.patch.object(PrometheusRuleEngine, "replace_rule_groups", side_effect=Exception("rules API down"))
+    created = [r.policy for r in test_registry.process_policies_create_request(_policies(policy_c1, 2))]
+
+    results = test_registry.process_set_policies_variables(
+        PolicyVariablesUpdate(ids=[p.id for p in created], variables={"maxCpu": 0.5}))
+
+    # the policies stay consistent with the rules that are still in place
+    for p, r in zip(created, results):
+        assert "rules API down" in r.error
+        stored = test_registry.get_policy_by_id(p.id)
+        assert stored.variables == {"maxCpu": 0.8}
+        assert stored.status.renderedSpec == p.status.renderedSpec
+
+
+def test_set_variables_conflict(test_registry: PolmanRegistry, test_mongo_backend, policy_c1, rules_api, mocker) -> None:
+    # created one at a time: each policy has its own rule file
+    created = [test_registry.process_policy_create_request(PolicyCreate.model_validate(p)) for p in _policies(policy_c1, 2)]
+    pushed: dict[str, list[str]] = {}
+
+    def _replace(rule_file, groups):
+        pushed.setdefault(rule_file, []).append(groups[0]["rules"][0]["expr"])
+        if len(pushed) == 1:
+            # another replica changes the second policy while the first attempt runs
+            test_mongo_backend.add_policy_event(created[1].id, PolicyEventsFactory.policy_resolved())
+
+    mocker.patch.object(PrometheusRuleEngine, "replace_rule_groups", side_effect=_replace)
+
+    results = test_registry.process_set_policies_variables(
+        PolicyVariablesUpdate(ids=[p.id for p in created], variables={"maxCpu": 0.5}))
+
+    # the rules of the discarded attempt are restored, then pushed again by the retry
+    assert [r.error for r in results] == [None, None]
+    for p in created:
+        stored = test_registry.get_policy_by_id(p.id)
+        assert stored.variables == {"maxCpu": 0.5}
+        assert stored.status.renderedSpec.expr.endswith("> 0.5")
+        rule_file = stored.status.measurementBackends["prom-1"]["rule_file"]
+        assert pushed[rule_file] == [stored.status.renderedSpec.expr, p.status.renderedSpec.expr, stored.status.renderedSpec.expr]
@@ -18,8 +18,14 @@
 # and innovation programme under grant agreement No. 101070177.
 #
 
+import pytest
+
+from polman.common.errors import PolicyRenderingTestError
 from polman.common.model import PolicyCreate, PolicySpecTelemetry
-from polman.registry.render import render_policy_spec
+from polman.common.templating import compile_template, template_cache_info
+from polman.registry import render
+from polman.registry.render import expr_template_source, render_policy_spec
+from polman.registry.templates_catalog import POLICY_SPEC_TEMPLATES_CATALOG
 from pytest_mock import MockerFixture
 from polman.common.model import Policy, PolicyEventType, PolicyPhase, PolicySubjectApplication
 from polman.registry.main import PolmanRegistry
@@ -49,3 +55,35 @@ def test_policy_list(mocker: MockerFixture, test_registry: PolmanRegistry, polic
 def test_render_during_creation(policy_app_container_cpu_create: PolicyCreate) -> None:
     """Test rendering of app_container_cpu policy."""
     p = render_policy_spec(policy_app_container_cpu_create)
+
+
+def test_compiled_templates_are_cached(policy_3_create) -> None:
+    render_policy_spec(policy_3_create)
+    before = template_cache_info()
+
+    rendered = [render_policy_spec(policy_3_create) for _ in range(3)]
+
+    after = template_cache_info()
+    assert after["misses"] == before["misses"]
+    assert after["hits"] == before["hits"] + 3
+    assert len({r.expr for r in rendered}) == 1
+
+
+def test_catalog_templates_are_precompiled() -> None:
+    sources = [expr_template_source(spec) for spec in POLICY_SPEC_TEMPLATES_CATALOG.values()]
+    before = template_cache_info()
+
+    for source in sources:
+        compile_template(source)
+
+    assert template_cache_info()["misses"] == before["misses"]
+
+
+def test_spec_rendering_does_not_change_the_policy(policy_3_create) -> None:
+    variables = dict(policy_3_create.variables)
+    name = next(iter(variables))
+
+    with pytest.raises(PolicyRenderingTestError):
+        render.test_spec_rendering(policy_3_create, {name: None})
+
+    assert policy_3_create.variables == variables
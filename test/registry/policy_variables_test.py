@@ -22,6 +22,7 @@ from pytest_mock import MockerFixture
 
 from polman.common.model import PolicyEventType, PolicyPhase, PolicySpecTelemetry
 from polman.registry.main import PolmanRegistry
+from polman.registry.render import referenced_variables
 from polman.watcher.prometheus_rule_engine import PrometheusRuleEngine
 
 def test_policy_deactivated(test_registry: PolmanRegistry, policy_2_create):
@@ -56,6 +57,7 @@ def test_policy_active(mocker: MockerFixture, test_registry: PolmanRegistry, pol
 
   m1 = mocker.patch.object(PrometheusRuleEngine, "add_rule", return_value="test-rule.yml")
   m2 = mocker.patch.object(PrometheusRuleEngine, "delete_rule", return_value="test-rule.yml")
+  m3 = mocker.patch.object(PrometheusRuleEngine, "replace_rule_groups")
 
   # maxCpu: 0.8
 
@@ -75,16 +77,20 @@ def test_policy_active(mocker: MockerFixture, test_registry: PolmanRegistry, pol
   assert p1.status.renderedSpec.expr == renderedExpr_2
   assert p1.status.phase == PolicyPhase.Enforced
 
-  # check that the policy has been first deactivated, then rendered and finally reactivated
+  # the policy stays active: its rule file is rewritten in place
   assert [p.type for p in p1.status.events] == [
     PolicyEventType.Created,
     PolicyEventType.Rendered,
     PolicyEventType.Activated,
-    PolicyEventType.Deactivated,
     PolicyEventType.VariableSet,
     PolicyEventType.Rendered,
-    PolicyEventType.Activated
     ]
+  m1.assert_called_once()
+  m2.assert_not_called()
+  rule_file, groups = m3.call_args.args
+  assert rule_file == "test-rule.yml"
+  assert [g["rules"][0]["expr"] for g in groups] == [renderedExpr_2]
+  assert p1.status.measurementBackends["prom-1"]["rule_file"] == "test-rule.yml"
 
 
 def test_variable_set_events(test_registry: PolmanRegistry, policy_1_create):
@@ -95,17 +101,51 @@ def test_variable_set_events(test_registry: PolmanRegistry, policy_1_create):
   assert p1.status.events[-2].type == PolicyEventType.VariableSet
   assert p1.status.events[-2].details == {'name': 'maxCpu', 'newValue': 0.6, 'previousValue': 0.8}
 
+  # newVar is not referenced by the spec: the policy is not rendered again
   p1 = test_registry.process_set_policy_variable(p1, "newVar", "testVal")
-  assert p1.status.events[-2].type == PolicyEventType.VariableSet
-  assert p1.status.events[-2].details == {'name': "newVar", 'newValue': "testVal", 'previousValue': None}
+  assert p1.status.events[-1].type == PolicyEventType.VariableSet
+  assert p1.status.events[-1].details == {'name': "newVar", 'newValue': "testVal", 'previousValue': None}
   assert p1.variables["newVar"] == "testVal"
 
   p1 = test_registry.process_set_policy_variable(p1, "newVar", "newVAL")
-  assert p1.status.events[-2].type == PolicyEventType.VariableSet
-  assert p1.status.events[-2].details == {'name': "newVar", 'newValue': "newVAL", 'previousValue': "testVal"}
+  assert p1.status.events[-1].type == PolicyEventType.VariableSet
+  assert p1.status.events[-1].details == {'name': "newVar", 'newValue': "newVAL", 'previousValue': "testVal"}
   assert p1.variables["newVar"] == "newVAL"
 
   p1 = test_registry.process_set_policy_variable(p1, "newVar", None)
-  assert p1.status.events[-2].type == PolicyEventType.VariableSet
-  assert p1.status.events[-2].details == {'name': "newVar", 'newValue': None, 'previousValue': "newVAL"}
-  assert "newVar" not in p1.variables
\ No newline at end of file
+  assert p1.status.events[-1].type == PolicyEventType.VariableSet
+  assert p1.status.events[-1].details == {'name': "newVar", 'newValue': None, 'previousValue': "newVAL"}
+  assert "newVar" not in p1.variables
+
+
+def test_unreferenced_variable_keeps_the_rule(mocker: MockerFixture, test_registry: PolmanRegistry, policy_1_create):
+  add_rule = mocker.patch.object(PrometheusRuleEngine, "add_rule", return_value="test-rule.yml")
+  delete_rule = mocker.patch.object(PrometheusRuleEngine, "delete_rule")
+  replace_rule_groups = mocker.patch.object(PrometheusRuleEngine, "replace_rule_groups")
+  p1 = test_registry.process_policy_create_request(policy_1_create, activate_created_policy=True)
+  rendered = p1.status.renderedSpec
+
+  # a variable not referenced by the spec, and a referenced one set to the same value
+  p1 = test_registry.process_set_policy_variable(p1, "owner", "team-a")
+  p1 = test_registry.process_set_policy_variable(p1, "maxCpu", 0.8)
+
+  add_rule.assert_called_once()
+  delete_rule.assert_not_called()
+  replace_rule_groups.assert_not_called()
+  assert p1.status.phase == PolicyPhase.Enforced
+  assert p1.status.renderedSpec == rendered
+  assert p1.variables == {"maxCpu": 0.8, "owner": "team-a"}
+  assert [e.type for e in p1.status.events][-2:] == [PolicyEventType.VariableSet, PolicyEventType.VariableSet]
+
+  p1 = test_registry.process_set_policy_variable(p1, "maxCpu", 0.7)
+
+  add_rule.assert_called_once()
+  delete_rule.assert_not_called()
+  replace_rule_groups.assert_called_once()
+  assert p1.status.renderedSpec.expr.endswith("> 0.7")
+
+
+def test_referenced_variables(policy_1_create, policy_2_create):
+  assert referenced_variables(policy_1_create.spec) >= {"maxCpu", "subject_label_selector"}
+  assert referenced_variables(policy_2_create.spec) >= {"compssTask", "thresholdTimeSeconds"}
+  assert "owner" not in referenced_variables(policy_1_create.spec)
@@ -0,0 +1,78 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+# ruff: noqa: S101
+
+import asyncio
+
+from polman.common.events import PolicyEventsFactory
+from polman.common.model import PolicyEventType, PolicyPhase, PolicyStatus
+from polman.storage.backend.main import ThreadedAsyncPolmanStorage
+from polman.storage.backend.memory import AsyncInMemoryPolmanStorage
+from polman.storage.main import PolmanStorage
+
+
+def test_async_backends(test_storage_with_in_memory_backend: PolmanStorage, test_storage_with_mongo_backend: PolmanStorage) -> None:
+    assert isinstance(test_storage_with_in_memory_backend.aio._backend, AsyncInMemoryPolmanStorage)
+    # the mongo client given by the tests has no async counterpart
+    assert isinstance(test_storage_with_mongo_backend.aio._backend, ThreadedAsyncPolmanStorage)
+
+
+def test_async_storage_shares_the_data(test_storage_with_in_memory_backend: PolmanStorage, test_policy_factory) -> None:
+    ps = test_storage_with_in_memory_backend
+    p = ps.insert(test_policy_factory.build(status=PolicyStatus()))
+
+    async def update():
+        async with ps.aio.batch():
+            await ps.aio.set_policy_phase(p, PolicyPhase.Enforced)
+            await ps.aio.add_policy_event(p, PolicyEventsFactory.policy_activated())
+            assert (await ps.aio.get(p.id)).status.phase == PolicyPhase.Enforced
+            # not written yet
+            assert ps.get(p.id).status.phase == PolicyPhase.Unknown
+        return await ps.aio.list_summaries()
+
+    summaries = asyncio.run(update())
+
+    assert summaries[0].phase == PolicyPhase.Enforced
+    assert ps.get(p.id).status.phase == PolicyPhase.Enforced
+    assert [e.type for e in ps.list_events(p.id)] == [PolicyEventType.Activated]
+
+
+def test_async_units_of_work_are_per_task(test_storage_with_mongo_backend: PolmanStorage, test_policy_factory) -> None:
+    ps = test_storage_with_mongo_backend
+    p1 = ps.insert(test_policy_factory.build(status=PolicyStatus()))
+    p2 = ps.insert(test_policy_factory.build(status=PolicyStatus()))
+
+    async def resolve(p, other, barrier):
+        async with ps.aio.batch():
+            await ps.aio.set_policy_phase(p, PolicyPhase.Enforced)
+            await barrier.wait()
+            # the mutations buffered by the other task are not visible here
+            assert (await ps.aio.get(other.id)).status.phase == PolicyPhase.Unknown
+            await barrier.wait()
+
+    async def main():
+        barrier = asyncio.Barrier(2)
+        await asyncio.gather(resolve(p1, p2, barrier), resolve(p2, p1, barrier))
+
+    asyncio.run(main())
+
+    assert ps.get(p1.id).status.phase == PolicyPhase.Enforced
+    assert ps.get(p2.id).status.phase == PolicyPhase.Enforced
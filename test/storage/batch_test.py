@@ -0,0 +1,88 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+# ruff: noqa: S101
+
+import pytest
+
+from polman.common.errors import PolicyNotFoundError
+from polman.common.events import PolicyEventsFactory
+from polman.common.model import PolicyEventType, PolicyPhase, PolicyStatus
+from polman.registry.main import PolmanRegistry
+from polman.storage.backend.mongo import MongodbPolicyStore
+from polman.storage.main import PolmanStorage
+
+
+def test_reads_see_buffered_mutations(test_storage_with_mongo_backend: PolmanStorage, test_mongo_backend: MongodbPolicyStore, test_policy_factory) -> None:
+    ps = test_storage_with_mongo_backend
+    p = ps.insert(test_policy_factory.build(status=PolicyStatus(), variables={}))
+
+    with ps.batch():
+        ps.set_policy_phase(p, PolicyPhase.Enforced)
+        ps.update_variable(p, "a", 1)
+        ps.add_policy_event(p, PolicyEventsFactory.policy_activated())
+
+        working_copy = ps.get(p.id)
+        assert working_copy.status.phase == PolicyPhase.Enforced
+        assert working_copy.variables == {"a": 1}
+        assert working_copy.status.events[-1].type == PolicyEventType.Activated
+        # nothing written yet
+        assert test_mongo_backend.get(p.id).status.phase == PolicyPhase.Unknown
+
+    stored = test_mongo_backend.get(p.id)
+    assert stored.status.phase == PolicyPhase.Enforced
+    assert stored.variables == {"a": 1}
+    assert [e.type for e in test_mongo_backend.list_events(p.id)] == [PolicyEventType.Activated]
+
+
+def test_mutations_of_a_policy_written_once(test_registry: PolmanRegistry, test_mongo_backend: MongodbPolicyStore, policy_1_create, mocker) -> None:
+    update = mocker.spy(test_mongo_backend, "_update_policies")
+
+    p = test_registry.process_policy_create_request(policy_1_create, activate_created_policy=False)
+
+    update.assert_called_once()
+    assert list(update.call_args.args[0]) == [p.id]
+    assert p.status.phase == PolicyPhase.Inactive
+    assert p.status.renderedSpec is not None
+    assert [e.type for e in p.status.events] == [PolicyEventType.Created, PolicyEventType.Rendered]
+
+
+def test_mutations_written_on_error(test_storage_with_in_memory_backend: PolmanStorage, test_policy_factory) -> None:
+    ps = test_storage_with_in_memory_backend
+    p = ps.insert(test_policy_factory.build(status=PolicyStatus()))
+
+    with pytest.raises(RuntimeError), ps.batch():
+        ps.set_policy_phase(p, PolicyPhase.Inactive)
+        raise RuntimeError
+
+    assert ps.get(p.id).status.phase == PolicyPhase.Inactive
+
+
+def test_delete_in_batch(test_storage_with_mongo_backend: PolmanStorage, test_policy_factory) -> None:
+    ps = test_storage_with_mongo_backend
+    p = ps.insert(test_policy_factory.build(status=PolicyStatus()))
+
+    with ps.batch():
+        ps.add_policy_event(p, PolicyEventsFactory.policy_deactivated())
+        ps.delete(p.id)
+        with pytest.raises(PolicyNotFoundError):
+            ps.get(p.id)
+
+    assert ps.list() == []
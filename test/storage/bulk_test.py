@@ -0,0 +1,170 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+# ruff: noqa: S101
+
+
+import pytest
+
+from polman.common.errors import PolicyConflictError, PolicyNotFoundError
+from polman.common.events import PolicyEventsFactory
+from polman.common.model import (
+    PolicyActionWebhook, PolicyCreate, PolicyEventType, PolicyPhase, PolicySpecTelemetry, PolicyStatus, PolicySubjectApplication,
+)
+from polman.meter.main import PolmanMeter
+from polman.registry.main import PolmanRegistry
+from polman.storage.backend.file import FilePolmanStorage
+from polman.storage.backend.mongo import MongodbPolicyStore
+from polman.storage.backend.sqlite import SqlitePolmanStorage
+from polman.storage.main import PolmanStorage
+from polman.watcher.prometheus_rule_engine import PrometheusRuleEngine
+
+
+@pytest.fixture(params=["inmemory", "file", "mongodb", "sqlite"])
+def backend(request, test_in_memory_backend, test_mongo_backend, test_file_db_config, test_sqlite_db_config):
+    if request.param == "file":
+        return FilePolmanStorage(test_file_db_config())
+    if request.param == "sqlite":
+        return SqlitePolmanStorage(test_sqlite_db_config())
+    return test_in_memory_backend if request.param == "inmemory" else test_mongo_backend
+
+
+def test_bulk_primitives(backend, test_policy_factory) -> None:
+    ids = [backend.insert(test_policy_factory.build(status=PolicyStatus())).id for _ in range(4)]
+    event = PolicyEventsFactory.policy_activated()
+
+    backend.set_phase_many(ids[:3], PolicyPhase.Enforced)
+    backend.add_event_many(ids[:3], event)
+    backend.update_measurement_backend_many("prom-1", {pid: {"rule_file": f"{pid}.yml"} for pid in ids[:3]})
+
+    for pid in ids[:3]:
+        p = backend.get(pid)
+        assert p.status.phase == PolicyPhase.Enforced
+        assert [e.type for e in p.status.events] == [PolicyEventType.Activated]
+        assert p.status.measurementBackends == {"prom-1": {"rule_file": f"{pid}.yml"}}
+    assert backend.get(ids[3]).status.phase == PolicyPhase.Unknown
+
+    deleted = backend.delete_many(ids[:2])
+    assert [p.id for p in deleted] == ids[:2]
+    assert sorted(p.id for p in backend.list()) == sorted(ids[2:])
+
+    with pytest.raises(PolicyNotFoundError):
+        backend.set_phase_many([ids[2], ids[0]], PolicyPhase.Inactive)
+
+
+def test_buffered_inserts(backend, test_config, test_policy_factory) -> None:
+    ps = PolmanStorage(test_config, PolmanMeter(), backend=backend)
+    existing = ps.insert(test_policy_factory.build(status=PolicyStatus(), version=0))
+
+    with pytest.raises(PolicyConflictError):
+        with ps.batch():
+            created = ps.insert_many([test_policy_factory.build(status=PolicyStatus()) for _ in range(2)])
+            ps.add_event_many(created, PolicyEventsFactory.policy_created())
+            ps.set_policy_phase(ps.get(existing.id), PolicyPhase.Enforced)
+            # another replica changes the policy read
+            backend.set_policy_phase(existing.id, PolicyPhase.Inactive)
+
+    # the new policies are not written either
+    assert [p.id for p in backend.list()] == [existing.id]
+
+    with ps.batch():
+        created = ps.insert_many([test_policy_factory.build(status=PolicyStatus()) for _ in range(2)])
+        ps.add_event_many(created, PolicyEventsFactory.policy_created())
+        ps.set_phase_many(created, PolicyPhase.Inactive)
+
+    for p in created:
+        stored = backend.get(p.id)
+        assert stored.status.phase == PolicyPhase.Inactive
+        assert stored.status.createdAt is not None
+        assert [e.type for e in backend.list_events(p.id)] == [PolicyEventType.Created]
+
+
+def test_file_backend_flushes_once(test_file_db_config, test_policy_factory, mocker) -> None:
+    backend = FilePolmanStorage(test_file_db_config())
+    ids = [backend.insert(test_policy_factory.build(status=PolicyStatus())).id for _ in range(10)]
+    write = mocker.spy(backend, "_write_to_file")
+
+    backend.set_phase_many(ids, PolicyPhase.Enforced)
+    backend.add_event_many(ids, PolicyEventsFactory.policy_activated())
+
+    assert write.call_count == 2
+    assert [p.status.phase for p in FilePolmanStorage(test_file_db_config()).list()] == [PolicyPhase.Enforced] * 10
+
+
+def test_app_lifecycle_round_trips(test_registry: PolmanRegistry, test_mongo_backend: MongodbPolicyStore, mocker) -> None:
+    mocker.patch.object(PrometheusRuleEngine, "add_rule", return_value="test-rule.yml")
+    mocker.patch.object(PrometheusRuleEngine, "delete_rule")
+    for i in range(50):
+        test_registry.process_policy_create_request(PolicyCreate(
+            name=f"policy-{i}",
+            subject=PolicySubjectApplication(appName="a", appInstance="app-1", appComponent=f"c{i}"),
+            spec=PolicySpecTelemetry(expr="up", violatedIf="> 1"),
+            action=PolicyActionWebhook(url="http://localhost/", httpMethod="POST"),
+        ), activate_created_policy=False)
+
+    policies = test_registry.find_policies(filters={"subject.type": "app", "subject.appInstance": "app-1"})
+    get = mocker.spy(test_mongo_backend, "get")
+    update = mocker.spy(test_mongo_backend, "_update_policies")
+
+    activated = test_registry.activate_policies(policies)
+
+    # the policies already read are not read again, and are written with one bulk write
+    assert get.call_count == 0
+    update.assert_called_once()
+    assert all(p.status.phase == PolicyPhase.Enforced for p in activated)
+    stored = test_mongo_backend.get(policies[0].id)
+    assert stored.status.events[-1].type == PolicyEventType.Activated
+    assert stored.status.measurementBackends["prom-1"]["rule_file"] == "test-rule.yml"
+
+    get.reset_mock()
+    update.reset_mock()
+    deleted = test_registry.delete_policies(test_registry.find_policies(filters={"subject.appInstance": "app-1"}))
+
+    assert get.call_count == 0
+    assert update.call_count == 1
+    assert all(p.status.phase == PolicyPhase.Inactive for p in deleted)
+    assert test_mongo_backend.list() == []
+
+
+def test_batch_create_round_trips(
+    test_registry: PolmanRegistry, test_mongo_backend: MongodbPolicyStore, mocker
+) -> None:
+    mocker.patch.object(PrometheusRuleEngine, "add_rule_groups", return_value="rules-0.yml")
+    insert = mocker.spy(test_mongo_backend, "insert")
+    apply = mocker.spy(test_mongo_backend, "apply")
+    collection = test_mongo_backend._MongodbPolicyStore__policies_repo.get_collection()
+    insert_many = mocker.spy(type(collection), "insert_many")
+
+    results = test_registry.process_policies_create_request([PolicyCreate(
+        name=f"policy-{i}",
+        subject=PolicySubjectApplication(appName="a", appInstance="app-1", appComponent=f"c{i}"),
+        spec=PolicySpecTelemetry(expr="up", violatedIf="> 1"),
+        action=PolicyActionWebhook(url="http://localhost/", httpMethod="POST"),
+    ) for i in range(50)])
+
+    # the policies are inserted with all their changes, with one write
+    insert.assert_not_called()
+    apply.assert_called_once()
+    assert [c.args[0].name for c in insert_many.call_args_list].count(collection.name) == 1
+    assert all(r.policy.status.phase == PolicyPhase.Enforced for r in results)
+    stored = test_mongo_backend.get(results[0].policy.id)
+    assert [e.type for e in test_mongo_backend.list_events(stored.id)] == [
+        PolicyEventType.Created, PolicyEventType.Rendered, PolicyEventType.Activated]
+    assert stored.status.measurementBackends["prom-1"]["rule_file"] == "rules-0.yml"
@@ -0,0 +1,105 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+# ruff: noqa: S101
+
+
+import asyncio
+
+import mongomock
+import pytest
+
+from polman.common.config import DBConfig, PolmanConfig
+from polman.common.errors import PolicyNotFoundError
+from polman.common.model import PolicyPhase, PolicyStatus
+from polman.meter.main import PolmanMeter
+from polman.storage.backend.mongo import MongodbPolicyStore
+from polman.storage.main import PolmanStorage
+
+
+def _replicas(client, count: int = 2, cache_size: int = 10) -> list[PolmanStorage]:
+    """Build storages with a cache sharing the same database, like replicas of the service."""
+    config = PolmanConfig(db=DBConfig(cache_size=cache_size))
+    return [
+        PolmanStorage(config, PolmanMeter(), backend=MongodbPolicyStore(config, mongo_db_client=client, mongo_db_database_name="test"))
+        for _ in range(count)
+    ]
+
+
+def test_version_is_incremented(test_mongo_backend: MongodbPolicyStore, test_in_memory_backend, test_policy_factory) -> None:
+    for backend in (test_mongo_backend, test_in_memory_backend):
+        p = backend.insert(test_policy_factory.build(status=PolicyStatus(), version=0))
+        assert backend.get_version(p.id) == 0
+
+        backend.set_policy_phase(p.id, PolicyPhase.Enforced)
+        backend.set_variable(p.id, "a", 1)
+        assert backend.get_version(p.id) == 2
+        assert backend.get(p.id).version == 2
+
+
+def test_cache_hits_and_local_invalidation(test_policy_factory, mocker) -> None:
+    (ps,) = _replicas(mongomock.MongoClient(), count=1)
+    hit = mocker.spy(ps._pm, "add_cache_hit")
+    miss = mocker.spy(ps._pm, "add_cache_miss")
+    p = ps.insert(test_policy_factory.build(status=PolicyStatus(), version=0))
+
+    first = ps.get(p.id)
+    assert ps.get(p.id) is first
+    assert (miss.call_count, hit.call_count) == (1, 1)
+
+    ps.set_policy_phase(first, PolicyPhase.Enforced)
+    assert ps.get(p.id).status.phase == PolicyPhase.Enforced
+    assert miss.call_count == 2
+
+    ps.delete(p.id)
+    with pytest.raises(PolicyNotFoundError):
+        ps.get(p.id)
+
+
+def test_cache_is_revalidated_across_replicas(test_policy_factory) -> None:
+    ps_1, ps_2 = _replicas(mongomock.MongoClient())
+    p = ps_1.insert(test_policy_factory.build(status=PolicyStatus(), version=0))
+    assert ps_1.get(p.id).status.phase == PolicyPhase.Unknown
+
+    with ps_2.batch():
+        ps_2.set_policy_phase(ps_2.get(p.id), PolicyPhase.Enforced)
+    assert ps_1.get(p.id).status.phase == PolicyPhase.Enforced
+
+    asyncio.run(ps_2.aio.update_variable(p, "a", 1))
+    assert asyncio.run(ps_1.aio.get(p.id)).variables["a"] == 1
+
+    ps_2.delete(p.id)
+    with pytest.raises(PolicyNotFoundError):
+        ps_1.get(p.id)
+
+
+def test_cache_evicts_least_recently_used(test_policy_factory, mocker) -> None:
+    (ps,) = _replicas(mongomock.MongoClient(), count=1, cache_size=2)
+    eviction = mocker.spy(ps._pm, "add_cache_eviction")
+    ids = [ps.insert(test_policy_factory.build(status=PolicyStatus(), version=0)).id for _ in range(3)]
+
+    ps.get(ids[0])
+    ps.get(ids[1])
+    ps.get(ids[0])
+    ps.get(ids[2])
+
+    assert eviction.call_count == 1
+    assert ids[1] not in ps._cache
+    assert ids[0] in ps._cache and ids[2] in ps._cache
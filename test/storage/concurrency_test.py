@@ -0,0 +1,232 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+# ruff: noqa: S101
+
+
+import datetime
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from polman.common.config import DBConfig
+from polman.common.errors import PolicyConflictError
+from polman.common.events import PolicyEventsFactory
+from polman.common.model import PolicyEventType, PolicyPhase, PolicyStatus
+from polman.enforcer.main import PolmanEnforcer
+from polman.meter.main import PolmanMeter
+from polman.registry.main import PolmanRegistry
+from polman.storage.backend.sqlite import SqlitePolmanStorage
+from polman.storage.main import PolmanStorage
+from polman.watcher.main import PolmanWatcher
+from polman.watcher.model import AlertmanagerAlert
+from polman.watcher.prometheus_rule_engine import PrometheusRuleEngine
+
+
+@pytest.fixture(params=["inmemory", "mongodb", "sqlite"])
+def backend(request, test_in_memory_backend, test_mongo_backend, test_sqlite_db_config):
+    if request.param == "sqlite":
+        return SqlitePolmanStorage(test_sqlite_db_config())
+    return test_in_memory_backend if request.param == "inmemory" else test_mongo_backend
+
+
+def _concurrently(fn, *args) -> None:
+    """Run a change of another replica, with its own connection to the backend."""
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        executor.submit(fn, *args).result()
+
+
+def test_conflicting_write_is_discarded(backend, test_config, test_policy_factory) -> None:
+    ps = PolmanStorage(test_config, PolmanMeter(), backend=backend)
+    p = ps.insert(test_policy_factory.build(status=PolicyStatus(), version=0))
+    discarded = []
+
+    with pytest.raises(PolicyConflictError):
+        with ps.batch():
+            ps.on_conflict(lambda: discarded.append(p.id))
+            ps.set_policy_phase(ps.get(p.id), PolicyPhase.Violated)
+            # another replica changes the policy after it has been read
+            _concurrently(backend.set_policy_phase, p.id, PolicyPhase.Inactive)
+
+    assert discarded == [p.id]
+    assert backend.get(p.id).status.phase == PolicyPhase.Inactive
+
+
+def test_conflict_discards_the_whole_batch(backend, test_config, test_policy_factory) -> None:
+    ps = PolmanStorage(test_config, PolmanMeter(), backend=backend)
+    a, b = (ps.insert(test_policy_factory.build(status=PolicyStatus(), variables={}, version=0)) for _ in range(2))
+
+    with pytest.raises(PolicyConflictError) as ex:
+        with ps.batch():
+            for p in (ps.get(a.id), ps.get(b.id)):
+                ps.update_variable(p, "x", 5)
+                ps.add_policy_event(p, PolicyEventsFactory.variable_set("x", None, 5))
+            # another replica changes only the second policy
+            _concurrently(backend.set_policy_phase, b.id, PolicyPhase.Inactive)
+
+    # the changes of the first policy are not written either, and only the second is reported
+    assert str(ex.value) == b.id
+    stored = backend.get(a.id)
+    assert stored.variables == {}
+    assert stored.status.events == []
+    assert ps.list_events(a.id) == []
+
+
+def test_run_with_retries(backend, test_config, test_policy_factory) -> None:
+    ps = PolmanStorage(test_config, PolmanMeter(), backend=backend)
+    p = ps.insert(test_policy_factory.build(status=PolicyStatus(), version=0))
+    calls = itertools.count()
+
+    def _violate():
+        policy = ps.get(p.id)
+        if next(calls) == 0:
+            _concurrently(backend.add_policy_event, p.id, PolicyEventsFactory.policy_resolved())
+        ps.add_policy_event(policy, PolicyEventsFactory.policy_rendering_error(policy.spec, "test"))
+        ps.set_policy_phase(policy, PolicyPhase.Violated)
+
+    ps.run_with_retries(_violate)
+
+    stored = backend.get(p.id)
+    assert next(calls) == 2
+    assert [e.type for e in stored.status.events] == [PolicyEventType.Resolved, PolicyEventType.RenderingError]
+    assert stored.status.phase == PolicyPhase.Violated
+
+
+# mongomock does not apply the updates of a document atomically across threads
+@pytest.mark.parametrize("backend", ["inmemory", "sqlite"], indirect=True)
+def test_concurrent_alerts_and_variable_updates(backend, test_config, policy_1_create, mocker) -> None:
+    # every request updates the same policy: allow enough retries for all of them
+    test_config.db = DBConfig(conflict_retries=100)
+    ps = PolmanStorage(test_config, PolmanMeter(), backend=backend)
+    watcher = PolmanWatcher(test_config, ps, PolmanEnforcer(test_config))
+    registry = PolmanRegistry(test_config, ps, watcher)
+
+    rules: set[str] = set()
+    names = itertools.count()
+    lock = threading.Lock()
+
+    def _add_rule(*args, **kwargs):
+        with lock:
+            name = f"rule-{next(names)}.yml"
+            rules.add(name)
+            return name
+
+    def _delete_rule(name):
+        with lock:
+            rules.discard(name)
+
+    mocker.patch.object(PrometheusRuleEngine, "add_rule", side_effect=_add_rule)
+    mocker.patch.object(PrometheusRuleEngine, "delete_rule", side_effect=_delete_rule)
+    mocker.patch.object(PrometheusRuleEngine, "replace_rule_groups")
+    mocker.patch.object(PolmanEnforcer, "execute_violation_action")
+
+    p = registry.process_policy_create_request(policy_1_create, activate_created_policy=True)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    alert = AlertmanagerAlert(
+        status="firing",
+        labels={"alertname": "test", "icos_host_id": "host-1", "icos_agent_id": "icos-agent-1"},
+        annotations={"plm_id": p.id, "plm_measurement_backend": "prom-1", "plm_expr_value": "0.9"},
+        startsAt=now, endsAt=now, generatorURL="http://localhost/")
+    updates = 20
+
+    def _update(i):
+        registry.process_set_policy_variable(p, "maxCpu", 0.5 + i / 100)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [executor.submit(_update, i) for i in range(updates)]
+        futures += [executor.submit(watcher.process_alertmanager_alert, alert) for _ in range(updates)]
+        for f in futures:
+            f.result()
+
+    stored = backend.get(p.id)
+    types = [e.type for e in ps.list_events(p.id, limit=1000)]
+    # no update is lost, and exactly one rule is left: the one of the policy
+    assert types.count(PolicyEventType.VariableSet) == updates
+    assert types.count(PolicyEventType.Violated) == updates
+    assert rules == {stored.status.measurementBackends["prom-1"]["rule_file"]}
+    assert stored.variables["maxCpu"] in {0.5 + i / 100 for i in range(updates)}
+
+
+def test_discarded_bulk_deactivation_keeps_the_rules(backend, test_config, policy_1_create, mocker) -> None:
+    ps = PolmanStorage(test_config, PolmanMeter(), backend=backend)
+    registry = PolmanRegistry(test_config, ps, PolmanWatcher(test_config, ps, PolmanEnforcer(test_config)))
+    names = itertools.count()
+    mocker.patch.object(PrometheusRuleEngine, "add_rule", side_effect=lambda *args, **kwargs: f"rule-{next(names)}.yml")
+    delete_rule = mocker.patch.object(PrometheusRuleEngine, "delete_rule")
+    created = [registry.process_policy_create_request(policy_1_create) for _ in range(2)]
+
+    with pytest.raises(PolicyConflictError):
+        with ps.batch():
+            registry.deactivate_policies([ps.get(p.id) for p in created])
+            # another replica changes one of the policies
+            _concurrently(backend.set_policy_phase, created[1].id, PolicyPhase.Violated)
+
+    # the policies are still active: their rules are not deleted
+    delete_rule.assert_not_called()
+    rule_files = [backend.get(p.id).status.measurementBackends["prom-1"]["rule_file"] for p in created]
+    assert rule_files == ["rule-0.yml", "rule-1.yml"]
+
+    registry.deactivate_policies([ps.get(p.id) for p in created])
+
+    assert sorted(c.args[0] for c in delete_rule.call_args_list) == ["rule-0.yml", "rule-1.yml"]
+
+
+def test_bulk_activation_of_stale_policies_is_retried(backend, test_config, policy_1_create, mocker) -> None:
+    ps = PolmanStorage(test_config, PolmanMeter(), backend=backend)
+    registry = PolmanRegistry(test_config, ps, PolmanWatcher(test_config, ps, PolmanEnforcer(test_config)))
+    names = itertools.count()
+    add_rule = mocker.patch.object(
+        PrometheusRuleEngine, "add_rule", side_effect=lambda *args, **kwargs: f"rule-{next(names)}.yml")
+    delete_rule = mocker.patch.object(PrometheusRuleEngine, "delete_rule")
+    p = registry.process_policy_create_request(policy_1_create, activate_created_policy=False)
+
+    # the app is started with the policies read before a concurrent variable update
+    stale = registry.find_policies()
+    registry.process_set_policy_variable(ps.get(p.id), "maxCpu", 0.7)
+    registry.activate_policies(stale)
+
+    # the activation is run again on the policy read again: its rule has the new expression
+    stored = backend.get(p.id)
+    assert add_rule.call_count == 2
+    assert add_rule.call_args.kwargs["expression"] == stored.status.renderedSpec.expr
+    assert add_rule.call_args_list[0].kwargs["expression"] != stored.status.renderedSpec.expr
+    delete_rule.assert_called_once_with("rule-0.yml")
+    assert stored.status.measurementBackends["prom-1"]["rule_file"] == "rule-1.yml"
+    assert stored.status.phase == PolicyPhase.Enforced
+    assert stored.variables["maxCpu"] == 0.7
+
+
+def test_bulk_deletion_of_stale_policies_is_retried(backend, test_config, policy_1_create, mocker) -> None:
+    ps = PolmanStorage(test_config, PolmanMeter(), backend=backend)
+    registry = PolmanRegistry(test_config, ps, PolmanWatcher(test_config, ps, PolmanEnforcer(test_config)))
+    mocker.patch.object(PrometheusRuleEngine, "add_rule", return_value="rule-0.yml")
+    delete_rule = mocker.patch.object(PrometheusRuleEngine, "delete_rule")
+    p = registry.process_policy_create_request(policy_1_create, activate_created_policy=False)
+
+    # the app is deleted with the policies read before they are activated
+    stale = registry.find_policies()
+    registry.activate_policy(ps.get(p.id))
+    registry.delete_policies(stale)
+
+    # the rule of the activation is not left behind
+    delete_rule.assert_called_once_with("rule-0.yml")
+    assert backend.list() == []
@@ -0,0 +1,280 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+# ruff: noqa: S101
+
+import json
+import os
+import sys
+
+import pytest
+
+from polman.common.config import SnapshotFormat
+from polman.common.errors import PolmanError
+from polman.common.events import PolicyEventsFactory
+from polman.common.model import Policy, PolicyEventType, PolicyPhase, PolicyStatus
+from polman.meter.main import PolmanMeter
+from polman.registry.main import PolmanRegistry
+from polman.storage.backend.file import JOURNAL_SUFFIX, FilePolmanStorage
+from polman.storage.backend.snapshot import MAGIC
+from polman.storage.main import PolmanStorage
+
+
+def test_plain_file_persistence(test_file_db_config, test_policy_factory) -> None:
+    config = test_file_db_config()
+    backend = FilePolmanStorage(config)
+    p = backend.insert(test_policy_factory.build(status=PolicyStatus()))
+    backend.set_policy_phase(p.id, PolicyPhase.Enforced)
+
+    assert not os.path.exists(config.db.url + JOURNAL_SUFFIX)
+
+    reloaded = FilePolmanStorage(config)
+    assert reloaded.get(p.id).status.phase == PolicyPhase.Enforced
+
+
+def test_journal_replay(test_file_db_config, test_policy_factory) -> None:
+    config = test_file_db_config(file_journal=True)
+    backend = FilePolmanStorage(config)
+
+    p1 = backend.insert(test_policy_factory.build(status=PolicyStatus(), variables={"a": 1}))
+    p2 = backend.insert(test_policy_factory.build(status=PolicyStatus()))
+    backend.add_policy_event(p1.id, PolicyEventsFactory.policy_created())
+    backend.set_policy_phase(p1.id, PolicyPhase.Violated)
+    backend.set_variable(p1.id, "a", None)
+    backend.set_variable(p1.id, "b", "x")
+    backend.update_measurement_backend(p1.id, "prom-1", {"rule_file": "r.yml"})
+    backend.set_rendered_spec(p1.id, p1.spec)
+    backend.delete(p2.id)
+
+    # the snapshot has not been rewritten...
+    with open(config.db.url) as f:
+        assert json.load(f) == []
+
+    # ... but the state is rebuilt from the journal
+    reloaded = FilePolmanStorage(config)
+    assert [p.id for p in reloaded.list()] == [p1.id]
+    p = reloaded.get(p1.id)
+    assert [e.type for e in p.status.events] == [PolicyEventType.Created]
+    assert p.status.phase == PolicyPhase.Violated
+    assert p.variables == {"b": "x"}
+    assert p.status.measurementBackends == {"prom-1": {"rule_file": "r.yml"}}
+    assert p.status.renderedSpec == p1.spec
+
+
+def test_journal_truncated_tail(test_file_db_config, test_policy_factory) -> None:
+    config = test_file_db_config(file_journal=True)
+    backend = FilePolmanStorage(config)
+    p = backend.insert(test_policy_factory.build(status=PolicyStatus()))
+    backend.set_policy_phase(p.id, PolicyPhase.Enforced)
+    backend.set_policy_phase(p.id, PolicyPhase.Violated)
+
+    # simulate a crash in the middle of the last append
+    journal = config.db.url + JOURNAL_SUFFIX
+    with open(journal, "rb+") as f:
+        f.truncate(os.path.getsize(journal) - 10)
+
+    reloaded = FilePolmanStorage(config)
+    assert reloaded.get(p.id).status.phase == PolicyPhase.Enforced
+
+    # the torn record has been dropped and new records are readable again
+    reloaded.set_policy_phase(p.id, PolicyPhase.Inactive)
+    assert FilePolmanStorage(config).get(p.id).status.phase == PolicyPhase.Inactive
+
+
+def test_journal_only_header_truncated(test_file_db_config) -> None:
+    config = test_file_db_config(file_journal=True)
+    FilePolmanStorage(config)
+
+    with open(config.db.url + JOURNAL_SUFFIX, "rb+") as f:
+        f.truncate(5)
+
+    assert FilePolmanStorage(config).list() == []
+
+
+def test_journal_compaction(test_file_db_config, test_policy_factory) -> None:
+    config = test_file_db_config(file_journal=True, file_journal_max_size=1)
+    backend = FilePolmanStorage(config)
+    p = backend.insert(test_policy_factory.build(status=PolicyStatus()))
+
+    # the compaction started in background by the insert
+    backend._compaction_thread.join()
+
+    with open(config.db.url) as f:
+        assert [o["id"] for o in json.load(f)] == [p.id]
+    with open(config.db.url + JOURNAL_SUFFIX) as f:
+        assert len(f.readlines()) == 1
+
+    assert FilePolmanStorage(config).get(p.id).id == p.id
+
+
+def test_stale_journal_is_discarded(test_file_db_config, test_policy_factory) -> None:
+    config = test_file_db_config(file_journal=True)
+    backend = FilePolmanStorage(config)
+    p = backend.insert(test_policy_factory.build(status=PolicyStatus()))
+    backend.add_policy_event(p.id, PolicyEventsFactory.policy_created())
+
+    journal = config.db.url + JOURNAL_SUFFIX
+    with open(journal, "rb") as f:
+        old_journal = f.read()
+
+    # simulate a crash after the new snapshot is in place but before the journal is reset
+    backend.compact()
+    with open(journal, "wb") as f:
+        f.write(old_journal)
+
+    p = FilePolmanStorage(config).get(p.id)
+    assert [e.type for e in p.status.events] == [PolicyEventType.Created]
+
+
+def test_batch_writes_once(test_file_db_config, test_policy_factory, mocker) -> None:
+    config = test_file_db_config()
+    backend = FilePolmanStorage(config)
+    spy = mocker.spy(backend, "_write_to_file")
+
+    with backend.batch():
+        p = backend.insert(test_policy_factory.build(status=PolicyStatus()))
+        with backend.batch():
+            backend.add_policy_event(p.id, PolicyEventsFactory.policy_created())
+            backend.set_policy_phase(p.id, PolicyPhase.Inactive)
+        backend.set_variable(p.id, "a", 1)
+        assert spy.call_count == 0
+
+    assert spy.call_count == 1
+    assert not os.path.exists(config.db.url + ".tmp")
+    assert FilePolmanStorage(config).get(p.id).variables["a"] == 1
+
+
+def test_registry_create_writes_once(test_file_db_config, policy_1_create, test_watcher, mocker) -> None:
+    backend = FilePolmanStorage(test_file_db_config())
+    storage = PolmanStorage(test_file_db_config(), PolmanMeter(), backend=backend)
+    registry = PolmanRegistry(test_file_db_config(), storage, test_watcher)
+    spy = mocker.spy(backend, "_write_to_file")
+
+    registry.process_policy_create_request(policy_1_create, activate_created_policy=False)
+
+    assert spy.call_count == 1
+
+
+def test_write_behind(test_file_db_config, test_policy_factory) -> None:
+    config = test_file_db_config(file_flush_interval=3600)
+    backend = FilePolmanStorage(config)
+    p = backend.insert(test_policy_factory.build(status=PolicyStatus()))
+    backend.set_policy_phase(p.id, PolicyPhase.Enforced)
+
+    # nothing written until the next flush
+    assert FilePolmanStorage(test_file_db_config()).list() == []
+
+    backend.flush()
+    assert FilePolmanStorage(test_file_db_config()).get(p.id).status.phase == PolicyPhase.Enforced
+
+
+def test_event_history_persistence(test_file_db_config, test_policy_factory) -> None:
+    config = test_file_db_config(events_inline=1)
+    backend = FilePolmanStorage(config)
+    p = backend.insert(test_policy_factory.build(status=PolicyStatus()))
+    backend.add_policy_event(p.id, PolicyEventsFactory.policy_created())
+    backend.add_policy_event(p.id, PolicyEventsFactory.policy_activated())
+
+    # the whole history is stored in the snapshot...
+    with open(config.db.url) as infile:
+        assert len(json.load(infile)[0]["status"]["events"]) == 2
+
+    # ...but only the last event is kept inline when it is loaded
+    reloaded = FilePolmanStorage(config)
+    assert [e.type for e in reloaded.get(p.id).status.events] == [PolicyEventType.Activated]
+    assert [e.type for e in reloaded.list_events(p.id)] == [PolicyEventType.Created, PolicyEventType.Activated]
+
+
+def test_snapshot_migration(test_file_db_config, test_policy_factory) -> None:
+    backend = FilePolmanStorage(test_file_db_config())
+    p = backend.insert(test_policy_factory.build(status=PolicyStatus()))
+    backend.add_policy_event(p.id, PolicyEventsFactory.policy_created())
+
+    # a json snapshot is rewritten in the configured format at startup
+    config = test_file_db_config(file_format=SnapshotFormat.ORJSON, file_journal=True)
+    migrated = FilePolmanStorage(config)
+    with open(config.db.url, "rb") as f:
+        assert f.readline() == MAGIC + b'{"format": "orjson", "compression": null}\n'
+    assert migrated.get(p.id) == backend.get(p.id)
+
+    # and back
+    reloaded = FilePolmanStorage(test_file_db_config())
+    assert [e.type for e in reloaded.get(p.id).status.events] == [PolicyEventType.Created]
+    with open(config.db.url, "rb") as f:
+        assert json.load(f)[0]["id"] == p.id
+
+
+@pytest.mark.parametrize("zstd", [False, True])
+@pytest.mark.parametrize("fmt", list(SnapshotFormat))
+def test_snapshot_encodings(test_file_db_config, test_policy_factory, fmt, zstd) -> None:
+    config = test_file_db_config(file_format=fmt, file_zstd=zstd)
+    p = FilePolmanStorage(config).insert(test_policy_factory.build(status=PolicyStatus()))
+
+    assert FilePolmanStorage(config).get(p.id).name == p.name
+
+
+def test_missing_snapshot_encoding(test_file_db_config, mocker) -> None:
+    mocker.patch.dict(sys.modules, {"msgpack": None})
+    with pytest.raises(PolmanError):
+        FilePolmanStorage(test_file_db_config(file_format=SnapshotFormat.MSGPACK))
+
+
+def test_lazy_loading(test_file_db_config, test_policy_factory, mocker) -> None:
+    config = test_file_db_config()
+    backend = FilePolmanStorage(config)
+    p1 = backend.insert(test_policy_factory.build(status=PolicyStatus(), version=0))
+    p2 = backend.insert(test_policy_factory.build(status=PolicyStatus(), version=0))
+    backend.add_policy_event(p1.id, PolicyEventsFactory.policy_created())
+    backend.set_policy_phase(p2.id, PolicyPhase.Enforced)
+
+    validate = mocker.spy(Policy, "model_validate")
+    reloaded = FilePolmanStorage(config)
+
+    # filters and summaries do not validate the policies...
+    assert [s.id for s in reloaded.list_summaries({"status.phase": PolicyPhase.Enforced})] == [p2.id]
+    assert reloaded.list_summaries({"id": p1.id})[0].creationTime == backend.get(p1.id).status.createdAt
+    assert validate.call_count == 0
+
+    # ...which are validated once, when first accessed
+    assert reloaded.get(p1.id) == backend.get(p1.id)
+    assert reloaded.get(p1.id) is reloaded.get(p1.id)
+    assert validate.call_count == 1
+
+    # the policies never accessed are written back as they were
+    reloaded.set_variable(p1.id, "a", 1)
+    assert FilePolmanStorage(config).list() == [reloaded.get(p1.id), backend.get(p2.id)]
+
+
+def test_startup_meter_from_summaries(test_file_db_config, test_policy_factory, mocker) -> None:
+    config = test_file_db_config()
+    backend = FilePolmanStorage(config)
+    p = backend.insert(test_policy_factory.build(status=PolicyStatus(phase=PolicyPhase.Enforced), version=0))
+
+    meter = PolmanMeter()
+    meter.set_policy_enforced(p)
+    expected = meter._policy_enforced_status_cache[p.id]
+
+    validate = mocker.spy(Policy, "model_validate")
+    meter = PolmanMeter()
+    for s in PolmanStorage(config, meter, backend=FilePolmanStorage(config)).list_summaries():
+        meter.set_summary_enforced(s)
+
+    assert meter._policy_enforced_status_cache == {p.id: expected}
+    assert validate.call_count == 0
@@ -0,0 +1,193 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+# ruff: noqa: S101
+
+import datetime
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from pydantic import ValidationError
+
+from polman.common.config import DBConfig, PolmanConfig
+from polman.common.errors import PolicyNotFoundError
+from polman.common.events import PolicyEventsFactory
+from polman.common.model import PolicyEventType, PolicyPhase, PolicyStatus, PolicySubjectApplication, PolicySubjectHost
+from polman.storage.backend.memory import InMemoryPolmanStorage
+
+
+def _add_policies(backend: InMemoryPolmanStorage, test_policy_factory):
+    app_1 = [backend.insert(test_policy_factory.build(
+        subject=PolicySubjectApplication(appName="a", appInstance="app-1", appComponent=f"c{i}"),
+        status=PolicyStatus())) for i in range(3)]
+    app_2 = [backend.insert(test_policy_factory.build(
+        subject=PolicySubjectApplication(appName="a", appInstance="app-2", appComponent="c0"),
+        status=PolicyStatus()))]
+    host = [backend.insert(test_policy_factory.build(
+        subject=PolicySubjectHost(hostId="h", agentId="ag"), status=PolicyStatus()))]
+    return app_1, app_2, host
+
+
+def test_filter_by_app(test_in_memory_backend: InMemoryPolmanStorage, test_policy_factory) -> None:
+    app_1, app_2, host = _add_policies(test_in_memory_backend, test_policy_factory)
+
+    assert len(test_in_memory_backend.list()) == 5
+    assert test_in_memory_backend.list({"subject.type": "app", "subject.appInstance": "app-1"}) == app_1
+    assert test_in_memory_backend.list({"subject.type": "app"}) == app_1 + app_2
+    assert test_in_memory_backend.list({"subject.type": "host"}) == host
+    assert test_in_memory_backend.list({"subject.type": "app", "subject.appInstance": "app-3"}) == []
+    assert test_in_memory_backend.list({"name": app_2[0].name}) == app_2
+
+    # not indexed fields are evaluated on the candidates
+    assert test_in_memory_backend.list({"subject.appInstance": "app-1", "subject.appComponent": "c1"}) == [app_1[1]]
+    assert test_in_memory_backend.list({"subject.appComponent": "c0"}) == [app_1[0], app_2[0]]
+
+
+def test_filter_by_phase(test_in_memory_backend: InMemoryPolmanStorage, test_policy_factory) -> None:
+    app_1, app_2, host = _add_policies(test_in_memory_backend, test_policy_factory)
+
+    test_in_memory_backend.set_policy_phase(app_1[0].id, PolicyPhase.Enforced)
+    test_in_memory_backend.set_policy_phase(host[0].id, PolicyPhase.Enforced)
+
+    assert test_in_memory_backend.list({"status.phase": PolicyPhase.Enforced}) == [app_1[0], host[0]]
+    assert test_in_memory_backend.list({"status.phase": "enforced", "subject.type": "app"}) == [app_1[0]]
+
+    test_in_memory_backend.set_policy_phase(app_1[0].id, PolicyPhase.Violated)
+    assert test_in_memory_backend.list({"status.phase": "enforced"}) == [host[0]]
+    assert test_in_memory_backend.list({"status.phase": "violated"}) == [app_1[0]]
+
+
+def test_indexes_on_delete(test_in_memory_backend: InMemoryPolmanStorage, test_policy_factory) -> None:
+    app_1, app_2, host = _add_policies(test_in_memory_backend, test_policy_factory)
+
+    test_in_memory_backend.delete(app_2[0].id)
+    assert test_in_memory_backend.list({"subject.appInstance": "app-2"}) == []
+    assert test_in_memory_backend.list({"subject.type": "app"}) == app_1
+
+
+def test_delete_unknown_policy(test_in_memory_backend: InMemoryPolmanStorage) -> None:
+    with pytest.raises(PolicyNotFoundError):
+        test_in_memory_backend.delete("missing")
+
+
+def test_concurrent_list_and_writes(test_in_memory_backend: InMemoryPolmanStorage, test_policy_factory) -> None:
+    backend = test_in_memory_backend
+    app_1, _, _ = _add_policies(backend, test_policy_factory)
+    policies = [test_policy_factory.build(
+        subject=PolicySubjectApplication(appName="a", appInstance="app-1", appComponent="c0"),
+        status=PolicyStatus()) for _ in range(200)]
+    # switch threads often, to interleave the reads with the writes
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+
+    def _write(p):
+        backend.insert(p)
+        backend.set_policy_phase(p.id, PolicyPhase.Enforced)
+        backend.delete(p.id)
+
+    def _list(_):
+        listed = backend.list({"subject.appInstance": "app-1", "subject.appComponent": "c1"})
+        summaries = backend.list_summaries({"subject.type": "app", "status.phase": PolicyPhase.Unknown})
+        return listed, summaries
+
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            writes = [executor.submit(_write, p) for p in policies]
+            lists = [executor.submit(_list, i) for i in range(300)]
+            for f in writes:
+                f.result()
+            results = [f.result() for f in lists]
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert all(listed == [app_1[1]] for listed, _ in results)
+    assert backend.list({"subject.type": "app"}) == app_1 + backend.list({"subject.appInstance": "app-2"})
+
+
+def test_list_summaries(test_in_memory_backend: InMemoryPolmanStorage, test_policy_factory) -> None:
+    app_1, app_2, host = _add_policies(test_in_memory_backend, test_policy_factory)
+    test_in_memory_backend.add_policy_event(app_2[0].id, PolicyEventsFactory.policy_created())
+
+    summaries = test_in_memory_backend.list_summaries({"subject.appInstance": "app-2"})
+
+    assert [s.id for s in summaries] == [app_2[0].id]
+    assert summaries[0].subject == app_2[0].subject
+    assert summaries[0].phase == PolicyPhase.Unknown
+    assert summaries[0].creationTime == app_2[0].status.events[0].timestamp
+    assert test_in_memory_backend.list_summaries({"subject.type": "host"})[0].creationTime is None
+
+
+def test_bounded_event_history(test_policy_factory) -> None:
+    backend = InMemoryPolmanStorage(PolmanConfig(db=DBConfig(events_max_count=5, events_inline=2)))
+    p = backend.insert(test_policy_factory.build(status=PolicyStatus()))
+
+    created = PolicyEventsFactory.policy_created()
+    backend.add_policy_event(p.id, created)
+    for _ in range(9):
+        backend.add_policy_event(p.id, PolicyEventsFactory.policy_resolved())
+
+    history = backend.list_events(p.id)
+    assert len(history) == 5
+    assert backend.get(p.id).status.events == history[-2:]
+    # the creation time survives the creation event
+    assert backend.get(p.id).status.createdAt == created.timestamp
+    assert backend.list_events(p.id, skip=3, limit=10) == history[3:]
+
+
+def test_event_history_settings_are_validated() -> None:
+    with pytest.raises(ValidationError):
+        DBConfig(events_max_count=0)
+    with pytest.raises(ValidationError):
+        DBConfig(events_inline=-1)
+    with pytest.raises(ValidationError):
+        DBConfig(events_max_age=-1)
+
+
+def test_event_history_max_age(test_policy_factory) -> None:
+    backend = InMemoryPolmanStorage(PolmanConfig(db=DBConfig(events_max_age=3600)))
+    old = PolicyEventsFactory.policy_created()
+    old.timestamp -= datetime.timedelta(hours=2)
+    p = backend.insert(test_policy_factory.build(status=PolicyStatus(events=[old])))
+
+    # the creation time of policies stored without it is taken from the first event
+    assert p.status.createdAt == old.timestamp
+
+    backend.add_policy_event(p.id, PolicyEventsFactory.policy_activated())
+    assert [e.type for e in backend.list_events(p.id)] == [PolicyEventType.Activated]
+
+
+def test_copy_is_not_affected_by_writes(test_in_memory_backend: InMemoryPolmanStorage, test_policy_factory) -> None:
+    p = test_in_memory_backend.insert(test_policy_factory.build(status=PolicyStatus(), variables={"a": 1}, version=0))
+    test_in_memory_backend.update_measurement_backend(p.id, "prom-1", {"rule_file": "r.yml"})
+    copy = test_in_memory_backend.get_copy(p.id)
+
+    test_in_memory_backend.add_policy_event(p.id, PolicyEventsFactory.policy_created())
+    test_in_memory_backend.set_policy_phase(p.id, PolicyPhase.Enforced)
+    test_in_memory_backend.set_variable(p.id, "a", None)
+    test_in_memory_backend.delete_measurement_backend(p.id, "prom-1")
+    test_in_memory_backend.set_rendered_spec(p.id, p.spec)
+
+    assert copy.version == 1
+    assert copy.variables == {"a": 1}
+    assert copy.status.measurementBackends == {"prom-1": {"rule_file": "r.yml"}}
+    assert copy.status.events == []
+    assert copy.status.phase == PolicyPhase.Unknown
+    assert copy.status.renderedSpec is None
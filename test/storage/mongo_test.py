@@ -18,9 +18,13 @@
 # and innovation programme under grant agreement No. 101070177.
 #
 
+import mongomock
 import pytest
+from polman.common.config import DBConfig, PolmanConfig
 from polman.common.errors import PolicyNotFoundError
-from polman.storage.backend.mongo import MongodbPolicyStore
+from polman.common.events import PolicyEventsFactory
+from polman.common.model import PolicyEventType, PolicyPhase, PolicyStatus
+from polman.storage.backend.mongo import POLICY_INDEXES, MongodbPolicyStore, merge_updates, winning_plan_stages
 from polman.storage.main import PolmanStorage
 
 
@@ -37,3 +41,135 @@ def test_fix_exception_on_not_existent_policy(test_storage_with_mongo_backend: P
 
     with pytest.raises(PolicyNotFoundError):
         test_storage_with_mongo_backend.get(not_existing_id)
+
+
+def test_atomic_updates_do_not_overwrite_concurrent_changes(test_mongo_backend: MongodbPolicyStore, test_policy_factory) -> None:
+    """Test that mutations are applied server side without re-saving stale documents."""
+    p = test_mongo_backend.insert(test_policy_factory.build(variables={"a": 1}, status=PolicyStatus()))
+
+    # two "writers" that read the same version of the policy
+    stale_1 = test_mongo_backend.get(p.id)
+    stale_2 = test_mongo_backend.get(p.id)
+
+    test_mongo_backend.add_policy_event(stale_1.id, PolicyEventsFactory.policy_created())
+    test_mongo_backend.add_policy_event(stale_2.id, PolicyEventsFactory.policy_rendered(p.spec))
+    test_mongo_backend.set_policy_phase(stale_1.id, PolicyPhase.Enforced)
+    test_mongo_backend.set_variable(stale_2.id, "b", 2)
+    test_mongo_backend.update_measurement_backend(stale_1.id, "prom-1", {"rule_file": "r.yml"})
+
+    p = test_mongo_backend.get(p.id)
+    assert [e.type for e in p.status.events[-2:]] == [PolicyEventType.Created, PolicyEventType.Rendered]
+    assert p.status.phase == PolicyPhase.Enforced
+    assert p.variables == {"a": 1, "b": 2}
+    assert p.status.measurementBackends == {"prom-1": {"rule_file": "r.yml"}}
+
+    test_mongo_backend.set_variable(p.id, "a", None)
+    test_mongo_backend.delete_measurement_backend(p.id, "prom-1")
+
+    p = test_mongo_backend.get(p.id)
+    assert p.variables == {"b": 2}
+    assert p.status.measurementBackends == {}
+
+
+def test_update_not_existent_policy(test_mongo_backend: MongodbPolicyStore) -> None:
+    """Test that mutations on a missing policy raise PolicyNotFoundError."""
+    with pytest.raises(PolicyNotFoundError):
+        test_mongo_backend.set_policy_phase("66d9db7791f3ffbf23d95a42", PolicyPhase.Enforced)
+
+
+def test_indexes_created(test_mongo_backend: MongodbPolicyStore) -> None:
+    """Test that the indexes for the known query shapes are created at startup."""
+    indexes = test_mongo_backend._MongodbPolicyStore__policies_repo.get_collection().index_information()
+
+    assert {idx.document["name"] for idx in POLICY_INDEXES} <= set(indexes)
+
+
+def test_winning_plan_stages() -> None:
+    explain = {"queryPlanner": {"winningPlan": {
+        "stage": "FETCH",
+        "inputStage": {"stage": "IXSCAN", "indexName": "subject_app_instance"},
+    }}}
+    assert winning_plan_stages(explain) == ["FETCH", "IXSCAN(subject_app_instance)"]
+
+    explain = {"queryPlanner": {"winningPlan": {"queryPlan": {"stage": "COLLSCAN"}}}}
+    assert winning_plan_stages(explain) == ["COLLSCAN"]
+
+
+def test_list_summaries(test_mongo_backend: MongodbPolicyStore, test_policy_factory) -> None:
+    """Test that summaries report the projected fields of the policies."""
+    created = PolicyEventsFactory.policy_created()
+    p = test_mongo_backend.insert(test_policy_factory.build(status=PolicyStatus(events=[created])))
+    test_mongo_backend.add_policy_event(p.id, PolicyEventsFactory.policy_rendered(p.spec))
+    test_mongo_backend.set_policy_phase(p.id, PolicyPhase.Enforced)
+    test_mongo_backend.insert(test_policy_factory.build(status=PolicyStatus()))
+
+    summaries = test_mongo_backend.list_summaries({"name": p.name})
+
+    assert len(summaries) == 1
+    assert summaries[0].id == p.id
+    assert summaries[0].subject == p.subject
+    assert summaries[0].phase == PolicyPhase.Enforced
+    # mongodb stores datetimes with millisecond precision
+    assert abs(summaries[0].creationTime - created.timestamp).total_seconds() < 0.001
+    assert len(test_mongo_backend.list_summaries()) == 2
+
+
+def _mongo_backend(**db) -> MongodbPolicyStore:
+    return MongodbPolicyStore(
+        PolmanConfig(db=DBConfig(**db)), mongo_db_client=mongomock.MongoClient(), mongo_db_database_name="test")
+
+
+def test_bounded_event_history(test_policy_factory) -> None:
+    """Test that the history is stored in its own collection and trimmed."""
+    backend = _mongo_backend(events_max_count=5, events_inline=2, events_max_age=3600)
+    p = backend.insert(test_policy_factory.build(status=PolicyStatus()))
+    other = backend.insert(test_policy_factory.build(status=PolicyStatus()))
+
+    backend.add_policy_event(p.id, PolicyEventsFactory.policy_created())
+    for _ in range(9):
+        backend.add_policy_event(p.id, PolicyEventsFactory.policy_resolved())
+    backend.add_policy_event(other.id, PolicyEventsFactory.policy_created())
+
+    history = backend.list_events(p.id)
+    assert len(history) == 5
+    assert backend.get(p.id).status.events == history[-2:]
+    assert backend.list_events(p.id, skip=4) == history[4:]
+    assert backend._MongodbPolicyStore__events.index_information()["ttl"]["expireAfterSeconds"] == 3600
+
+    backend.delete(p.id)
+    assert backend._MongodbPolicyStore__events.count_documents({}) == 1
+    with pytest.raises(PolicyNotFoundError):
+        backend.list_events(p.id)
+
+
+def test_inline_events_migration(test_policy_factory) -> None:
+    """Test that the events of policies stored by previous versions are moved apart."""
+    client = mongomock.MongoClient()
+    events = [PolicyEventsFactory.policy_created(), PolicyEventsFactory.policy_activated()]
+    doc = test_policy_factory.build(status=PolicyStatus(events=events)).model_dump(exclude={"id"})
+    del doc["status"]["createdAt"]
+    pid = str(client["test"]["policies"].insert_one(doc).inserted_id)
+
+    backend = MongodbPolicyStore(
+        PolmanConfig(db=DBConfig(events_inline=1)), mongo_db_client=client, mongo_db_database_name="test")
+
+    p = backend.get(pid)
+    assert [e.type for e in p.status.events] == [PolicyEventType.Activated]
+    assert abs(p.status.createdAt - events[0].timestamp).total_seconds() < 0.001
+    assert [e.type for e in backend.list_events(pid)] == [PolicyEventType.Created, PolicyEventType.Activated]
+
+
+def test_merge_updates() -> None:
+    merged = merge_updates([
+        {"$push": {"status.events": {"$each": [1], "$slice": -10}}, "$set": {"status.createdAt": 0}},
+        {"$set": {"status.phase": "inactive"}},
+        {"$unset": {"variables.a": ""}},
+        {"$push": {"status.events": {"$each": [2], "$slice": -10}}},
+        {"$set": {"status.phase": "enforced", "variables.a": 1}},
+        {"$unset": {"status.createdAt": ""}},
+    ])
+    assert merged == {
+        "$set": {"status.phase": "enforced", "variables.a": 1},
+        "$unset": {"status.createdAt": ""},
+        "$push": {"status.events": {"$each": [1, 2], "$slice": -10}},
+    }
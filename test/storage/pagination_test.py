@@ -0,0 +1,131 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+# ruff: noqa: S101
+
+
+import datetime
+
+import pytest
+from bson import ObjectId
+
+from polman.common.model import PolicyStatus
+from polman.meter.main import PolmanMeter
+from polman.storage.backend.main import Page, Prefix, page_cursor, page_from_cursor
+from polman.storage.backend.sqlite import SqlitePolmanStorage
+from polman.storage.main import PolmanStorage
+
+
+@pytest.fixture(params=["inmemory", "mongodb", "sqlite"])
+def backend(request, test_in_memory_backend, test_mongo_backend, test_sqlite_db_config):
+    if request.param == "sqlite":
+        return SqlitePolmanStorage(test_sqlite_db_config())
+    return test_in_memory_backend if request.param == "inmemory" else test_mongo_backend
+
+
+@pytest.fixture
+def policy_ids(backend, test_policy_factory) -> list[str]:
+    """Insert policies with repeated and missing creation times, returning their ids sorted by creation time."""
+    start = datetime.datetime(2024, 1, 1)
+    policies = []
+    for i in range(23):
+        created_at = None if i % 5 == 0 else start + datetime.timedelta(seconds=i // 3)
+        # mongodb needs object ids, that sort like their hex strings
+        p = test_policy_factory.build(id=str(ObjectId()), status=PolicyStatus(createdAt=created_at), version=0)
+        policies.append(backend.insert(p))
+    key = lambda p: (p.status.createdAt is not None, p.status.createdAt, p.id)  # noqa: E731
+    return [p.id for p in sorted(policies, key=key)]
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_pages(backend, policy_ids, descending) -> None:
+    expected = list(reversed(policy_ids)) if descending else policy_ids
+    page = Page(limit=7, descending=descending)
+    ids, summary_ids = [], []
+    while True:
+        policies = backend.list_page(page=page)
+        summaries = backend.list_summaries_page(page=page)
+        ids += [p.id for p in policies]
+        summary_ids += [s.id for s in summaries]
+        if len(policies) < page.limit:
+            break
+        # the cursor round trip is what the API does between two pages
+        page = page_from_cursor(page_cursor(page, summaries[-1]), page.limit)
+
+    assert ids == expected
+    assert summary_ids == expected
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_page_without_limit(backend, policy_ids, descending) -> None:
+    expected = list(reversed(policy_ids)) if descending else policy_ids
+    page = Page(limit=None, descending=descending)
+
+    summaries = backend.list_summaries_page(page=page)
+
+    assert [p.id for p in backend.list_page(page=page)] == expected
+    assert [s.id for s in summaries] == expected
+    page = page_from_cursor(page_cursor(page, summaries[8]), None)
+    assert [s.id for s in backend.list_summaries_page(page=page)] == expected[9:]
+
+
+def test_pages_with_filters(backend, policy_ids) -> None:
+    name = backend.get(policy_ids[3]).name
+    assert [p.id for p in backend.list_page(filters={"name": name}, page=Page(limit=5))] == [policy_ids[3]]
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_pages_sorted_by_name(backend, policy_ids, descending) -> None:
+    names = sorted(((backend.get(pid).name, pid) for pid in policy_ids), reverse=descending)
+    page = Page(limit=5, sort_by="name", descending=descending)
+    ids = []
+    while True:
+        summaries = backend.list_summaries_page(page=page)
+        ids += [s.id for s in summaries]
+        if len(summaries) < page.limit:
+            break
+        page = page_from_cursor(page_cursor(page, summaries[-1]), page.limit)
+
+    assert ids == [pid for _, pid in names]
+
+
+def test_prefix_filters(backend, test_policy_factory) -> None:
+    for name in ["web-1", "web-2", "db-1", "web"]:
+        backend.insert(test_policy_factory.build(id=str(ObjectId()), name=name, status=PolicyStatus(), version=0))
+    by_prefix = {"name": Prefix("web-")}
+
+    assert sorted(p.name for p in backend.list(filters=by_prefix)) == ["web-1", "web-2"]
+    assert sorted(s.name for s in backend.list_summaries(filters=by_prefix)) == ["web-1", "web-2"]
+    assert [p.name for p in backend.list_page(filters=by_prefix, page=Page(sort_by="name", descending=True))] == ["web-2", "web-1"]
+    assert [p.name for p in backend.list(filters={"name": Prefix("web-1"), "status.phase": "unknown"})] == ["web-1"]
+    assert backend.list(filters={"name": Prefix("w.b")}) == []
+
+
+def test_iter_policies(backend, policy_ids, test_config) -> None:
+    ps = PolmanStorage(test_config, PolmanMeter(), backend=backend)
+
+    assert [p.id for p in ps.iter_policies(page=Page(limit=4))] == policy_ids
+    assert [s.id for s in ps.iter_policies(page=Page(limit=23), summaries=True)] == policy_ids
+    assert [p.id for p in ps.iter_policies(page=Page(limit=None))] == policy_ids
+
+
+def test_invalid_cursor() -> None:
+    with pytest.raises(ValueError):
+        page_from_cursor("not-a-cursor", 10)
@@ -0,0 +1,176 @@
+#
+# ICOS Dynamic Policy Manager
+# Copyright © 2022 - 2025 Engineering Ingegneria Informatica S.p.A.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+# http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# This work has received funding from the European Union's HORIZON research
+# and innovation programme under grant agreement No. 101070177.
+#
+
+
+# ruff: noqa: S101
+
+import datetime
+import threading
+
+import pytest
+
+from polman.common.errors import PolicyNotFoundError
+from polman.common.events import PolicyEventsFactory
+from polman.common.model import PolicyEventType, PolicyPhase, PolicyStatus, PolicySubjectApplication, PolicySubjectHost
+from polman.meter.main import PolmanMeter
+from polman.registry.main import PolmanRegistry
+from polman.storage.backend.main import Mutation
+from polman.storage.backend.sqlite import SqlitePolmanStorage
+from polman.storage.main import PolmanStorage
+
+
+def _add_policies(backend: SqlitePolmanStorage, test_policy_factory):
+    app_1 = [backend.insert(test_policy_factory.build(
+        subject=PolicySubjectApplication(appName="a", appInstance="app-1", appComponent=f"c{i}"),
+        status=PolicyStatus(), version=0)) for i in range(3)]
+    app_2 = [backend.insert(test_policy_factory.build(
+        subject=PolicySubjectApplication(appName="a", appInstance="app-2", appComponent="c0"),
+        status=PolicyStatus(), version=0))]
+    host = [backend.insert(test_policy_factory.build(
+        subject=PolicySubjectHost(hostId="h", agentId="ag"), status=PolicyStatus(), version=0))]
+    return app_1, app_2, host
+
+
+def test_filters(test_sqlite_backend: SqlitePolmanStorage, test_policy_factory) -> None:
+    app_1, app_2, host = _add_policies(test_sqlite_backend, test_policy_factory)
+    test_sqlite_backend.set_policy_phase(host[0].id, PolicyPhase.Enforced)
+
+    assert len(test_sqlite_backend.list()) == 5
+    assert test_sqlite_backend.list({"subject.type": "app", "subject.appInstance": "app-1"}) == app_1
+    assert test_sqlite_backend.list({"subject.appComponent": "c0"}) == [app_1[0], app_2[0]]
+    assert test_sqlite_backend.list({"name": app_2[0].name}) == app_2
+    assert [p.id for p in test_sqlite_backend.list({"status.phase": PolicyPhase.Enforced})] == [host[0].id]
+    # not a column: evaluated on the json document
+    assert test_sqlite_backend.list({"action.url": app_1[1].action.url}) == [app_1[1]]
+
+    summaries = test_sqlite_backend.list_summaries({"subject.type": "host"})
+    assert [(s.id, s.subject, s.phase) for s in summaries] == [(host[0].id, host[0].subject, PolicyPhase.Enforced)]
+
+
+def test_mutations_and_persistence(test_sqlite_db_config, test_policy_factory) -> None:
+    config = test_sqlite_db_config()
+    backend = SqlitePolmanStorage(config)
+    p = backend.insert(test_policy_factory.build(status=PolicyStatus(), variables={"a": 1}, version=0))
+    created = PolicyEventsFactory.policy_created()
+
+    backend.add_policy_event(p.id, created)
+    backend.set_policy_phase(p.id, PolicyPhase.Violated)
+    backend.set_variable(p.id, "a", None)
+    backend.set_variable(p.id, "b-c", "x")
+    backend.update_measurement_backend(p.id, "prom-1", {"rule_file": "r.yml"})
+    backend.update_measurement_backend(p.id, "prom-2", {"rule_file": "s.yml"})
+    backend.delete_measurement_backend(p.id, "prom-2")
+    backend.set_rendered_spec(p.id, p.spec)
+
+    p = SqlitePolmanStorage(config).get(p.id)
+    assert p.status.events == [created]
+    assert p.status.createdAt == created.timestamp
+    assert p.status.phase == PolicyPhase.Violated
+    assert p.variables == {"b-c": "x"}
+    assert p.status.measurementBackends == {"prom-1": {"rule_file": "r.yml"}}
+    assert p.status.renderedSpec == p.spec
+    assert p.version == 8
+
+    with pytest.raises(PolicyNotFoundError):
+        backend.set_policy_phase("missing", PolicyPhase.Enforced)
+
+    backend.delete(p.id)
+    assert backend.list() == []
+    with pytest.raises(PolicyNotFoundError):
+        backend.list_events(p.id)
+
+
+def test_bounded_event_history(test_sqlite_db_config, test_policy_factory) -> None:
+    backend = SqlitePolmanStorage(test_sqlite_db_config(events_max_count=5, events_inline=2, events_max_age=3600))
+    old = PolicyEventsFactory.policy_created()
+    old.timestamp -= datetime.timedelta(hours=2)
+    p = backend.insert(test_policy_factory.build(status=PolicyStatus(events=[old])))
+    assert backend.get(p.id).status.createdAt == old.timestamp
+    assert backend.list_events(p.id) == []
+
+    for _ in range(9):
+        backend.add_policy_event(p.id, PolicyEventsFactory.policy_resolved())
+
+    history = backend.list_events(p.id)
+    assert len(history) == 5
+    assert backend.get(p.id).status.events == history[-2:]
+    assert backend.list_events(p.id, skip=3, limit=10) == history[3:]
+
+
+def test_batch_is_one_transaction(test_sqlite_backend: SqlitePolmanStorage, test_policy_factory) -> None:
+    p = test_sqlite_backend.insert(test_policy_factory.build(status=PolicyStatus()))
+
+    def read_phase(res: list):
+        res.append(test_sqlite_backend.get(p.id).status.phase)
+
+    with test_sqlite_backend.batch():
+        test_sqlite_backend.set_policy_phase(p.id, PolicyPhase.Enforced)
+        test_sqlite_backend.add_policy_event(p.id, PolicyEventsFactory.policy_activated())
+
+        # other connections do not see the uncommitted changes
+        res: list = []
+        t = threading.Thread(target=read_phase, args=(res,))
+        t.start()
+        t.join()
+        assert res == [PolicyPhase.Unknown]
+
+    assert test_sqlite_backend.get(p.id).status.phase == PolicyPhase.Enforced
+
+
+def test_failed_batch_is_rolled_back(test_sqlite_backend: SqlitePolmanStorage, test_policy_factory) -> None:
+    p = test_sqlite_backend.insert(test_policy_factory.build(status=PolicyStatus(), version=0))
+
+    with pytest.raises(PolicyNotFoundError):
+        test_sqlite_backend.apply(
+            [Mutation("set_policy_phase", pid, (PolicyPhase.Enforced,)) for pid in (p.id, "missing")],
+            {p.id: 0},
+        )
+
+    stored = test_sqlite_backend.get(p.id)
+    assert stored.status.phase == PolicyPhase.Unknown
+    assert stored.version == 0
+
+
+def test_storage_batch_writes_the_mutations_before_an_error(
+    test_config, test_sqlite_backend, test_policy_factory
+) -> None:
+    ps = PolmanStorage(test_config, PolmanMeter(), backend=test_sqlite_backend)
+    p = ps.insert(test_policy_factory.build(status=PolicyStatus(), version=0))
+
+    # as with the other backends, the changes made before the error are written
+    with pytest.raises(RuntimeError):
+        with ps.batch():
+            ps.set_policy_phase(ps.get(p.id), PolicyPhase.Enforced)
+            raise RuntimeError("test")
+
+    assert test_sqlite_backend.get(p.id).status.phase == PolicyPhase.Enforced
+
+
+def test_registry_with_sqlite(test_config, test_sqlite_db_config, test_watcher, policy_1_create) -> None:
+    ps = PolmanStorage(test_sqlite_db_config(), PolmanMeter())
+    registry = PolmanRegistry(test_config, ps, test_watcher)
+
+    p = registry.process_policy_create_request(policy_1_create, activate_created_policy=False)
+
+    stored = ps.get(p.id)
+    assert stored.status.events[0].type == PolicyEventType.Created
+    assert stored.status.phase == PolicyPhase.Inactive
+    assert stored.status.renderedSpec is not None
+    assert [s.id for s in registry.find_policy_summaries()] == [p.id]